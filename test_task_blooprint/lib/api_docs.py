@@ -0,0 +1,82 @@
+"""
+The Swagger annotations used by the views, without importing drf_yasg.
+
+Most workers never serve the schema, so no drf_yasg module is imported for
+the views' sake: `swagger_auto_schema` only records its arguments, and
+`openapi.Parameter` (or any other drf_yasg.openapi class) only records how to
+build one. `apply_annotations` imports drf_yasg.openapi and drf_yasg.utils
+and applies what was recorded; the schema view calls it when it is first
+built. With API_DOCS_ENABLED off nothing calls it and the annotations stay
+inert. (With the docs on, the drf_yasg package itself, and pkg_resources
+with it, is still loaded at startup as an installed app.)
+"""
+import threading
+from functools import partial
+
+_lock = threading.Lock()
+_pending = []
+
+
+class _Deferred:
+    """A drf_yasg.openapi object, built when the annotations are applied."""
+
+    def __init__(self, name, *args, **kwargs):
+        self.name, self.args, self.kwargs = name, args, kwargs
+
+    def build(self, module):
+        return getattr(module, self.name)(*_build(self.args, module), **_build(self.kwargs, module))
+
+
+def _build(value, module):
+    if isinstance(value, _Deferred):
+        return value.build(module)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_build(item, module) for item in value)
+    if isinstance(value, dict):
+        return {key: _build(item, module) for key, item in value.items()}
+    return value
+
+
+class _OpenAPI:
+    # The constants are plain strings in drf_yasg.openapi as well
+    IN_BODY = 'body'
+    IN_PATH = 'path'
+    IN_QUERY = 'query'
+    IN_FORM = 'formData'
+    IN_HEADER = 'header'
+    TYPE_OBJECT = 'object'
+    TYPE_STRING = 'string'
+    TYPE_NUMBER = 'number'
+    TYPE_INTEGER = 'integer'
+    TYPE_BOOLEAN = 'boolean'
+    TYPE_ARRAY = 'array'
+    TYPE_FILE = 'file'
+    FORMAT_DATE = 'date'
+    FORMAT_DATETIME = 'date-time'
+
+    def __getattr__(self, name):
+        if not name[:1].isupper() or name.isupper():
+            raise AttributeError(f"lib.api_docs.openapi has no attribute {name!r}")
+        return partial(_Deferred, name)
+
+
+openapi = _OpenAPI()
+
+
+def swagger_auto_schema(**kwargs):
+    def decorator(view):
+        _pending.append((view, kwargs))
+        return view
+    return decorator
+
+
+def apply_annotations():
+    """Applies the recorded annotations with drf_yasg; later calls are no-ops."""
+    from drf_yasg import openapi as openapi_module
+    from drf_yasg.utils import swagger_auto_schema as apply
+
+    # Concurrent first requests may build the schema view at the same time
+    with _lock:
+        for view, kwargs in _pending:
+            apply(**_build(kwargs, openapi_module))(view)
+        _pending.clear()
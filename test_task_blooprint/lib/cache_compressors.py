@@ -0,0 +1,54 @@
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django_redis.compressors.base import BaseCompressor
+from django_redis.exceptions import CompressorError
+
+try:
+    import lz4.frame
+except ImportError:  # lz4 is optional, zlib is the default
+    lz4 = None
+
+LZ4_FRAME_MAGIC = b'\x04\x22\x4d\x18'
+
+
+class ThresholdCompressor(BaseCompressor):
+    """
+    django_redis compressor for values of at least COMPRESS_MIN_LENGTH bytes,
+    with COMPRESS_ALGORITHM 'zlib' (at COMPRESS_LEVEL) or 'lz4'. Smaller values
+    are stored as they are, where compression costs more CPU than it saves.
+
+    Decompression recognises both formats by their header, so switching
+    algorithm does not break values already in Redis; values stored
+    uncompressed raise CompressorError, which django_redis treats as "not
+    compressed".
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.algorithm = options.get('COMPRESS_ALGORITHM', 'zlib')
+        self.min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+        self.level = options.get('COMPRESS_LEVEL', 6)
+        if self.algorithm not in ('zlib', 'lz4'):
+            raise ImproperlyConfigured(f"Unknown COMPRESS_ALGORITHM {self.algorithm!r}")
+        if self.algorithm == 'lz4' and lz4 is None:
+            raise ImproperlyConfigured("COMPRESS_ALGORITHM 'lz4' needs the lz4 package")
+
+    def compress(self, value):
+        if len(value) < self.min_length:
+            return value
+        if self.algorithm == 'lz4':
+            return lz4.frame.compress(value)
+        return zlib.compress(value, self.level)
+
+    def decompress(self, value):
+        try:
+            if value[:4] == LZ4_FRAME_MAGIC:
+                if lz4 is None:
+                    raise CompressorError("lz4 is not installed")
+                return lz4.frame.decompress(value)
+            return zlib.decompress(value)
+        except CompressorError:
+            raise
+        except Exception as e:
+            raise CompressorError(e)
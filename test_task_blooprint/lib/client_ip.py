@@ -0,0 +1,39 @@
+"""
+The client's IP address behind trusted reverse proxies.
+
+REMOTE_ADDR is the peer of the web server, which behind a load balancer is
+the load balancer. X-Forwarded-For is only believed when REMOTE_ADDR is one
+of TRUSTED_PROXIES (addresses or networks), since any client can send the
+header. It is then read from the right, skipping the trusted proxies, and
+the first address that is not one is the client: entries further left were
+written by the client itself and may be forged.
+"""
+import ipaddress
+from functools import lru_cache
+
+from django.conf import settings
+
+
+@lru_cache(maxsize=8)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def _is_trusted(address, networks):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request):
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    networks = _networks(tuple(settings.TRUSTED_PROXIES))
+    if not networks or not _is_trusted(remote_addr, networks):
+        return remote_addr
+    forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if address.strip()]
+    for address in reversed(forwarded):
+        if not _is_trusted(address, networks):
+            return address
+    return forwarded[0] if forwarded else remote_addr
@@ -0,0 +1,137 @@
+"""
+Accept-Encoding negotiated response compression.
+
+Unlike django.middleware.gzip, compressed bodies are kept in a small
+in-process LRU keyed by a digest of the raw body, so a cached list that is
+served many times is compressed once per encoding rather than once per
+request. Hashing the body is an order of magnitude cheaper than compressing
+it. Brotli is offered when the `brotli` package is installed.
+"""
+import gzip
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from lib.middleware import SyncAndAsyncMiddleware
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+_coding = re.compile(r'^\s*([a-z0-9*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$', re.IGNORECASE)
+
+
+def _compress_gzip(content):
+    # mtime=0 keeps the output deterministic, so identical bodies compress identically.
+    return gzip.compress(content, compresslevel=6, mtime=0)
+
+
+def _compress_br(content):
+    return brotli.compress(content, quality=5)
+
+
+ENCODINGS = {'gzip': _compress_gzip}
+if brotli is not None:
+    ENCODINGS = {'br': _compress_br, **ENCODINGS}  # preferred when the client accepts both
+
+
+def negotiate(accept_encoding):
+    """
+    The best encoding in ENCODINGS the client accepts, or None. Ties in
+    q-value go to the server's preference (brotli, then gzip).
+    """
+    accepted = {}
+    for part in accept_encoding.split(','):
+        match = _coding.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1).lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressedBodyCache:
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compress(self, content, encoding):
+        key = (hashlib.blake2b(content, digest_size=16).digest(), encoding)
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                return compressed
+        compressed = ENCODINGS[encoding](content)
+        with self._lock:
+            self._entries[key] = compressed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compressed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+body_cache = CompressedBodyCache(settings.RESPONSE_COMPRESSION_CACHE_SIZE)
+
+
+class CompressionMiddleware(SyncAndAsyncMiddleware):
+    """
+    Compresses GET/HEAD responses of at least RESPONSE_COMPRESSION_MIN_SIZE
+    bytes. Other methods are left alone: their responses (login tokens,
+    echoed form data) are not repeated and are where BREACH-style attacks
+    would look.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+            or len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = body_cache.get_or_compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
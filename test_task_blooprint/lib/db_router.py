@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from lib.middleware import SyncAndAsyncMiddleware
+
+logger = logging.getLogger(__name__)
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to one of settings.DATABASE_REPLICAS, but only while
+    ReplicaRoutingMiddleware has marked the current request as replica-safe.
+    Everything else (writes, migrations, management commands, reads inside
+    unsafe requests) stays on 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _use_replica.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def _pin_key(request):
+    client = request.headers.get('Authorization') or request.META.get('REMOTE_ADDR', '')
+    return 'db_pin_' + hashlib.sha1(client.encode()).hexdigest()
+
+
+def _should_pin(request, response):
+    return settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400
+
+
+def primary_only(view):
+    """Keeps a view function or viewset action off the replicas."""
+    view.use_read_replica = False
+    return view
+
+
+def _pin(request):
+    try:
+        cache.set(_pin_key(request), 1, timeout=settings.REPLICA_PIN_SECONDS)
+    except Exception as e:
+        logger.error(f"Error pinning client to primary database: {str(e)}")
+
+
+class ReplicaRoutingMiddleware(SyncAndAsyncMiddleware):
+    """
+    Marks safe-method requests as replica reads, except:
+    - views that set `use_read_replica = False` (per-viewset opt-out), and
+      viewset actions decorated with @primary_only
+    - clients that wrote within the last REPLICA_PIN_SECONDS, so they
+      read their own writes from the primary.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        if _should_pin(request, response):
+            _pin(request)
+        return response
+
+    async def __acall__(self, request):
+        # process_view runs in a thread under ASGI; sync_to_async copies the
+        # flag it sets back into this request's context.
+        token = _use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        if _should_pin(request, response):
+            await sync_to_async(_pin)(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return None
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if not getattr(view_class or view_func, 'use_read_replica', True):
+            return None
+        handler = getattr(view_class, (getattr(view_func, 'actions', None) or {}).get(request.method.lower(), ''), None)
+        if not getattr(handler, 'use_read_replica', True):
+            return None
+        try:
+            pinned = cache.get(_pin_key(request))
+        except Exception:
+            pinned = True  # Can't tell whether this client just wrote; stay on the primary
+        if not pinned:
+            _use_replica.set(True)
+        return None
@@ -0,0 +1,66 @@
+"""
+Startup import profiling with `python -X importtime`.
+
+The interpreter reports every import on stderr once it finishes, after the
+imports nested in it, as
+
+    import time: self [us] | cumulative | imported package
+    import time:       412 |       1830 |   django.http
+
+with two spaces of indent per nesting level. Modules loaded through
+importlib.import_module (INSTALLED_APPS, dotted paths in settings) are
+missing from the report, though the imports they trigger are not, so the
+wall time is the number to compare. Profiling runs in a fresh subprocess,
+since in the current process everything is already imported.
+"""
+import subprocess
+import sys
+import time
+from collections import defaultdict, namedtuple
+
+Import = namedtuple('Import', 'module self_us cumulative_us depth')
+
+# What a worker does before it can serve its first request.
+STARTUP_SCRIPT = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+
+def parse_importtime(text):
+    """The imports reported in `-X importtime` output, in report order."""
+    imports = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # The header line
+        name = parts[2].rstrip()
+        module = name.lstrip()
+        imports.append(Import(module, int(parts[0]), int(parts[1]), (len(name) - len(module) - 1) // 2))
+    return imports
+
+
+def by_package(imports):
+    """Self time summed per top-level package, largest first."""
+    totals = defaultdict(int)
+    for item in imports:
+        totals[item.module.partition('.')[0]] += item.self_us
+    return sorted(totals.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def profile_startup(cwd, env=None, script=STARTUP_SCRIPT):
+    """
+    Runs `script` in a fresh interpreter with `-X importtime`; returns its
+    wall time in seconds and the parsed imports.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit status {result.returncode}")
+    return elapsed, parse_importtime(result.stderr)
@@ -0,0 +1,111 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+def _resolve_handler(handler):
+    if isinstance(handler, str):
+        handler = logging.getHandlerByName(handler)
+    if not isinstance(handler, logging.Handler):
+        raise ValueError(f"Not a configured logging handler: {handler!r}")
+    return handler
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Puts records on an in-memory queue and lets a background QueueListener
+    thread do the actual (file/console) I/O, so request threads never block
+    on disk writes.
+
+    `handlers` are handler objects, handler names or, from dictConfig,
+    'cfg://handlers.<name>' references. They are resolved when the first
+    record arrives, once dictConfig has configured every handler, whatever
+    order it configures them in.
+    """
+
+    def __init__(self, handlers, queue_size=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.handlers = handlers
+        self.respect_handler_level = respect_handler_level
+        self.listener = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        with self._start_lock:
+            if self.listener is None:
+                # Indexing a dictConfig ConvertingList resolves its cfg:// references.
+                handlers = [_resolve_handler(self.handlers[i]) for i in range(len(self.handlers))]
+                self.listener = QueueListener(self.queue, *handlers, respect_handler_level=self.respect_handler_level)
+                self.listener.start()
+
+    def prepare(self, record):
+        """
+        Like QueueHandler.prepare, but the traceback stays in exc_text
+        instead of being folded into the message, so formatters on the
+        listener side (JsonLinesFormatter) still see it apart.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        if self.listener is None:
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Dropping a log line is better than stalling a request on a slow disk.
+            pass
+
+    def close(self):
+        with self._start_lock:
+            listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        super().close()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log shippers that index structured fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:  # Formatted already, e.g. by QueueListenerHandler
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records at or below `max_level`; anything
+    more severe always passes.
+    """
+
+    def __init__(self, rate=1.0, max_level='DEBUG'):
+        super().__init__()
+        self.rate = float(rate)
+        self.max_level = logging.getLevelNamesMapping()[max_level] if isinstance(max_level, str) else max_level
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.rate >= 1:
+            return True
+        return random.random() < self.rate
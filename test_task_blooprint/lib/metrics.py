@@ -0,0 +1,241 @@
+"""
+In-process request metrics.
+
+MetricsMiddleware times every request (wall, DB, cache, serializer) into
+per-route histograms that `metrics_view` exposes in the Prometheus text
+format, and adds a Server-Timing header so the same breakdown shows up in the
+browser's network panel. Cache numbers come from lib.redis_client and
+serializer time from TimedSerializerMixin; both report into the stats of
+the request currently being served.
+
+The registry lives in each worker process, so a scrape sees the counters
+of whichever worker answered it. Every series carries that worker's `pid`
+label, so a scrape landing on another worker shows up as other series
+rather than as a counter reset; sum over `pid` in queries.
+
+`/metrics` is only served to METRICS_ALLOWED_IPS, or with
+`Authorization: Bearer <METRICS_TOKEN>`.
+"""
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from lib.client_ip import client_ip
+from lib.middleware import SyncAndAsyncMiddleware, install_execute_wrapper
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Wall time per request.', DURATION_BUCKETS),
+    'http_request_db_seconds': ('Time spent in SQL queries per request.', DURATION_BUCKETS),
+    'http_request_db_queries': ('SQL queries per request.', QUERY_BUCKETS),
+    'http_request_cache_seconds': ('Time spent in cache calls per request.', DURATION_BUCKETS),
+    'http_request_serializer_seconds': ('Time spent serializing per request.', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Response body size.', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'http_requests_total': 'Requests served, by status code.',
+    'http_request_cache_hits_total': 'Cache hits.',
+    'http_request_cache_misses_total': 'Cache misses.',
+}
+
+
+class RequestStats:
+    __slots__ = ('db_time', 'db_queries', 'cache_time', 'cache_hits', 'cache_misses', 'serializer_time')
+
+    def __init__(self):
+        self.db_time = self.cache_time = self.serializer_time = 0.0
+        self.db_queries = self.cache_hits = self.cache_misses = 0
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+def record_cache(seconds, hits=0, misses=0):
+    stats = _current.get()
+    if stats is not None:
+        stats.cache_time += seconds
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent in to_representation to the current request's
+    serializer time. For many=True it is called once per row, which sums up.
+    """
+
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None:
+            return super().to_representation(instance)
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += time.perf_counter() - start
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = defaultdict(float)
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def inc(self, name, labels, amount=1):
+        if amount:
+            with self._lock:
+                self._counters[(name, labels)] += amount
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        with self._lock:
+            histograms = sorted((key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (metric, labels), counts, total, count in histograms:
+                if metric != name:
+                    continue
+                label_text = _labels(labels)
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_text}}} {total}')
+                lines.append(f'{name}_count{{{label_text}}} {count}')
+        for name, help_text in COUNTERS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (metric, labels), value in counters:
+                if metric == name:
+                    lines.append(f'{name}{{{_labels(labels)}}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    labels = (('pid', os.getpid()),) + labels
+    return ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels)
+
+
+registry = Registry()
+
+
+def _query_timer(stats):
+    def timed_query(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.db_time += time.perf_counter() - start
+            stats.db_queries += 1
+    return timed_query
+
+
+class MetricsMiddleware(SyncAndAsyncMiddleware):
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with install_execute_wrapper(_query_timer(stats)):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            stack = await sync_to_async(install_execute_wrapper)(_query_timer(stats))
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    def record(self, request, response, stats, wall_time):
+        match = getattr(request, 'resolver_match', None)
+        labels = (('route', match.view_name if match else 'unmatched'), ('method', request.method))
+        registry.observe('http_request_duration_seconds', labels, wall_time)
+        registry.observe('http_request_db_seconds', labels, stats.db_time)
+        registry.observe('http_request_db_queries', labels, stats.db_queries)
+        registry.observe('http_request_cache_seconds', labels, stats.cache_time)
+        registry.observe('http_request_serializer_seconds', labels, stats.serializer_time)
+        if not response.streaming:
+            registry.observe('http_response_size_bytes', labels, len(response.content))
+        registry.inc('http_requests_total', labels + (('status', response.status_code),))
+        registry.inc('http_request_cache_hits_total', labels, stats.cache_hits)
+        registry.inc('http_request_cache_misses_total', labels, stats.cache_misses)
+
+        response['Server-Timing'] = ', '.join([
+            f'app;dur={wall_time * 1000:.2f}',
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.db_queries} queries"',
+            f'cache;dur={stats.cache_time * 1000:.2f};desc="{stats.cache_hits} hits, {stats.cache_misses} misses"',
+            f'serializer;dur={stats.serializer_time * 1000:.2f}',
+        ])
+        return response
+
+
+def _may_scrape(request):
+    if client_ip(request) in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,44 @@
+"""
+Base for the project's middleware, which has to run under WSGI and ASGI.
+
+Django adapts a sync-only middleware under ASGI, and with it everything
+inside it in the chain: the async views would then each run through
+async_to_sync, holding a thread for the whole request. A subclass keeps
+its sync `__call__` and adds an `async def __acall__`; `__call__` hands
+over to it when the chain is async:
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        ...
+
+process_view and friends may stay sync, Django runs them in a thread.
+"""
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+
+class SyncAndAsyncMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+def install_execute_wrapper(wrapper):
+    """
+    Wraps the queries of every connection of this thread; closing the
+    returned ExitStack removes the wrapper. Connections are per thread, so
+    async code has to call both through sync_to_async, which runs the
+    request's ORM calls on one thread.
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
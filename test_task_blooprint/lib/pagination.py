@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import LimitOffsetPagination, PageNumberPagination
 from rest_framework.response import Response
 from collections import OrderedDict
 
@@ -47,4 +47,31 @@ class CustomPageNumberPagination(PageNumberPagination):
                 },
                 'results': schema,
             },
-        }
\ No newline at end of file
+        }
+
+
+class AsyncLimitOffsetPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination for async views, using the async ORM for the count
+    and page queries. Produces the same payload as the sync viewsets.
+    """
+
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [obj async for obj in queryset[self.offset:self.offset + self.limit]]
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ])
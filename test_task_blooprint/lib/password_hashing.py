@@ -0,0 +1,45 @@
+"""
+Password hashing on a process pool.
+
+Password hashers are deliberately CPU-bound (and hold the GIL), so hashing
+thousands of passwords only scales across processes. Workers are spawned
+rather than forked, since forking a threaded server process can copy locks
+held by other threads, and they import nothing but the hasher class, which
+needs no Django settings or app registry.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.utils.module_loading import import_string
+
+
+def _hash_chunk(hasher_path, passwords):
+    hasher = import_string(hasher_path)()
+    return [hasher.encode(password, hasher.salt()) for password in passwords]
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Encoded passwords for `passwords`, in order, using the default hasher
+    on `workers` processes (every core by default). Empty passwords become
+    unusable ones.
+    """
+    hasher_path = settings.PASSWORD_HASHERS[0]
+    to_hash = [index for index, password in enumerate(passwords) if password]
+    hashed = [None if password else make_password(None) for password in passwords]
+
+    workers = min(workers or os.cpu_count() or 1, len(to_hash))
+    if workers <= 1:
+        encoded = _hash_chunk(hasher_path, [passwords[index] for index in to_hash])
+    else:
+        size = -(-len(to_hash) // (workers * 4))  # A few chunks per worker evens out stragglers
+        chunks = [[passwords[index] for index in to_hash[start:start + size]] for start in range(0, len(to_hash), size)]
+        with ProcessPoolExecutor(workers, mp_context=get_context('spawn')) as pool:
+            encoded = [value for values in pool.map(_hash_chunk, [hasher_path] * len(chunks), chunks) for value in values]
+
+    for index, value in zip(to_hash, encoded):
+        hashed[index] = value
+    return hashed
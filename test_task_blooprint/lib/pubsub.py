@@ -0,0 +1,166 @@
+"""
+Publish/subscribe for server push.
+
+Subscribers live on an asyncio event loop (the ASGI server's), each with its
+own bounded queue, and cost nothing while idle. Publishers may be any thread.
+
+- InMemoryBroker delivers within the process; enough for a single node and
+  for tests.
+- RedisBroker publishes through Redis, and each event loop holds one pattern
+  subscription that fans messages out to its local subscribers. Thousands of
+  subscribers therefore share one Redis connection per process instead of
+  holding one each. It needs the default cache to be Redis; the system check
+  below refuses to start otherwise, rather than push only within a process.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from redis import asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+REDIS_CHANNEL_PREFIX = 'push:'
+
+
+class Subscription:
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def get(self, timeout=None):
+        """The next message published to one of the channels, or None after `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.warning(f"Dropping push message for a slow subscriber to {', '.join(self.channels)}")
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        """Must be called from the event loop that will read the subscription."""
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:  # The subscriber's loop has closed
+                self.unsubscribe(subscription)
+
+
+def _uses_redis():
+    return isinstance(caches['default'], RedisCache)
+
+
+@checks.register(checks.Tags.caches)
+def check_push_broker(app_configs, **kwargs):
+    if settings.PUSH_BROKER == 'redis' and not _uses_redis():
+        return [checks.Error(
+            "PUSH_BROKER is 'redis' but the default cache is not django_redis, so pushes would not reach other processes.",
+            hint="Point CACHES['default'] at Redis, or set PUSH_BROKER = 'memory' for a single process.",
+            id='pubsub.E001',
+        )]
+    return []
+
+
+class RedisBroker(InMemoryBroker):
+
+    def __init__(self):
+        if not _uses_redis():
+            raise ImproperlyConfigured("PUSH_BROKER 'redis' needs the default cache to be django_redis")
+        super().__init__()
+        self._listeners = {}
+
+    def subscribe(self, channels):
+        subscription = super().subscribe(channels)
+        listener = self._listeners.get(subscription.loop)
+        if listener is None or listener.done():
+            self._listeners[subscription.loop] = subscription.loop.create_task(self._listen())
+        return subscription
+
+    def publish(self, channel, message):
+        breaker = getattr(cache.client, 'breaker', None)
+        if breaker is not None and breaker.is_open:
+            return
+        try:
+            get_redis_connection('default').publish(REDIS_CHANNEL_PREFIX + channel, message)
+        except Exception as e:
+            logger.error(f"Error publishing to {channel}: {str(e)}")
+
+    async def _listen(self):
+        delay = 1
+        while True:
+            client = aioredis.Redis.from_url(cache.client._server[0])
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(REDIS_CHANNEL_PREFIX + '*')
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message['type'] == 'pmessage':
+                            self.deliver(message['channel'].decode()[len(REDIS_CHANNEL_PREFIX):], message['data'].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Push subscription to Redis lost, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                await client.aclose()
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """The broker configured by PUSH_BROKER ('redis' or 'memory'), one per process."""
+    name = settings.PUSH_BROKER
+    with _brokers_lock:
+        broker = _brokers.get(name)
+        if broker is None:
+            broker = _brokers[name] = {'redis': RedisBroker, 'memory': InMemoryBroker}[name]()
+        return broker
@@ -0,0 +1,197 @@
+import logging
+import os
+import re
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, reverse
+
+from lib.middleware import SyncAndAsyncMiddleware, install_execute_wrapper
+
+logger = logging.getLogger(__name__)
+
+_in_list = re.compile(r'\bIN \((?:(?:%s|\?), )*(?:%s|\?)\)', re.IGNORECASE)
+_literal = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def max_queries(limit):
+    """
+    Declares how many SQL queries a view (or a viewset action) may run, e.g.
+
+        @max_queries(3)
+        def list(self, request, *args, **kwargs): ...
+
+    A class-level `max_queries = n` attribute applies to every action that
+    does not declare its own.
+    """
+    def decorator(func):
+        func.max_queries = limit
+        return func
+    return decorator
+
+
+def get_query_budget(view_func, method):
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return getattr(view_func, 'max_queries', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    handler = getattr(view_class, actions.get(method.lower(), method.lower()), None)
+    budget = getattr(handler, 'max_queries', None)
+    return budget if budget is not None else getattr(view_class, 'max_queries', None)
+
+
+def fingerprint(sql):
+    """
+    Collapses literals and IN lists, so the same query with different
+    parameters (the N in N+1) shares one fingerprint.
+    """
+    return _literal.sub('?', _in_list.sub('IN (...)', sql))
+
+
+def duplicated_queries(sql_list):
+    counts = Counter(fingerprint(sql) for sql in sql_list)
+    return [(sql, count) for sql, count in counts.most_common() if count > 1]
+
+
+def budget_report(label, budget, sql_list):
+    lines = [f"{label} ran {len(sql_list)} queries, budget is {budget}"]
+    for sql, count in duplicated_queries(sql_list):
+        lines.append(f"  {count}x {sql}")
+    return '\n'.join(lines)
+
+
+def _recorder(executed):
+    def record(execute, sql, params, many, context):
+        executed.append(sql)
+        return execute(sql, params, many, context)
+    return record
+
+
+class QueryBudgetMiddleware(SyncAndAsyncMiddleware):
+    """
+    Counts the queries of every request whose view declares a budget.
+    QUERY_BUDGET_MODE: 'off' (default in production), 'warn' logs the
+    offending request and its duplicated SQL, 'raise' raises
+    QueryBudgetExceeded so tests fail.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if settings.QUERY_BUDGET_MODE == 'off':
+            return self.get_response(request)
+
+        executed = []
+        with install_execute_wrapper(_recorder(executed)):
+            response = self.get_response(request)
+        self.check(request, executed)
+        return response
+
+    async def __acall__(self, request):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            return await self.get_response(request)
+
+        executed = []
+        stack = await sync_to_async(install_execute_wrapper)(_recorder(executed))
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.check(request, executed)
+        return response
+
+    def check(self, request, executed):
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and len(executed) > budget:
+            report = budget_report(f"{request.method} {request.path}", budget, executed)
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func, request.method)
+        return None
+
+
+def iter_routes(patterns, prefix=''):
+    """
+    Yields (route, name, callback) for every URL pattern, descending into includes.
+    """
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern), pattern.name, pattern.callback
+
+
+class QueryBudgetTestMixin:
+    """
+    Test helpers for the budgets declared with `max_queries`.
+    """
+
+    def unbudgeted_routes(self, patterns, method='GET', exclude=()):
+        """
+        Named routes that answer `method` but declare no budget.
+        """
+        missing = []
+        for route, name, callback in iter_routes(patterns):
+            if not name or name in exclude or route.endswith('\\.(?P<format>[a-z0-9]+)/?$'):
+                continue
+            actions = getattr(callback, 'actions', None)
+            view_class = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+            if actions is not None and method.lower() not in actions:
+                continue
+            if actions is None and view_class is not None and not hasattr(view_class, method.lower()):
+                continue
+            if get_query_budget(callback, method) is None:
+                missing.append(name)
+        return missing
+
+    def assertWithinQueryBudget(self, path, budget, method='get', data=None, **extra):
+        with CaptureQueriesContext(connections['default']) as ctx:
+            response = getattr(self.client, method)(path, data, **extra)
+        executed = [query['sql'] for query in ctx.captured_queries]
+        if len(executed) > budget:
+            self.fail(budget_report(f"{method.upper()} {path}", budget, executed))
+        return response
+
+    def assertRouteBudgets(self, patterns, url_kwargs, exclude=(), **extra):
+        """
+        Requests every budgeted GET route in `patterns` and fails on the first
+        one over budget. `url_kwargs` maps route names to reverse() kwargs.
+        """
+        for route, name, callback in iter_routes(patterns):
+            if not name or name in exclude or route.endswith('\\.(?P<format>[a-z0-9]+)/?$'):
+                continue
+            budget = get_query_budget(callback, 'GET')
+            if budget is None:
+                continue
+            with self.subTest(route=name):
+                path = reverse(name, kwargs=url_kwargs.get(name))
+                response = self.assertWithinQueryBudget(path, budget, **extra)
+                self.assertLess(response.status_code, 400, f"{name}: {response.status_code}")
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """
+    Runs the tests with QUERY_BUDGET_MODE='raise' (unless the environment
+    sets another mode), so a test whose requests go over a budget fails
+    whatever it is testing.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._query_budget = override_settings(QUERY_BUDGET_MODE=os.environ.get('QUERY_BUDGET_MODE', 'raise'))
+        self._query_budget.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._query_budget.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,238 @@
+"""
+Token-bucket rate limiting for every route, configured in RATE_LIMITS.
+
+Each rule gives every client (the JWT user, or the client IP) a bucket of
+`burst` tokens that refills at `rate`; a request takes one token from each
+bucket of the rules that apply to it, or is refused with a 429 when any of
+them is empty. All buckets of a request are checked and updated by one Lua
+script, so a request costs one Redis round trip and concurrent requests of
+the same client cannot both take the last token. Bucket keys go through
+cache.make_key, so they follow the cache's KEY_PREFIX and VERSION.
+
+Clients are told apart by IP behind TRUSTED_PROXIES (lib/client_ip.py).
+
+While Redis is unreachable (or the cache is not Redis) the buckets live in
+process memory instead: limits then hold per process rather than across
+the fleet, which still keeps one client from starving the rest.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from fnmatch import fnmatch
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import JsonResponse
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from redis.commands.core import Script
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from lib.client_ip import client_ip
+from lib.middleware import SyncAndAsyncMiddleware
+from lib.redis_client import REDIS_ERRORS
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'ratelimit:'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+Rule = namedtuple('Rule', 'name capacity refill routes methods key')
+Decision = namedtuple('Decision', 'allowed limit remaining reset retry_after')
+
+# KEYS are the buckets, ARGV their capacity and refill per second in pairs.
+# Takes a token from every bucket, or from none when any of them is empty,
+# and returns whether it did followed by each bucket's level.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels, allowed = {}, 1
+for i, key in ipairs(KEYS) do
+    local capacity, refill = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(bucket[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    levels[i] = math.min(capacity, level + elapsed * refill)
+    if levels[i] < 1 then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local capacity, refill = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local level = levels[i] - allowed
+    redis.call('HSET', key, 'tokens', level, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((capacity - level) / refill * 1000) + 1000)
+    result[i + 1] = tostring(level)
+end
+return result
+"""
+# Registered once: the SHA is computed here, and the first EVALSHA a server
+# does not know loads the script.
+token_bucket_script = Script(None, TOKEN_BUCKET_SCRIPT.encode())
+
+
+def parse_rate(rate):
+    """'100/m' -> (100, tokens per second)."""
+    count, _, period = rate.partition('/')
+    return int(count), int(count) / PERIODS[period[:1]]
+
+
+def get_rules():
+    rules = []
+    for name, config in settings.RATE_LIMITS.items():
+        count, refill = parse_rate(config['rate'])
+        rules.append(Rule(
+            name, config.get('burst', count), refill, config.get('routes'),
+            {method.upper() for method in config['methods']} if config.get('methods') else None,
+            config.get('key', 'user_or_ip'),
+        ))
+    return rules
+
+
+def _jwt_user_id(request):
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(header[1])[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+def client_key(key, user_id, ip):
+    """The bucket owner for a rule's `key`, or None when the rule does not apply."""
+    if key in ('user', 'user_or_ip') and user_id is not None:
+        return f'user:{user_id}'
+    return None if key == 'user' else f'ip:{ip}'
+
+
+def applicable_buckets(request, url_name):
+    """(rule, bucket key) for every rule that applies to the request."""
+    buckets, user_id = [], _jwt_user_id(request)
+    for rule in get_rules():
+        if rule.methods is not None and request.method not in rule.methods:
+            continue
+        if rule.routes is not None and not any(fnmatch(url_name or '', route) for route in rule.routes):
+            continue
+        owner = client_key(rule.key, user_id, client_ip(request))
+        if owner is not None:
+            buckets.append((rule, f'{rule.name}:{owner}'))
+    return buckets
+
+
+def decide(buckets, allowed, levels):
+    """Headers follow the bucket closest to empty."""
+    rules = [rule for rule, _ in buckets]
+    tightest = min(range(len(rules)), key=lambda index: levels[index] / rules[index].capacity)
+    rule, level = rules[tightest], levels[tightest]
+    retry_after = 0
+    if not allowed:
+        retry_after = max(math.ceil((1 - empty) / empty_rule.refill) for empty_rule, empty in zip(rules, levels) if empty < 1)
+    return Decision(
+        allowed=allowed,
+        limit=rule.capacity,
+        remaining=max(0, math.floor(level)),
+        reset=math.ceil((rule.capacity - level) / rule.refill),
+        retry_after=retry_after,
+    )
+
+
+class MemoryBuckets:
+    """The same buckets in process memory, least recently used dropped first."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for rule, key in buckets:
+                level, updated = self._buckets.get(key, (rule.capacity, now))
+                levels.append(min(rule.capacity, level + (now - updated) * rule.refill))
+            allowed = all(level >= 1 for level in levels)
+            if allowed:
+                levels = [level - 1 for level in levels]
+            for (rule, key), level in zip(buckets, levels):
+                self._buckets[key] = (level, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, levels
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+memory_buckets = MemoryBuckets()
+
+
+def _redis_take(buckets):
+    keys = [str(cache.make_key(REDIS_KEY_PREFIX + key)) for _, key in buckets]
+    args = [value for rule, _ in buckets for value in (rule.capacity, rule.refill)]
+    allowed, *levels = token_bucket_script(keys=keys, args=args, client=get_redis_connection('default'))
+    return bool(allowed), [float(level) for level in levels]
+
+
+def take(buckets):
+    if isinstance(caches['default'], RedisCache):
+        breaker = getattr(cache.client, 'breaker', None)
+        if breaker is None or not breaker.is_open:
+            try:
+                allowed, levels = _redis_take(buckets)
+            except REDIS_ERRORS as e:
+                if breaker is not None:
+                    breaker.record_failure(e)
+            else:
+                return decide(buckets, allowed, levels)
+    return decide(buckets, *memory_buckets.take(buckets))
+
+
+def set_headers(response, decision):
+    response['X-RateLimit-Limit'] = decision.limit
+    response['X-RateLimit-Remaining'] = decision.remaining
+    response['X-RateLimit-Reset'] = decision.reset
+    if not decision.allowed:
+        response['Retry-After'] = decision.retry_after
+
+
+class RateLimitMiddleware(SyncAndAsyncMiddleware):
+    """
+    Applies RATE_LIMITS once the URL is resolved (rules match URL names),
+    refusing over-quota requests with a 429 and reporting the quota of the
+    tightest bucket in X-RateLimit-* headers.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        decision = getattr(request, 'rate_limit', None)
+        if decision is not None:
+            set_headers(response, decision)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.RATE_LIMIT_ENABLED:
+            return None
+        buckets = applicable_buckets(request, request.resolver_match.url_name)
+        if not buckets:
+            return None
+        request.rate_limit = decision = take(buckets)
+        if decision.allowed:
+            return None
+        logger.info(f"Rate limited {request.method} {request.path} for {buckets[0][1].partition(':')[2]}")
+        return JsonResponse({'error': 'Too many requests'}, status=429)
@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+
+from django_redis.client import DefaultClient
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError, TimeoutError as RedisTimeoutError
+
+from lib.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+REDIS_ERRORS = (ConnectionInterrupted, RedisConnectionError, RedisTimeoutError, OSError)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive Redis errors. While open,
+    callers skip Redis entirely; once `reset_timeout` seconds have passed, the
+    next caller runs a health probe (a PING) and closes the breaker if it
+    succeeds, or keeps it open for another `reset_timeout`.
+
+    Deletes that could not reach Redis are remembered and replayed once it
+    answers again, before anything is read from it, so invalidations are not
+    lost. Past MAX_PENDING_DELETES the keys are dropped and the whole cache
+    is flushed on recovery instead.
+    """
+
+    MAX_PENDING_DELETES = 10000
+
+    def __init__(self, failure_threshold=3, reset_timeout=5):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.pending_deletes = set()
+        self.flush_pending = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    @property
+    def has_pending(self):
+        return bool(self.pending_deletes) or self.flush_pending
+
+    def allow(self, probe, recover=None):
+        """
+        Whether to call Redis. Once reset_timeout has passed, one caller runs
+        `probe` and then `recover` (which replays the pending deletes) while
+        everyone else is still kept off, so nothing reads a key whose
+        invalidation is still pending.
+        """
+        if self.opened_at is None:
+            return True
+        with self._lock:
+            if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+        try:
+            healthy = bool(probe())
+            if healthy and recover is not None:
+                recover()
+        except Exception:
+            healthy = False
+        with self._lock:
+            self._probing = False
+            if healthy:
+                self.failures = 0
+                self.opened_at = None
+                logger.warning("Redis is healthy again, circuit closed")
+            else:
+                self.opened_at = time.monotonic()
+        return healthy
+
+    def record_success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def remember_deletes(self, keys, flush=False):
+        with self._lock:
+            if self.flush_pending:
+                return
+            self.pending_deletes.update(keys)
+            if flush or len(self.pending_deletes) > self.MAX_PENDING_DELETES:
+                self.pending_deletes = set()
+                self.flush_pending = True
+                logger.error(
+                    f"More than {self.MAX_PENDING_DELETES} cache deletes failed while Redis was unreachable; "
+                    "the cache will be flushed once it answers again"
+                )
+
+    def take_pending_deletes(self):
+        """(keys to delete, whether to flush instead), clearing both."""
+        with self._lock:
+            keys, self.pending_deletes = self.pending_deletes, set()
+            flush, self.flush_pending = self.flush_pending, False
+        return keys, flush
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is None and self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                logger.error(f"Redis circuit opened after {self.failures} failures, serving without cache: {error}")
+
+
+# One breaker per Redis server per process; django_redis builds a client per thread.
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(server, options):
+    key = tuple(server)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(
+                failure_threshold=options.get('CIRCUIT_FAILURE_THRESHOLD', 3),
+                reset_timeout=options.get('CIRCUIT_RESET_TIMEOUT', 5),
+            )
+        return breaker
+
+
+class InstrumentedClient(DefaultClient):
+    """
+    django_redis client that reports time, hits and misses of every cache
+    call to the request metrics (lib.metrics), and degrades to a cache that
+    is always empty while Redis is unreachable (see CircuitBreaker), so an
+    outage costs latency instead of failed requests.
+    """
+
+    def __init__(self, server, params, backend):
+        super().__init__(server, params, backend)
+        self.breaker = get_breaker(self._server, self._options)
+
+    def ping(self):
+        return self.get_client(write=False).ping()
+
+    def _replay_deletes(self):
+        """Applies the deletes that failed; raises (keeping them) when Redis fails again."""
+        keys, flush = self.breaker.take_pending_deletes()
+        try:
+            if flush:
+                super().clear()
+            elif keys:
+                super().delete_many(list(keys))
+        except REDIS_ERRORS:
+            self.breaker.remember_deletes(keys, flush=flush)
+            raise
+        if flush:
+            logger.warning("Flushed the cache, too many deletes failed while Redis was unreachable")
+        elif keys:
+            logger.warning(f"Replayed {len(keys)} cache deletes that failed while Redis was unreachable")
+
+    def _guarded(self, fallback, func, *args, **kwargs):
+        if not self.breaker.allow(self.ping, self._replay_deletes):
+            return fallback
+        try:
+            if self.breaker.has_pending:  # Deletes that failed without opening the breaker
+                self._replay_deletes()
+            result = func(*args, **kwargs)
+        except REDIS_ERRORS as e:
+            if isinstance(e.__cause__, ResponseError):
+                raise
+            self.breaker.record_failure(e)
+            return fallback
+        self.breaker.record_success()
+        return result
+
+    def get(self, key, default=None, version=None, client=None):
+        start = time.perf_counter()
+        value = self._guarded(default, super().get, key, default=default, version=version, client=client)
+        hit = value is not default
+        record_cache(time.perf_counter() - start, hits=int(hit), misses=int(not hit))
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        start = time.perf_counter()
+        values = self._guarded({}, super().get_many, keys, version=version, client=client)
+        record_cache(time.perf_counter() - start, hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def set(self, key, value, *args, client=None, **kwargs):
+        if client is not None:
+            # Part of a set_many pipeline, which is timed and guarded as a whole.
+            return super().set(key, value, *args, client=client, **kwargs)
+        start = time.perf_counter()
+        try:
+            return self._guarded(False, super().set, key, value, *args, **kwargs)
+        finally:
+            record_cache(time.perf_counter() - start)
+
+    def set_many(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._guarded(None, super().set_many, *args, **kwargs)
+        finally:
+            record_cache(time.perf_counter() - start)
+
+    def add(self, *args, **kwargs):
+        return self._guarded(False, super().add, *args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self._guarded(None, super().incr, *args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        return self._guarded(False, super().has_key, *args, **kwargs)
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        start = time.perf_counter()
+        try:
+            deleted = self._guarded(None, super().delete, key, version=version, prefix=prefix, client=client)
+            if deleted is None:
+                self.breaker.remember_deletes([self.make_key(key, version=version, prefix=prefix)])
+                return False
+            return deleted
+        finally:
+            record_cache(time.perf_counter() - start)
+
+    def delete_many(self, keys, version=None, client=None):
+        start = time.perf_counter()
+        keys = list(keys)
+        try:
+            deleted = self._guarded(None, super().delete_many, keys, version=version, client=client)
+            if deleted is None:
+                self.breaker.remember_deletes([self.make_key(key, version=version) for key in keys])
+                return 0
+            return deleted
+        finally:
+            record_cache(time.perf_counter() - start)
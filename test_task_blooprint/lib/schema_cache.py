@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_schema = None
+
+
+@lru_cache(maxsize=None)
+def code_fingerprint():
+    """
+    Hash of every python source the schema is derived from. Code changes
+    need a process restart anyway, so this is computed once per process.
+    """
+    from drf_yasg import __version__ as drf_yasg_version
+
+    digest = hashlib.sha1(drf_yasg_version.encode())
+    base_dir = Path(settings.BASE_DIR)
+    for package in settings.OPENAPI_SCHEMA_SOURCES:
+        for path in sorted((base_dir / package).rglob('*.py')):
+            digest.update(str(path.relative_to(base_dir)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def schema_file():
+    return Path(settings.OPENAPI_SCHEMA_CACHE_DIR) / f'openapi-{code_fingerprint()[:16]}.json'
+
+
+def generate_schema(schema_view, info):
+    """
+    Builds the public schema without a request, so no host is baked in and
+    Swagger UI falls back to the host it was loaded from.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson
+
+    generator = schema_view.generator_class(info, '', None, None, None)
+    schema = generator.get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def write_schema(schema_view, info):
+    path = schema_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    content = generate_schema(schema_view, info)
+    # Workers may read the file at any time: write a temporary file next to
+    # it and rename it into place, so they see the old schema or the new one
+    # but never a truncated one.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.openapi-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path, content
+
+
+def remove_stale_schemas(path):
+    """
+    Deletes the schema files of other code versions written before `path`.
+    Only the deploy-time command calls this: during a rolling deploy old and
+    new workers run side by side, and each would delete the other's file.
+    """
+    written_at = path.stat().st_mtime
+    removed = []
+    for stale in path.parent.glob('openapi-*.json'):
+        if stale != path and stale.stat().st_mtime < written_at:
+            stale.unlink(missing_ok=True)
+            removed.append(stale)
+    return removed
+
+
+def etag_matches(header, etag):
+    """If-None-Match semantics: any listed tag equal to `etag` (weakly), or '*'."""
+    tags = parse_etags(header)
+    return '*' in tags or etag in [tag.removeprefix('W/') for tag in tags]
+
+
+def get_schema(schema_view, info):
+    """
+    Returns (content, etag), reading the file written by the
+    `generate_openapi_schema` command when it matches the running code and
+    generating it once otherwise.
+    """
+    global _schema
+    if _schema is None:
+        with _lock:
+            if _schema is None:
+                path = schema_file()
+                if path.exists():
+                    content = path.read_bytes()
+                else:
+                    logger.info("Generating OpenAPI schema, none precomputed for this code version")
+                    try:
+                        path, content = write_schema(schema_view, info)
+                    except OSError:
+                        content = generate_schema(schema_view, info)
+                _schema = (content, '"%s"' % hashlib.sha1(content).hexdigest())
+    return _schema
+
+
+def cached_schema_view(build):
+    """
+    Serves `?format=openapi` (what Swagger UI fetches) from precomputed bytes
+    with an ETag; everything else is passed on to the drf_yasg UI view.
+
+    `build` returns (schema_view, info). It is only called on the first
+    request, so workers that never serve the docs never import drf_yasg's
+    views, generators and renderers.
+    """
+    @lru_cache(maxsize=None)
+    def load():
+        schema_view, info = build()
+        return schema_view, info, schema_view.with_ui('swagger', cache_timeout=0)
+
+    def view(request, *args, **kwargs):
+        schema_view, info, ui_view = load()
+        if request.GET.get('format') != 'openapi':
+            return ui_view(request, *args, **kwargs)
+
+        content, etag = get_schema(schema_view, info)
+        if etag_matches(request.headers.get('If-None-Match', ''), etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/openapi+json; charset=utf-8')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
+    return view
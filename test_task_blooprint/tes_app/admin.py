@@ -9,4 +9,30 @@ class UserFormAdmin(admin.ModelAdmin):
 #     list_display = ('incident_id', 'incident_details', 'identity', 'priority', 'status', 'reported_date_time', 'reporter')
 
 admin.site.register(User, UserFormAdmin)
-# admin.site.register(Incident, IncidentAdmin)
\ No newline at end of file
+# admin.site.register(Incident, IncidentAdmin)
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'route', 'path', 'duration_ms', 'samples')
+    list_filter = ('route', 'method')
+    readonly_fields = ('route', 'method', 'path', 'duration_ms', 'samples', 'collapsed_stacks', 'created_at')
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
+
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source', 'format', 'status', 'rows_done', 'rows_imported', 'rows_failed', 'updated_at')
+    list_filter = ('status', 'format')
+
+admin.site.register(ImportJob, ImportJobAdmin)
+
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('id', 'stock', 'created_at')
+    list_select_related = ('stock__product',)
+
+admin.site.register(LowStockAlert, LowStockAlertAdmin)
+
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'stock', 'user', 'quantity', 'status', 'created_at', 'expires_at')
+    list_filter = ('status',)
+    list_select_related = ('stock__product', 'user')
+
+admin.site.register(Reservation, ReservationAdmin)
\ No newline at end of file
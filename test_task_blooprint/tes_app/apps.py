@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TesAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tes_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
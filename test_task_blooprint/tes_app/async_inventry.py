@@ -0,0 +1,141 @@
+"""
+Async read-only variants of the inventory list/retrieve endpoints.
+
+They share cache keys and payloads with the viewsets in inventry.py, but run
+natively on the event loop when served through test_task/asgi.py: JWT
+validation is pure CPU, the user and inventory rows come from the async ORM
+and the cache is read with redis.asyncio, so a slow client or a Redis/DB wait
+never pins a worker thread.
+"""
+import logging
+
+from django.http import JsonResponse
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from lib.async_cache import aget, aset
+from lib.pagination import AsyncLimitOffsetPagination
+from lib.query_budget import max_queries
+from .inventory_cache import CACHE_TIMEOUT, hits, list_cache_key
+from .models import Category, Product, Stock, User
+from .serialization import CategorySerializer, ProductSerializer, StockSerializer
+
+logger = logging.getLogger(__name__)
+
+
+async def _authenticate(request):
+    """
+    Same checks as JWTAuthentication + IsAuthenticated, minus the
+    sync_to_async hop for the user lookup.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header is None:
+        return None
+    raw_token = auth.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        token = auth.get_validated_token(raw_token)
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+    try:
+        user = await User.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist:
+        return None
+    return user if user.is_active else None
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def _unauthorized():
+    response = _json({'detail': 'Authentication credentials were not provided.'}, status=401)
+    response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+async def _cached_list(request, model, serializer_class, list_key):
+    if request.method != 'GET':
+        return _json({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    if await _authenticate(request) is None:
+        return _unauthorized()
+    try:
+        drf_request = Request(request)
+        cache_key = list_cache_key(list_key, drf_request)
+        cached = await aget(cache_key) if cache_key else None
+        if cached:
+            logger.debug(f"Returning cached {cache_key}")
+            return _json(cached)
+
+        paginator = AsyncLimitOffsetPagination()
+        page = await paginator.apaginate_queryset(model.objects.order_by('pk'), drf_request)
+        data = paginator.get_paginated_data(serializer_class(page, many=True).data)
+        if cache_key:
+            await aset(cache_key, data, CACHE_TIMEOUT)
+            logger.debug(f"Caching {cache_key}")
+        return _json(data)
+    except Exception as e:
+        logger.error(f"Error fetching {list_key}: {str(e)}")
+        return _json({'error': 'Internal server error'}, status=500)
+
+
+async def _cached_retrieve(request, model, serializer_class, cache_prefix, pk):
+    if request.method != 'GET':
+        return _json({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    if await _authenticate(request) is None:
+        return _unauthorized()
+    try:
+        cache_key = f'{cache_prefix}_{pk}'
+        hits.record(cache_prefix, pk)
+        cached = await aget(cache_key)
+        if cached:
+            logger.debug(f"Returning cached {cache_prefix} with ID {pk}")
+            return _json(cached)
+
+        try:
+            instance = await model.objects.aget(pk=pk)
+        except model.DoesNotExist:
+            return _json({'detail': 'Not found.'}, status=404)
+        data = serializer_class(instance).data
+        await aset(cache_key, data, CACHE_TIMEOUT)
+        logger.debug(f"Caching {cache_prefix} with ID {pk}")
+        return _json(data)
+    except Exception as e:
+        logger.error(f"Error fetching {cache_prefix} with ID {pk}: {str(e)}")
+        return _json({'error': 'Internal server error'}, status=500)
+
+
+@max_queries(3)
+async def category_list(request):
+    return await _cached_list(request, Category, CategorySerializer, 'categories')
+
+
+@max_queries(2)
+async def category_detail(request, pk):
+    return await _cached_retrieve(request, Category, CategorySerializer, 'category', pk)
+
+
+@max_queries(3)
+async def product_list(request):
+    return await _cached_list(request, Product, ProductSerializer, 'products')
+
+
+@max_queries(2)
+async def product_detail(request, pk):
+    return await _cached_retrieve(request, Product, ProductSerializer, 'product', pk)
+
+
+@max_queries(3)
+async def stock_list(request):
+    return await _cached_list(request, Stock, StockSerializer, 'stock')
+
+
+@max_queries(2)
+async def stock_detail(request, pk):
+    return await _cached_retrieve(request, Stock, StockSerializer, 'stock', pk)
@@ -0,0 +1,138 @@
+"""
+Benchmarks for the inventory and auth hot paths.
+
+`run_benchmarks` seeds a synthetic catalogue into the current database and
+drives the real URL routes through the Django test client, recording latency
+percentiles, query counts and peak allocations per scenario. The
+`benchmark` management command runs it against a throwaway test database
+and writes the results as JSON so runs on different commits can be diffed.
+"""
+import random
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .models import Category, Product, Stock, User
+
+BENCH_PASSWORD = 'Bench@1234'
+
+
+def seed_catalogue(categories, products, seed=0):
+    """
+    Bulk-inserts `categories` categories, `products` products spread over
+    them and one stock row per product. Returns (category_ids, product_ids, stock_ids).
+    """
+    rng = random.Random(seed)
+    Category.objects.bulk_create(
+        Category(name=f'Category {i}', description=f'Synthetic category {i}') for i in range(categories)
+    )
+    category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+    Product.objects.bulk_create(
+        (Product(name=f'Product {i}', category_id=rng.choice(category_ids), price=Decimal(rng.randint(100, 99999)) / 100, description=f'Synthetic product {i}')
+         for i in range(products)),
+        batch_size=500,
+    )
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    Stock.objects.bulk_create(
+        (Stock(product_id=product_id, quantity=rng.randint(0, 500)) for product_id in product_ids),
+        batch_size=500,
+    )
+    stock_ids = list(Stock.objects.order_by('pk').values_list('pk', flat=True))
+    return category_ids, product_ids, stock_ids
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _measure(request, iterations, before=None):
+    """
+    Times `iterations` calls of `request()`; `before()` runs untimed ahead of
+    each call (e.g. to clear the cache for cold runs). A final extra call is
+    made under tracemalloc, which is too slow to leave on for the timed runs.
+    """
+    timings, queries = [], []
+    for _ in range(iterations):
+        if before:
+            before()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code < 400, f'{response.status_code}: {response.content[:200]}'
+        queries.append(len(ctx.captured_queries))
+
+    if before:
+        before()
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p90_ms': round(_percentile(timings, 90), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': max(queries),
+        'alloc_peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(categories=50, products=2000, iterations=200, login_iterations=10, seed=0):
+    category_ids, product_ids, stock_ids = seed_catalogue(categories, products, seed=seed)
+    user = User.objects.create_user(
+        username='bench@example.com', email='bench@example.com', password=BENCH_PASSWORD,
+        name='Bench User', first_name='Bench', last_name='User',
+        address='1 Bench Street', pin_code='000000', city='Benchville', country='Benchland',
+    )
+
+    client = Client()
+    rng = random.Random(seed)
+    results = {}
+
+    def login():
+        return client.post('/v1/api/login', {'email': user.email, 'password': BENCH_PASSWORD})
+
+    results['login'] = _measure(login, login_iterations)
+    token = login().json()['data']['access_token']
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    resources = (
+        ('categories', 'categories', category_ids),
+        ('item', 'products', product_ids),
+        ('stock', 'stock', stock_ids),
+    )
+    for route, name, ids in resources:
+        def list_request():
+            return client.get(f'/api/v1/{route}/', **headers)
+
+        results[f'{name}_list_cold'] = _measure(list_request, iterations, before=cache.clear)
+        cache.clear()
+        list_request()
+        results[f'{name}_list_warm'] = _measure(list_request, iterations)
+
+        # Same pseudo-random id sequence for every run with the same seed.
+        picks = [rng.choice(ids) for _ in range(iterations + 1)]
+        cold_picks, warm_picks = iter(picks), iter(picks)
+        results[f'{name}_retrieve_cold'] = _measure(
+            lambda: client.get(f'/api/v1/{route}/{next(cold_picks)}/', **headers), iterations, before=cache.clear)
+        for pk in set(picks):
+            client.get(f'/api/v1/{route}/{pk}/', **headers)
+        results[f'{name}_retrieve_warm'] = _measure(
+            lambda: client.get(f'/api/v1/{route}/{next(warm_picks)}/', **headers), iterations)
+
+    results['user_search'] = _measure(lambda: client.get('/api/v1/user_action/', {'email': user.email}, **headers), iterations)
+    return results
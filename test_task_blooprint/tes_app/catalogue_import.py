@@ -0,0 +1,269 @@
+"""
+Streaming catalogue import from CSV or NDJSON.
+
+Every row is one product: `name`, `category` (a category name, created when
+it does not exist yet), `price`, `description` and an optional `quantity`,
+which also creates the product's stock row. Rows are read one at a time,
+checked against the model fields' constraints and written in chunks of
+`batch_size`, one transaction per chunk. The chunk's progress is saved to
+its ImportJob in the same transaction, so an interrupted import resumes
+after the last committed chunk without duplicating rows, and memory use
+does not depend on the file size.
+
+Both steps skip the per-object work of the ORM, which capped imports at a
+few thousand rows per second: rows are checked with plain type and length
+tests rather than Field.clean(), and products and stock go in as multi-row
+INSERT ... RETURNING statements instead of bulk_create (whose per-field
+pre_save and prep calls were most of the time). Backends without
+RETURNING fall back to bulk_create.
+"""
+import csv
+import io
+import json
+import logging
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .inventory_cache import RESOURCES, list_cache_keys
+from .models import Category, ImportJob, Product, Stock
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+MAX_STORED_ERRORS = 100
+
+CatalogueRow = namedtuple('CatalogueRow', 'category name price description quantity')
+
+_TEXT_FIELDS = {
+    'category': Category._meta.get_field('name').max_length,
+    'name': Product._meta.get_field('name').max_length,
+    'description': None,
+}
+_price_field = Product._meta.get_field('price')
+_check_price_digits = DecimalValidator(_price_field.max_digits, _price_field.decimal_places)
+MAX_QUANTITY = 2147483647  # PositiveIntegerField's range on every backend
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(filename):
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+
+def iter_rows(stream, fmt):
+    """
+    Yields (line number, raw row) from a binary stream: dicts for CSV, the
+    undecoded line for NDJSON so a bad line fails its row rather than the file.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text, 1):
+            if line.strip():
+                yield line_number, line
+
+
+def _text(raw, name, max_length):
+    value = raw.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    elif value is not None:
+        raise RowError(f"{name}: Expected text.")
+    if not value:
+        raise RowError(f"{name}: This field cannot be blank.")
+    if max_length is not None and len(value) > max_length:
+        raise RowError(f"{name}: Ensure this value has at most {max_length} characters (it has {len(value)}).")
+    return value
+
+
+def _price(value):
+    if isinstance(value, str):
+        value = value.strip()
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    else:
+        raise RowError("price: This field cannot be blank." if value is None else "price: Expected a decimal number.")
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f"price: “{value}” value must be a decimal number.")
+    if not price.is_finite():
+        raise RowError(f"price: “{value}” value must be a decimal number.")
+    try:
+        _check_price_digits(price)
+    except ValidationError as e:
+        raise RowError(f"price: {' '.join(e.messages)}")
+    return price
+
+
+def _quantity(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isdigit():
+            raise RowError(f"quantity: “{value}” value must be a whole number of at least 0.")
+        value = int(value)
+    elif isinstance(value, bool) or not isinstance(value, int):
+        raise RowError(f"quantity: “{value}” value must be a whole number of at least 0.")
+    if not 0 <= value <= MAX_QUANTITY:
+        raise RowError(f"quantity: Ensure this value is between 0 and {MAX_QUANTITY}.")
+    return value
+
+
+def clean_row(raw):
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            raise RowError(f"invalid JSON: {e}")
+    if not isinstance(raw, dict):
+        raise RowError("expected an object")
+    texts = {name: _text(raw, name, max_length) for name, max_length in _TEXT_FIELDS.items()}
+    return CatalogueRow(price=_price(raw.get('price')), quantity=_quantity(raw.get('quantity')), **texts)
+
+
+def insert_returning_ids(model, columns, rows):
+    """
+    INSERTs `rows` (tuples of database-ready values for `columns`) with as
+    few multi-row statements as the backend's parameter limit allows, and
+    returns the new primary keys in order.
+    """
+    qn = connection.ops.quote_name
+    per_statement = max(1, (connection.features.max_query_params or 999) // len(columns))
+    head = f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(map(qn, columns))}) VALUES "
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), per_statement):
+            batch = rows[start:start + per_statement]
+            cursor.execute(
+                head + ', '.join([placeholders] * len(batch)) + f" RETURNING {qn(model._meta.pk.column)}",
+                [value for row in batch for value in row],
+            )
+            ids += [pk for pk, in cursor.fetchall()]
+    return ids
+
+
+class CatalogueImporter:
+
+    def __init__(self, job, batch_size=2000, progress=None):
+        self.job = job
+        self.batch_size = batch_size
+        self.progress = progress
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+
+    def run(self, stream):
+        """
+        Imports the rows of `stream` after the job's checkpoint. The job is
+        marked failed (and the exception re-raised) if a chunk cannot be
+        written; running again with the same job resumes.
+        """
+        job = self.job
+        rows, consumed, errors = [], 0, []
+        try:
+            for line_number, raw in islice(iter_rows(stream, job.format), job.rows_done, None):
+                consumed += 1
+                try:
+                    rows.append(clean_row(raw))
+                except RowError as e:
+                    errors.append({'line': line_number, 'error': str(e)})
+                if consumed >= self.batch_size:
+                    self._write(rows, consumed, errors)
+                    rows, consumed, errors = [], 0, []
+            if consumed:
+                self._write(rows, consumed, errors)
+        except Exception as e:
+            job.status = 'failed'
+            job.message = str(e)
+            job.save(update_fields=['status', 'message', 'updated_at'])
+            logger.error(f"Catalogue import {job.pk} failed after {job.rows_done} rows: {str(e)}")
+            raise
+        finally:
+            cache.delete_many([key for list_key in RESOURCES for key in list_cache_keys(list_key)])
+
+        job.status = 'done'
+        job.message = ''
+        job.save(update_fields=['status', 'message', 'updated_at'])
+        return job
+
+    def _write(self, rows, consumed, errors):
+        job = self.job
+        with transaction.atomic():
+            categories = dict(self.categories)
+            missing = list(dict.fromkeys(row.category for row in rows if row.category not in categories))
+            if missing:
+                Category.objects.bulk_create(Category(name=name, description='') for name in missing)
+                categories.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+
+            if connection.features.can_return_rows_from_bulk_insert:
+                self._insert(rows, categories)
+            else:
+                products = [
+                    Product(name=row.name, category_id=categories[row.category], price=row.price, description=row.description)
+                    for row in rows
+                ]
+                for product in products:  # Stock rows need the product ids
+                    product.save(force_insert=True)
+                Stock.objects.bulk_create(
+                    Stock(product=product, quantity=row.quantity)
+                    for product, row in zip(products, rows) if row.quantity is not None
+                )
+
+            job.rows_done += consumed
+            job.rows_imported += len(rows)
+            job.rows_failed += len(errors)
+            job.errors = (job.errors + errors)[:MAX_STORED_ERRORS]
+            job.save(update_fields=['rows_done', 'rows_imported', 'rows_failed', 'errors', 'updated_at'])
+        self.categories = categories
+        if self.progress:
+            self.progress(job)
+
+    def _insert(self, rows, categories):
+        # What bulk_create would write, with auto_now taken once per chunk.
+        # Prices are passed as Decimals, which every backend's driver adapts;
+        # clean_row already checked their digits.
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        product_ids = insert_returning_ids(Product, ('name', 'category_id', 'price', 'description', 'updated_at'), [
+            (row.name, categories[row.category], row.price, row.description, now) for row in rows
+        ])
+        insert_returning_ids(Stock, ('product_id', 'quantity', 'reorder_point', 'reserved', 'last_updated'), [
+            (product_id, row.quantity, 0, 0, now)
+            for product_id, row in zip(product_ids, rows) if row.quantity is not None
+        ])
+
+
+def import_catalogue(stream, fmt, source, job=None, batch_size=2000, progress=None):
+    """
+    Starts a new ImportJob for `stream`, or resumes `job` from its checkpoint.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    if job is None:
+        job = ImportJob.objects.create(source=source[:255], format=fmt)
+    elif job.status == 'done':
+        raise ValueError(f"Import {job.pk} has already finished")
+    elif job.format != fmt:
+        raise ValueError(f"Import {job.pk} was started as {job.format}, not {fmt}")
+    else:
+        job.status = 'running'
+        job.save(update_fields=['status', 'updated_at'])
+    return CatalogueImporter(job, batch_size=batch_size, progress=progress).run(stream)
@@ -0,0 +1,154 @@
+"""
+Incremental change feed for inventory clients.
+
+A sync token is a point in time (microseconds since the epoch), taken from
+the database clock. `changes_since` returns the categories, products and
+stock rows updated at or after it, and the tombstones of those deleted since,
+together with the token for the next call. The timestamps are set by
+database triggers (migration `0010_database_timestamps`), not by `auto_now`,
+so tokens and rows come from the same clock whichever server wrote them.
+
+A row is stamped when it is written but only visible once its transaction
+commits, so each call re-reads CHANGE_FEED_OVERLAP seconds before the token;
+it must be longer than any write transaction, or rows committed after the
+previous call with an earlier timestamp are missed. Clients apply changes as
+idempotent upserts, so the overlap is harmless. Tombstones
+are kept for CHANGE_FEED_RETENTION_DAYS; older tokens must resync from the
+full lists.
+
+A call returns at most CHANGE_FEED_LIMIT rows and tombstones. When there are
+more, `has_more` is set and `next_token` is a continuation token: the
+original time, the database time the first page was read at, and the
+(timestamp, pk) of the last row returned. The token after the last page is
+that first read time, so changes made while paging are picked up next time.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.db.models.sql import Query
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Category, Product, Stock, Tombstone
+from .serialization import CategorySerializer, ProductSerializer, StockSerializer
+
+# Response key -> (model, serializer, timestamp field, tombstone model name)
+FEEDS = {
+    'categories': (Category, CategorySerializer, 'updated_at', 'category'),
+    'products': (Product, ProductSerializer, 'updated_at', 'product'),
+    'stock': (Stock, StockSerializer, 'last_updated', 'stock'),
+}
+# Read in this order, tombstones last; a continuation token holds the index.
+_SOURCES = [(key, model, field) for key, (model, _, field, _) in FEEDS.items()] + [('deleted', Tombstone, 'deleted_at')]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class TokenExpired(ValueError):
+    pass
+
+
+def _micros(moment):
+    delta = moment - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def make_token(moment):
+    return str(_micros(moment))
+
+
+def _continuation_token(since, started, source, last=None):
+    parts = [_micros(since), _micros(started), source]
+    if last is not None:
+        parts += [_micros(last[0]), last[1]]
+    return '.'.join(map(str, parts))
+
+
+def parse_token(token):
+    """
+    (since, first page read at, source index, (timestamp, pk) of the last row
+    returned) of a token; the last three are None, 0, None for a plain token.
+    """
+    try:
+        parts = [int(part) for part in token.split('.')]
+        moments = [_EPOCH + timedelta(microseconds=value) for value in parts[:2]]
+        if len(parts) == 1:
+            return moments[0], None, 0, None
+        if len(parts) in (3, 5) and 0 <= parts[2] < len(_SOURCES):
+            last = (_EPOCH + timedelta(microseconds=parts[3]), parts[4]) if len(parts) == 5 else None
+            return moments[0], moments[1], parts[2], last
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        pass
+    raise InvalidToken(f"Invalid sync token {token!r}")
+
+
+def database_now(using='default'):
+    """
+    The database's clock, the one the timestamp triggers stamp rows with, so
+    tokens do not depend on which web server's clock handed them out.
+    """
+    connection = connections[using]
+    sql, params = Query(None).get_compiler(connection=connection).compile(Now())
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {sql}', params)
+        value = cursor.fetchone()[0]
+    if isinstance(value, str):  # SQLite
+        value = parse_datetime(value)
+    return value if timezone.is_aware(value) else timezone.make_aware(value, dt_timezone.utc)
+
+
+def prune_tombstones():
+    """Drops expired tombstones, at most once an hour per process."""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < 3600:
+            return
+        _last_prune = time.monotonic()
+    Tombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS)).delete()
+
+
+def changes_since(token, limit=None):
+    since, started, position, last = parse_token(token)
+    now = database_now(Stock.objects.db)
+    if since < now - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS):
+        raise TokenExpired("Sync token is older than the change feed retention, resync from the full lists")
+    prune_tombstones()
+
+    started = started or now
+    remaining = limit or settings.CHANGE_FEED_LIMIT
+    read_from = since - timedelta(seconds=settings.CHANGE_FEED_OVERLAP)
+    changes = {'next_token': make_token(started), 'has_more': False}
+    changes.update({key: [] for key in FEEDS}, deleted={key: [] for key in FEEDS})
+    names = {name: key for key, (_, _, _, name) in FEEDS.items()}
+    for index, (key, model, field) in enumerate(_SOURCES):
+        if index < position:
+            continue
+        rows = model.objects.filter(**{f'{field}__gte': read_from})
+        if index == position and last is not None:
+            rows = rows.filter(Q(**{f'{field}__gt': last[0]}) | Q(**{field: last[0], 'pk__gt': last[1]}))
+        rows = list(rows.order_by(field, 'pk')[:remaining + 1])
+        if len(rows) > remaining:
+            rows = rows[:remaining]
+            changes.update(has_more=True, next_token=_continuation_token(
+                since, started, index, (getattr(rows[-1], field), rows[-1].pk) if rows else None,
+            ))
+        if key == 'deleted':
+            for tombstone in rows:
+                changes['deleted'][names[tombstone.model]].append(tombstone.object_id)
+        else:
+            changes[key] = FEEDS[key][1](rows, many=True).data
+        remaining -= len(rows)
+        if changes['has_more']:
+            break
+    return changes
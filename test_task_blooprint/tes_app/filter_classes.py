@@ -1,23 +1,70 @@
+import string
+import sys
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django_filters import rest_framework as filters
 from tes_app.models import User
 
 class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
     pass
 
+# Fields searchable by case-insensitive prefix, each backed by an index on
+# Lower(field) (see User.Meta.indexes)
+PREFIX_FIELDS = ('email', 'name', 'city', 'country')
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def lower(value, vendor):
+    """`value` lowered the way the database's LOWER() does it: SQLite only lowers ASCII."""
+    return value.translate(_ASCII_LOWER) if vendor == 'sqlite' else value.lower()
+
+def next_prefix(value):
+    """The smallest string above every string starting with `value`, or None if there is none."""
+    value = value.rstrip(chr(sys.maxunicode))
+    if not value:
+        return None
+    following = ord(value[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:  # Surrogates cannot be stored
+        following = 0xE000
+    return value[:-1] + chr(following)
+
+def lower_prefix(field, value, vendor):
+    """
+    Q matching rows whose Lower(field) starts with `value`. The range lets
+    SQLite and PostgreSQL seek the Lower() index (neither uses one for LIKE
+    on an expression by default); the LIKE keeps the match exact.
+    """
+    value = lower(value, vendor)
+    lowered = f'{field}_lower'
+    query = Q(**{f'{lowered}__gte': value, f'{lowered}__startswith': value})
+    upper = next_prefix(value)
+    return query & Q(**{f'{lowered}__lt': upper}) if upper is not None else query
+
+def with_lower_fields(queryset):
+    return queryset.alias(**{f'{field}_lower': Lower(field) for field in PREFIX_FIELDS})
+
 class UserFilterClass(filters.FilterSet):
     user_id = NumberInFilter(field_name='id', lookup_expr='in', required=False, distinct=True)
-    user_email = filters.CharFilter(method='filter_user_email',required=False),
-    user_name = filters.CharFilter(method='filter_user_name',required=False),
+    email = filters.CharFilter(method='filter_prefix', required=False)
+    name = filters.CharFilter(method='filter_prefix', required=False)
+    city = filters.CharFilter(method='filter_prefix', required=False)
+    country = filters.CharFilter(method='filter_prefix', required=False)
+    search = filters.CharFilter(method='filter_search', required=False)
 
     class Meta:
         model = User
-        fields = ["id", 'email', 'name']
-
-    def filter_user_email(self,querset, name, value):
-        querset = querset.filter(user_email__email=value)
-        return querset
+        fields = ["id"]
 
-    def filter_user_name(self,querset, name, value):
-        querset = querset.filter(user_name__name=value)
-        return querset
+    def filter_prefix(self, queryset, name, value):
+        return with_lower_fields(queryset).filter(lower_prefix(name, value, connections[queryset.db].vendor))
 
+    def filter_search(self, queryset, name, value):
+        # Any of the fields. Each branch of the OR seeks its own index; as a
+        # subquery, so ordering by id does not tempt SQLite into a table scan.
+        users = with_lower_fields(User.objects.all())
+        query = Q()
+        for field in PREFIX_FIELDS:
+            query |= lower_prefix(field, value, connections[users.db].vendor)
+        return queryset.filter(pk__in=users.filter(query).values('pk'))
@@ -0,0 +1,230 @@
+"""
+Cache keys, hit tracking and warming for the inventory endpoints.
+
+List responses are cached per page for the first CACHED_LIST_PAGES pages of
+the default page size ('categories' for the first page, 'categories_offset_10'
+for the second, ...); other page sizes and filtered lists bypass the cache.
+Detail responses are cached as '<prefix>_<pk>'. Detail reads are counted so
+`warm_inventory_cache` can repopulate the hottest entries first.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import close_old_connections
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .models import Category, Product, Stock
+from .serialization import CategorySerializer, ProductSerializer, StockSerializer
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = 60 * 15  # 15 minutes
+
+# list cache key -> (detail key prefix, model, serializer, URL path)
+RESOURCES = {
+    'categories': ('category', Category, CategorySerializer, '/api/v1/categories/'),
+    'products': ('product', Product, ProductSerializer, '/api/v1/item/'),
+    'stock': ('stock', Stock, StockSerializer, '/api/v1/stock/'),
+}
+
+
+def list_page_key(list_key, offset):
+    return list_key if offset == 0 else f'{list_key}_offset_{offset}'
+
+
+def list_cache_keys(list_key):
+    """Every cached page of a list, for invalidation."""
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    return [list_page_key(list_key, page * page_size) for page in range(settings.CACHED_LIST_PAGES)]
+
+
+def list_cache_key(list_key, request):
+    """
+    Cache key for this list request, or None when it is not one of the
+    cached pages (custom limit, filters, deep offsets).
+    """
+    params = request.query_params
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    if set(params) - {'limit', 'offset'} or params.get('limit', str(page_size)) != str(page_size):
+        return None
+    offset = params.get('offset', '0')
+    if not offset.isdigit() or int(offset) % page_size or int(offset) >= page_size * settings.CACHED_LIST_PAGES:
+        return None
+    return list_page_key(list_key, int(offset))
+
+
+class HitCounter:
+    """
+    Counts detail reads per resource. Counts are buffered in process and
+    flushed as one pipelined ZINCRBY batch (a plain cached dict on non-Redis
+    backends), so tracking costs no extra round trip per request.
+    """
+
+    def __init__(self, flush_every=500, flush_interval=10):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+
+    def record(self, prefix, pk):
+        with self._lock:
+            self._pending[(prefix, str(pk))] += 1
+            due = len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            if isinstance(caches['default'], RedisCache):
+                breaker = getattr(cache.client, 'breaker', None)
+                if breaker is not None and breaker.is_open:
+                    return
+                pipeline = get_redis_connection('default').pipeline(transaction=False)
+                for (prefix, pk), count in pending.items():
+                    pipeline.zincrby(cache.make_key(f'hits_{prefix}'), count, pk)
+                pipeline.execute()
+            else:
+                for prefix in {prefix for prefix, _ in pending}:
+                    counts = cache.get(f'hits_{prefix}') or {}
+                    for (hit_prefix, pk), count in pending.items():
+                        if hit_prefix == prefix:
+                            counts[pk] = counts.get(pk, 0) + count
+                    cache.set(f'hits_{prefix}', counts, timeout=None)
+        except Exception as e:
+            logger.error(f"Error flushing cache hit counts: {str(e)}")
+
+    def top(self, prefix, n):
+        """The `n` most requested primary keys of a resource, hottest first."""
+        self.flush()
+        if isinstance(caches['default'], RedisCache):
+            return [int(pk) for pk in get_redis_connection('default').zrevrange(cache.make_key(f'hits_{prefix}'), 0, n - 1)]
+        counts = cache.get(f'hits_{prefix}') or {}
+        return [int(pk) for pk, _ in Counter(counts).most_common(n)]
+
+
+hits = HitCounter()
+
+
+def parse_ids(value):
+    """Distinct ids of a comma separated `ids` parameter, in request order. Raises ValueError."""
+    return list(dict.fromkeys(int(pk) for pk in value.split(',') if pk.strip()))
+
+
+def get_details(prefix, model, serializer_class, pks):
+    """
+    Detail payloads for `pks` in order, read with one get_many; misses are
+    loaded with one pk__in query and written back with one set_many.
+    Returns (payloads, ids that do not exist).
+    """
+    keys = {pk: f'{prefix}_{pk}' for pk in pks}
+    cached = cache.get_many(list(keys.values()))
+    payloads = {pk: cached[keys[pk]] for pk in pks if keys[pk] in cached}
+    misses = [pk for pk in pks if pk not in payloads]
+    if misses:
+        objects = list(model.objects.filter(pk__in=misses))
+        loaded = dict(zip((obj.pk for obj in objects), serializer_class(objects, many=True).data))
+        if loaded:
+            cache.set_many({keys[pk]: data for pk, data in loaded.items()}, timeout=CACHE_TIMEOUT)
+        payloads.update(loaded)
+    for pk in pks:
+        hits.record(prefix, pk)
+    return [payloads[pk] for pk in pks if pk in payloads], [pk for pk in pks if pk not in payloads]
+
+
+def build_list_pages(list_key, base_url, pages):
+    """
+    The cached payloads of the first `pages` list pages, built the same way
+    ListModelMixin does so they are identical to what the viewsets cache.
+    Pagination links point at `base_url`, whose host must be in ALLOWED_HOSTS.
+    """
+    prefix, model, serializer_class, path = RESOURCES[list_key]
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    base = urlsplit(base_url)
+    factory = APIRequestFactory()
+    payloads = {}
+    for page in range(pages):
+        offset = page * page_size
+        request = Request(factory.get(path, {'offset': offset} if offset else {}, HTTP_HOST=base.netloc, secure=base.scheme == 'https'))
+        paginator = LimitOffsetPagination()
+        rows = paginator.paginate_queryset(model.objects.order_by('pk'), request)
+        payloads[list_page_key(list_key, offset)] = paginator.get_paginated_response(serializer_class(rows, many=True).data).data
+        if offset + page_size >= paginator.count:
+            break
+    return payloads
+
+
+def _warm_details(prefix, model, serializer_class, pks):
+    try:
+        objects = model.objects.in_bulk(pks)
+        payloads = {f'{prefix}_{pk}': serializer_class(objects[pk]).data for pk in pks if pk in objects}
+        cache.set_many(payloads, timeout=CACHE_TIMEOUT)
+        return len(payloads)
+    finally:
+        close_old_connections()
+
+
+def warm_resource(list_key, base_url='http://localhost:8000', pages=None, top=100, concurrency=4, batch_size=100, progress=None):
+    """
+    Warms the list pages and the `top` hottest detail entries of one resource
+    (topped up with the lowest ids when fewer have been requested). Details
+    are written in batches with set_many, at most `concurrency` at a time.
+    """
+    prefix, model, serializer_class, _ = RESOURCES[list_key]
+    pages = settings.CACHED_LIST_PAGES if pages is None else pages
+
+    list_pages = build_list_pages(list_key, base_url, pages)
+    cache.set_many(list_pages, timeout=CACHE_TIMEOUT)
+    if progress:
+        progress(f"{list_key}: {len(list_pages)} list pages warmed")
+
+    pks = hits.top(prefix, top)
+    if len(pks) < top:
+        pks += list(model.objects.exclude(pk__in=pks).order_by('pk').values_list('pk', flat=True)[:top - len(pks)])
+    batches = [pks[i:i + batch_size] for i in range(0, len(pks), batch_size)]
+
+    warmed = 0
+    if concurrency <= 1:
+        for batch in batches:
+            warmed += _warm_details(prefix, model, serializer_class, batch)
+            if progress:
+                progress(f"{list_key}: {warmed}/{len(pks)} detail entries warmed")
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(_warm_details, prefix, model, serializer_class, batch) for batch in batches]
+            for future in as_completed(futures):
+                warmed += future.result()
+                if progress:
+                    progress(f"{list_key}: {warmed}/{len(pks)} detail entries warmed")
+    return len(list_pages), warmed
+
+
+def warm_on_startup():
+    """
+    Warms every resource in a background thread, so a freshly started worker
+    doesn't send its first wave of traffic to a cold database.
+    """
+    def run():
+        for list_key in RESOURCES:
+            try:
+                warm_resource(list_key, base_url=settings.CACHE_WARM_BASE_URL, concurrency=1)
+            except Exception as e:
+                logger.error(f"Error warming {list_key} cache on startup: {str(e)}")
+        close_old_connections()
+
+    threading.Thread(target=run, name='cache-warmer', daemon=True).start()
@@ -0,0 +1,105 @@
+"""
+Streaming export of the Stock ⋈ Product ⋈ Category join.
+
+Rows come from a single joined query read with `.iterator()` (a server-side
+cursor on PostgreSQL), and are rendered chunk by chunk as CSV, NDJSON or
+columnar NDJSON: one JSON object per chunk holding a list per column,
+the layout of a Parquet row group. Memory stays constant however many rows
+are exported.
+
+Under ASGI Django reads a sync iterator given to StreamingHttpResponse to the
+end before sending anything, so the API streams aexport_inventory there.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Stock
+
+COLUMNS = (
+    'stock_id', 'quantity', 'last_updated',
+    'product_id', 'product_name', 'price', 'product_description',
+    'category_id', 'category_name',
+)
+_FIELDS = (
+    'pk', 'quantity', 'last_updated',
+    'product_id', 'product__name', 'product__price', 'product__description',
+    'product__category_id', 'product__category__name',
+)
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/x-ndjson',
+}
+EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'columnar': 'columnar.ndjson'}
+
+
+def export_rows(since=None, chunk_size=2000):
+    queryset = Stock.objects.order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(last_updated__gte=since)
+    return queryset.values_list(*_FIELDS).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """csv.writer target that hands each formatted line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+
+
+def _render_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def _render_columnar(rows, chunk_size):
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        columns = dict(zip(COLUMNS, map(list, zip(*chunk))))
+        yield json.dumps({'rows': len(chunk), 'columns': columns}, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_inventory(fmt, since=None, chunk_size=2000):
+    """
+    Iterator of text chunks of the export in `fmt` (a key of FORMATS). Only
+    stock updated at or after `since` is included when it is given.
+    """
+    rows = export_rows(since, chunk_size)
+    if fmt == 'csv':
+        return _render_csv(rows)
+    if fmt == 'ndjson':
+        return _render_ndjson(rows)
+    if fmt == 'columnar':
+        return _render_columnar(rows, chunk_size)
+    raise ValueError(f"Unsupported format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def _take(chunks, count):
+    return ''.join(islice(chunks, count))
+
+
+async def aexport_inventory(fmt, since=None, chunk_size=2000, chunks_per_read=100):
+    """
+    Async iterator of the same export, for ASGI responses. The sync iterator
+    is advanced `chunks_per_read` chunks at a time through sync_to_async, so
+    the cursor stays in the request's sync thread.
+    """
+    chunks = export_inventory(fmt, since, chunk_size)
+    try:
+        while text := await sync_to_async(_take)(chunks, chunks_per_read):
+            yield text
+    finally:
+        await sync_to_async(chunks.close)()
@@ -1,34 +1,75 @@
 from rest_framework import viewsets
-from .models import Category, Product, Stock
-from .serialization import CategorySerializer, ProductSerializer, StockSerializer
+from rest_framework.decorators import action
+from .models import Category, LowStockAlert, Product, Reservation, Stock
+from .serialization import CategorySerializer, ProductSerializer, StockSerializer, CatalogueImportSerializer, ImportJobSerializer, LowStockAlertSerializer, StockAvailabilitySerializer, ReservationSerializer, CreateReservationSerializer
 import logging
+from django.conf import settings
 from django.core.cache import cache
 from rest_framework import status
 from rest_framework.response import Response
-from drf_yasg.utils import swagger_auto_schema
+from lib.api_docs import openapi, swagger_auto_schema
 from rest_framework import permissions
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from lib.db_router import primary_only
+from lib.query_budget import max_queries
+from rest_framework.generics import GenericAPIView
+from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
+from .catalogue_import import guess_format, import_catalogue
+from .inventory_export import EXTENSIONS, FORMATS as EXPORT_FORMATS, aexport_inventory, export_inventory
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ImportJob
+from .change_feed import InvalidToken, TokenExpired, changes_since, database_now, make_token
+from .inventory_cache import CACHE_TIMEOUT, get_details, hits, list_cache_key, list_cache_keys, parse_ids
+from .search import SearchResults
+from .reservations import InsufficientStock, ReservationError, confirm, expired_holds, release, reserve
 
 logger = logging.getLogger(__name__)
 
+ids_parameter = openapi.Parameter(
+    'ids', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+    description="Comma separated ids to fetch in one call, instead of a page; returned in this order",
+)
+
+
+def batch_retrieve(ids, cache_prefix, model, serializer_class):
+    """
+    Response for `?ids=`: the cached detail payloads, one get_many plus one
+    query for the misses (see inventory_cache.get_details).
+    """
+    try:
+        pks = parse_ids(ids)
+    except ValueError:
+        return Response({'ids': ['Expected comma separated ids.']}, status=status.HTTP_400_BAD_REQUEST)
+    if not pks or len(pks) > settings.INVENTORY_BATCH_MAX_IDS:
+        return Response({'ids': [f'Expected 1 to {settings.INVENTORY_BATCH_MAX_IDS} ids.']}, status=status.HTTP_400_BAD_REQUEST)
+    results, missing = get_details(cache_prefix, model, serializer_class, pks)
+    return Response({'results': results, 'missing': missing})
+
 class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+    queryset = Category.objects.order_by('pk')  # The order warm_inventory_cache pages in
     serializer_class = CategorySerializer
     permission_classes = (permissions.IsAuthenticated,)
     authentication_classes = (JWTAuthentication,)
 
     # List all categories
     @swagger_auto_schema(tags=['Inventry Category'])
+    @max_queries(3)
     def list(self, request, *args, **kwargs):
         try:
-            cached_categories = cache.get('categories')
+            cache_key = list_cache_key('categories', request)
+            cached_categories = cache.get(cache_key) if cache_key else None
             if cached_categories:
-                logger.info("Returning cached categories")
+                logger.debug("Returning cached categories")
                 return Response(cached_categories)
 
             response = super().list(request, *args, **kwargs)
-            cache.set('categories', response.data, timeout=60 * 15)  # Cache for 15 minutes
-            logger.info("Caching category list")
+            if cache_key:
+                cache.set(cache_key, response.data, timeout=CACHE_TIMEOUT)
+            logger.debug("Caching category list")
             return response
         except Exception as e:
             logger.error(f"Error fetching category list: {str(e)}")
@@ -36,17 +77,19 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
     # Retrieve a single category
     @swagger_auto_schema(tags=['Inventry Category'])
+    @max_queries(2)
     def retrieve(self, request, *args, **kwargs):
         try:
             category_id = kwargs.get('pk')
+            hits.record('category', category_id)
             cached_category = cache.get(f'category_{category_id}')
             if cached_category:
-                logger.info(f"Returning cached category with ID {category_id}")
+                logger.debug(f"Returning cached category with ID {category_id}")
                 return Response(cached_category)
 
             response = super().retrieve(request, *args, **kwargs)
-            cache.set(f'category_{category_id}', response.data, timeout=60 * 15)
-            logger.info(f"Caching category with ID {category_id}")
+            cache.set(f'category_{category_id}', response.data, timeout=CACHE_TIMEOUT)
+            logger.debug(f"Caching category with ID {category_id}")
             return response
         except Exception as e:
             logger.error(f"Error fetching category with ID {category_id}: {str(e)}")
@@ -54,10 +97,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
     # Create a new category
     @swagger_auto_schema(tags=['Inventry Category'])
+    @max_queries(3)
     def create(self, request, *args, **kwargs):
         try:
             response = super().create(request, *args, **kwargs)
-            cache.delete('categories')  # Invalidate cached category list after creation
+            cache.delete_many(list_cache_keys('categories'))  # Invalidate cached category list after creation
             logger.info("Category created and cache invalidated for category list")
             return response
         except Exception as e:
@@ -66,12 +110,13 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
     # Update a category
     @swagger_auto_schema(tags=['Inventry Category'])
+    @max_queries(4)
     def update(self, request, *args, **kwargs):
         try:
             response = super().update(request, *args, **kwargs)
             category_id = kwargs.get('pk')
             cache.delete(f'category_{category_id}')  # Invalidate cached category
-            cache.delete('categories')  # Invalidate category list cache
+            cache.delete_many(list_cache_keys('categories'))  # Invalidate category list cache
             logger.info(f"Category with ID {category_id} updated and cache invalidated")
             return response
         except Exception as e:
@@ -85,7 +130,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
             category_id = kwargs.get('pk')
             response = super().destroy(request, *args, **kwargs)
             cache.delete(f'category_{category_id}')  # Invalidate cached category
-            cache.delete('categories')  # Invalidate category list cache
+            cache.delete_many(list_cache_keys('categories'))  # Invalidate category list cache
             logger.info(f"Category with ID {category_id} deleted and cache invalidated")
             return response
         except Exception as e:
@@ -94,20 +139,25 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    queryset = Product.objects.order_by('pk')  # The order warm_inventory_cache pages in
     serializer_class = ProductSerializer
     permission_classes = (permissions.IsAuthenticated,)
     authentication_classes = (JWTAuthentication,)
 
-    @swagger_auto_schema(tags=['Inventry Item'])
+    @swagger_auto_schema(tags=['Inventry Item'], manual_parameters=[ids_parameter])
+    @max_queries(3)
     def list(self, request, *args, **kwargs):
         try:
-            cached_products = cache.get('products')
+            if 'ids' in request.query_params:
+                return batch_retrieve(request.query_params['ids'], 'product', Product, ProductSerializer)
+            cache_key = list_cache_key('products', request)
+            cached_products = cache.get(cache_key) if cache_key else None
             if cached_products:
                 return Response(cached_products)
 
             response = super().list(request, *args, **kwargs)
-            cache.set('products', response.data, timeout=60 * 15)
+            if cache_key:
+                cache.set(cache_key, response.data, timeout=CACHE_TIMEOUT)
             return response
         except Exception as e:
             logger.error(f"Error fetching products: {str(e)}")
@@ -117,28 +167,45 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
 
     @swagger_auto_schema(tags=['Inventry Item'])
+    @max_queries(2)
     def retrieve(self, request, *args, **kwargs):
         try:
             product_id = kwargs.get('pk')
+            hits.record('product', product_id)
             cached_product = cache.get(f'product_{product_id}')
             if cached_product:
-                logger.info(f"Returning cached product with ID {product_id}")
+                logger.debug(f"Returning cached product with ID {product_id}")
                 return Response(cached_product)
 
             response = super().retrieve(request, *args, **kwargs)
-            cache.set(f'product_{product_id}', response.data, timeout=60 * 15)
-            logger.info(f"Caching product with ID {product_id}")
+            cache.set(f'product_{product_id}', response.data, timeout=CACHE_TIMEOUT)
+            logger.debug(f"Caching product with ID {product_id}")
             return response
         except Exception as e:
             logger.error(f"Error fetching product with ID {kwargs.get('pk')}: {str(e)}")
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(
+        tags=['Inventry Item'],
+        manual_parameters=[openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Words matched against name, category and description; the last one also as a prefix")],
+    )
+    @action(detail=False, methods=['get'])
+    @max_queries(3)
+    def search(self, request):
+        try:
+            page = self.paginate_queryset(SearchResults(request.query_params.get('q', '')))
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        except Exception as e:
+            logger.error(f"Error searching products: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     # Create a new product
     @swagger_auto_schema(tags=['Inventry Item'])
+    @max_queries(3)
     def create(self, request, *args, **kwargs):
         try:
             response = super().create(request, *args, **kwargs)
-            cache.delete('products')  # Invalidate cached product list after creation
+            cache.delete_many(list_cache_keys('products'))  # Invalidate cached product list after creation
             logger.info("Product created and cache invalidated for product list")
             return response
         except Exception as e:
@@ -147,12 +214,13 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     # Update a product
     @swagger_auto_schema(tags=['Inventry Item'])
+    @max_queries(4)
     def update(self, request, *args, **kwargs):
         try:
             response = super().update(request, *args, **kwargs)
             product_id = kwargs.get('pk')
             cache.delete(f'product_{product_id}')  # Invalidate cached product
-            cache.delete('products')  # Invalidate product list cache
+            cache.delete_many(list_cache_keys('products'))  # Invalidate product list cache
             logger.info(f"Product with ID {product_id} updated and cache invalidated")
             return response
         except Exception as e:
@@ -166,7 +234,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             product_id = kwargs.get('pk')
             response = super().destroy(request, *args, **kwargs)
             cache.delete(f'product_{product_id}')  # Invalidate cached product
-            cache.delete('products')  # Invalidate product list cache
+            cache.delete_many(list_cache_keys('products'))  # Invalidate product list cache
             logger.info(f"Product with ID {product_id} deleted and cache invalidated")
             return response
         except Exception as e:
@@ -174,23 +242,28 @@ class ProductViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class StockViewSet(viewsets.ModelViewSet):
-    queryset = Stock.objects.all()
+    queryset = Stock.objects.order_by('pk')  # The order warm_inventory_cache pages in
     serializer_class = StockSerializer
     permission_classes = (permissions.IsAuthenticated,)
     authentication_classes = (JWTAuthentication,)
 
     # List all stock items
-    @swagger_auto_schema(tags=['Inventry Stock'])
+    @swagger_auto_schema(tags=['Inventry Stock'], manual_parameters=[ids_parameter])
+    @max_queries(3)
     def list(self, request, *args, **kwargs):
         try:
-            cached_stock = cache.get('stock')
+            if 'ids' in request.query_params:
+                return batch_retrieve(request.query_params['ids'], 'stock', Stock, StockSerializer)
+            cache_key = list_cache_key('stock', request)
+            cached_stock = cache.get(cache_key) if cache_key else None
             if cached_stock:
-                logger.info("Returning cached stock list")
+                logger.debug("Returning cached stock list")
                 return Response(cached_stock)
 
             response = super().list(request, *args, **kwargs)
-            cache.set('stock', response.data, timeout=60 * 15)  # Cache for 15 minutes
-            logger.info("Caching stock list")
+            if cache_key:
+                cache.set(cache_key, response.data, timeout=CACHE_TIMEOUT)
+            logger.debug("Caching stock list")
             return response
         except Exception as e:
             logger.error(f"Error fetching stock list: {str(e)}")
@@ -198,42 +271,73 @@ class StockViewSet(viewsets.ModelViewSet):
 
     # Retrieve a single stock item
     @swagger_auto_schema(tags=['Inventry Stock'])
+    @max_queries(2)
     def retrieve(self, request, *args, **kwargs):
         try:
             stock_id = kwargs.get('pk')
+            hits.record('stock', stock_id)
             cached_stock_item = cache.get(f'stock_{stock_id}')
             if cached_stock_item:
-                logger.info(f"Returning cached stock item with ID {stock_id}")
+                logger.debug(f"Returning cached stock item with ID {stock_id}")
                 return Response(cached_stock_item)
 
             response = super().retrieve(request, *args, **kwargs)
-            cache.set(f'stock_{stock_id}', response.data, timeout=60 * 15)
-            logger.info(f"Caching stock item with ID {stock_id}")
+            cache.set(f'stock_{stock_id}', response.data, timeout=CACHE_TIMEOUT)
+            logger.debug(f"Caching stock item with ID {stock_id}")
             return response
         except Exception as e:
             logger.error(f"Error fetching stock item with ID {stock_id}: {str(e)}")
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    # Create a new stock entry
+    @swagger_auto_schema(tags=['Inventry Stock'], responses={200: LowStockAlertSerializer(many=True)})
+    @action(detail=False, methods=['get'])
+    @max_queries(3)
+    def low(self, request):
+        try:
+            alerts = LowStockAlert.objects.select_related('stock__product').order_by('-created_at', 'pk')
+            page = self.paginate_queryset(alerts)
+            return self.get_paginated_response(LowStockAlertSerializer(page, many=True).data)
+        except Exception as e:
+            logger.error(f"Error fetching low stock alerts: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # Live quantity, reserved and available units, never cached and read from
+    # the primary; holds that expired but were not swept yet no longer count
+    @swagger_auto_schema(tags=['Inventry Stock'], responses={200: StockAvailabilitySerializer()})
+    @action(detail=True, methods=['get'])
+    @primary_only
+    @max_queries(3)
+    def availability(self, request, pk=None):
+        stock = self.get_object()
+        try:
+            stock.reserved -= expired_holds(stock.pk)
+            return Response(StockAvailabilitySerializer(stock).data)
+        except Exception as e:
+            logger.error(f"Error fetching availability of stock item with ID {pk}: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # Create a new stock entry (one more query when it opens a low-stock alert)
     @swagger_auto_schema(tags=['Inventry Stock'])
+    @max_queries(4)
     def create(self, request, *args, **kwargs):
         try:
             response = super().create(request, *args, **kwargs)
-            cache.delete('stock')  # Invalidate cached stock list after creation
+            cache.delete_many(list_cache_keys('stock'))  # Invalidate cached stock list after creation
             logger.info("Stock item created and cache invalidated for stock list")
             return response
         except Exception as e:
             logger.error(f"Error creating stock item: {str(e)}")
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    # Update a stock entry
+    # Update a stock entry (one more query when it crosses the reorder point)
     @swagger_auto_schema(tags=['Inventry Stock'])
+    @max_queries(5)
     def update(self, request, *args, **kwargs):
         try:
             response = super().update(request, *args, **kwargs)
             stock_id = kwargs.get('pk')
             cache.delete(f'stock_{stock_id}')  # Invalidate cached stock item
-            cache.delete('stock')  # Invalidate stock list cache
+            cache.delete_many(list_cache_keys('stock'))  # Invalidate stock list cache
             logger.info(f"Stock item with ID {stock_id} updated and cache invalidated")
             return response
         except Exception as e:
@@ -247,9 +351,178 @@ class StockViewSet(viewsets.ModelViewSet):
             stock_id = kwargs.get('pk')
             response = super().destroy(request, *args, **kwargs)
             cache.delete(f'stock_{stock_id}')  # Invalidate cached stock item
-            cache.delete('stock')  # Invalidate stock list cache
+            cache.delete_many(list_cache_keys('stock'))  # Invalidate stock list cache
             logger.info(f"Stock item with ID {stock_id} deleted and cache invalidated")
             return response
         except Exception as e:
             logger.error(f"Error deleting stock item with ID {stock_id}: {str(e)}")
-            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ReservationViewSet(viewsets.GenericViewSet):
+    """
+    Checkout holds on stock (see tes_app/reservations.py): create one, then
+    confirm it to sell the units or release it to give them back. Holds not
+    settled within their TTL expire. Users see their own holds, staff all.
+    """
+    queryset = Reservation.objects.all()
+    serializer_class = ReservationSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (JWTAuthentication,)
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):  # Schema generation, no request
+            return Reservation.objects.none()
+        if self.request.user.is_staff:
+            return self.queryset
+        return self.queryset.filter(user=self.request.user)
+
+    # Hold units of a stock row; 409 when fewer are available. Twice the
+    # queries when the row's expired holds have to be swept and it is retried
+    @swagger_auto_schema(tags=['Inventry Stock'], request_body=CreateReservationSerializer, responses={201: ReservationSerializer()})
+    @max_queries(16)
+    def create(self, request, *args, **kwargs):
+        serializer = CreateReservationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            reservation = reserve(data['stock'], data['quantity'], data.get('ttl', settings.RESERVATION_TTL), user=request.user)
+        except InsufficientStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except Stock.DoesNotExist as e:
+            return Response({'stock': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error reserving stock item with ID {data['stock']}: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(ReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(tags=['Inventry Stock'])
+    @max_queries(2)
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    # Sell the held units (one more query when it crosses the reorder point)
+    @swagger_auto_schema(tags=['Inventry Stock'])
+    @action(detail=True, methods=['post'])
+    @max_queries(9)
+    def confirm(self, request, pk=None):
+        reservation = self.get_object()
+        try:
+            confirm(reservation)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"Error confirming reservation with ID {pk}: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        cache.delete(f'stock_{reservation.stock_id}')  # The quantity changed
+        cache.delete_many(list_cache_keys('stock'))
+        return Response(self.get_serializer(reservation).data)
+
+    @swagger_auto_schema(tags=['Inventry Stock'])
+    @action(detail=True, methods=['post'])
+    @max_queries(6)
+    def release(self, request, pk=None):
+        reservation = self.get_object()
+        try:
+            release(reservation)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"Error releasing reservation with ID {pk}: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(self.get_serializer(reservation).data)
+
+
+class CatalogueImportAPI(GenericAPIView):
+    """
+    Upload a CSV or NDJSON catalogue (see tes_app/catalogue_import.py). To resume
+    a failed import, upload the same file again with its `job` id.
+    """
+    serializer_class = CatalogueImportSerializer
+    parser_classes = (MultiPartParser,)
+    permission_classes = (permissions.IsAdminUser,)
+    authentication_classes = (JWTAuthentication,)
+
+    @swagger_auto_schema(tags=['Inventry Item'])
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['file']
+        fmt = serializer.validated_data.get('format') or guess_format(upload.name)
+        if fmt is None:
+            return Response({'format': ['Cannot tell the format from the file name.']}, status=status.HTTP_400_BAD_REQUEST)
+        job = serializer.validated_data.get('job') or ImportJob.objects.create(source=upload.name[:255], format=fmt)
+        try:
+            job = import_catalogue(upload.file, fmt, upload.name, job=job)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error importing catalogue (job {job.pk}): {str(e)}")
+            return Response({'error': 'Internal server error', 'job': ImportJobSerializer(job).data}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(ImportJobSerializer(job).data)
+
+
+class CatalogueExportAPI(APIView):
+    """
+    Streams the stock, product and category join (see tes_app/inventory_export.py).
+    `output` is csv (default), ndjson or columnar; `since` (ISO 8601) limits it to
+    stock updated since then. X-Export-Started-At is the `since` for the next
+    incremental export.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (JWTAuthentication,)
+
+    @swagger_auto_schema(tags=['Inventry Stock'], manual_parameters=[
+        openapi.Parameter('output', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(EXPORT_FORMATS)),
+        openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+    ])
+    @max_queries(2)
+    def get(self, request, *args, **kwargs):
+        fmt = request.query_params.get('output', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return Response({'output': [f"Expected one of {', '.join(EXPORT_FORMATS)}."]}, status=status.HTTP_400_BAD_REQUEST)
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({'since': ['Expected an ISO 8601 date and time.']}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        started_at = timezone.now()
+        # An ASGI server needs an async iterator to stream (see inventory_export).
+        export = aexport_inventory if isinstance(request._request, ASGIRequest) else export_inventory
+        response = StreamingHttpResponse(export(fmt, since=since or None), content_type=EXPORT_FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="inventory-{started_at:%Y%m%dT%H%M%S}.{EXTENSIONS[fmt]}"'
+        response['X-Export-Started-At'] = started_at.isoformat()
+        return response
+
+
+class ChangeFeedAPI(APIView):
+    """
+    Categories, products and stock changed since a sync token, plus the ids
+    deleted since (see tes_app/change_feed.py). Without `since` it only returns
+    a token to start from: take one, load the full lists, then poll with it.
+    While `has_more` is set, call again with `next_token` for the next page.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (JWTAuthentication,)
+    use_read_replica = False  # A lagging replica would hand out a token past rows it has not seen
+
+    @swagger_auto_schema(tags=['Inventry Stock'], manual_parameters=[
+        openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='next_token of the previous call'),
+    ])
+    @max_queries(6)
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'next_token': make_token(database_now())})
+        try:
+            return Response(changes_since(since))
+        except InvalidToken as e:
+            return Response({'since': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        except TokenExpired as e:
+            return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+        except Exception as e:
+            logger.error(f"Error reading change feed since {since}: {str(e)}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,60 @@
+"""
+Low-stock detection.
+
+Each stock save compares the row's state against its reorder point with the
+state it was loaded (or last saved) with, and only a crossing writes to
+LowStockAlert: falling below opens an alert, recovering closes it. Saves that
+do not cross cost no queries. Every crossing sends `low_stock` after the
+transaction commits:
+
+    @receiver(low_stock)
+    def notify(sender, stock, low, **kwargs): ...
+
+queryset.update(), bulk_create() and concurrent writers can leave the alerts
+stale; `manage.py rescan_low_stock` (run nightly) reconciles them with a full
+scan.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+from .models import LowStockAlert, Stock
+
+low_stock = Signal()
+
+
+def _notify(stock, low):
+    transaction.on_commit(lambda: low_stock.send(sender=Stock, stock=stock, low=low))
+
+
+def track_low_stock(stock):
+    low = stock.is_low
+    if low == stock._saved_low:
+        return
+    if low:
+        LowStockAlert.objects.bulk_create([LowStockAlert(stock=stock)], ignore_conflicts=True)
+    else:
+        LowStockAlert.objects.filter(stock=stock).delete()
+    stock._saved_low = low
+    _notify(stock, low)
+
+
+def rescan_low_stock(batch_size=1000):
+    """
+    Opens the alerts missing for low stock rows and closes those of rows
+    that recovered, notifying for each. Returns (opened, closed).
+    """
+    low_ids = set(Stock.objects.filter(quantity__lt=F('reorder_point')).values_list('pk', flat=True))
+    alerted_ids = set(LowStockAlert.objects.values_list('stock_id', flat=True))
+    missing = sorted(low_ids - alerted_ids)
+    stale = sorted(alerted_ids - low_ids)
+
+    with transaction.atomic():
+        LowStockAlert.objects.bulk_create((LowStockAlert(stock_id=pk) for pk in missing), batch_size=batch_size, ignore_conflicts=True)
+        for start in range(0, len(stale), batch_size):
+            LowStockAlert.objects.filter(stock_id__in=stale[start:start + batch_size]).delete()
+        for ids, low in ((missing, True), (stale, False)):
+            for start in range(0, len(ids), batch_size):
+                for stock in Stock.objects.filter(pk__in=ids[start:start + batch_size]):
+                    _notify(stock, low)
+    return len(missing), len(stale)
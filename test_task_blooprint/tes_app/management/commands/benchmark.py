@@ -0,0 +1,92 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from tes_app.benchmarks import run_benchmarks
+
+
+def _cache_settings(backend):
+    if backend == 'auto':
+        try:
+            import fakeredis  # noqa: F401
+            backend = 'fakeredis'
+        except ImportError:
+            backend = 'locmem'
+    if backend == 'fakeredis':
+        from fakeredis import FakeConnection
+        return backend, {
+            'default': {
+                'BACKEND': 'django_redis.cache.RedisCache',
+                'LOCATION': 'redis://bench/1',
+                'OPTIONS': {
+                    'CLIENT_CLASS': 'lib.redis_client.InstrumentedClient',
+                    'CONNECTION_POOL_KWARGS': {'connection_class': FakeConnection},
+                },
+            },
+        }
+    return backend, {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark login, inventory list/retrieve (cold and warm cache) and user search against a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--login-iterations', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cache', choices=['auto', 'fakeredis', 'locmem'], default='auto',
+                            help="Redis stand-in; 'auto' uses fakeredis when it is installed.")
+        parser.add_argument('--output', default='bench_results.json', help="Where to write the JSON results.")
+
+    def handle(self, *args, **options):
+        backend, caches = _cache_settings(options['cache'])
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(CACHES=caches, DEBUG=False):
+                results = run_benchmarks(
+                    categories=options['categories'],
+                    products=options['products'],
+                    iterations=options['iterations'],
+                    login_iterations=options['login_iterations'],
+                    seed=options['seed'],
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        payload = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': settings.DATABASES['default']['ENGINE'],
+                'cache': backend,
+                'params': {key: options[key] for key in ('categories', 'products', 'iterations', 'login_iterations', 'seed')},
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(payload, f, indent=2)
+
+        self.stdout.write(f"{'scenario':<28}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KB':>10}")
+        for name, row in results.items():
+            self.stdout.write(f"{name:<28}{row['p50_ms']:>10}{row['p90_ms']:>10}{row['p99_ms']:>10}{row['queries']:>9}{row['alloc_peak_kb']:>10}")
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
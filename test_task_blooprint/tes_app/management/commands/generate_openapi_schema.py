@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from lib.schema_cache import remove_stale_schemas, write_schema
+from test_task.urls import build_schema_view
+
+
+class Command(BaseCommand):
+    help = "Precompute the OpenAPI schema served at /swagger?format=openapi for the current code version."
+
+    def handle(self, *args, **options):
+        path, content = write_schema(*build_schema_view())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(content)} bytes to {path}"))
+        for stale in remove_stale_schemas(path):
+            self.stdout.write(f"Removed {stale}, written for an older code version")
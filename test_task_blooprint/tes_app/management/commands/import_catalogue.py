@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tes_app.catalogue_import import FORMATS, guess_format, import_catalogue
+from tes_app.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Import products (and optionally their stock) from a CSV or NDJSON file, resumable after a failure."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV with a header row, or NDJSON with one product object per line.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension (.csv, .ndjson, .jsonl).")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per bulk insert and transaction.")
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help="Continue a failed import from its last checkpoint.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if fmt is None:
+            raise CommandError("Cannot tell the format from the file name, pass --format")
+        if options['resume']:
+            try:
+                job = ImportJob.objects.get(pk=options['resume'])
+            except ImportJob.DoesNotExist:
+                raise CommandError(f"Import {options['resume']} does not exist")
+        else:
+            job = ImportJob.objects.create(source=options['path'][:255], format=fmt)
+
+        start = time.perf_counter()
+
+        def progress(job):
+            rate = job.rows_done / max(time.perf_counter() - start, 1e-9)
+            self.stdout.write(f"import {job.pk}: {job.rows_done} rows read, {job.rows_imported} imported, {job.rows_failed} rejected ({rate:,.0f} rows/s)")
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                job = import_catalogue(stream, fmt, options['path'], job=job, batch_size=options['batch_size'], progress=progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            raise CommandError(f"{e}\nResume with --resume {job.pk}")
+
+        for error in job.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {job.rows_imported} of {job.rows_done} rows ({job.rows_failed} rejected) in {time.perf_counter() - start:.2f}s"
+        ))
@@ -0,0 +1,54 @@
+import json
+import os
+import platform
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.import_profile import by_package, profile_startup
+from .benchmark import _git_commit
+
+
+class Command(BaseCommand):
+    help = "Profile the imports of a cold worker start (settings, apps and URLconf) with `python -X importtime`."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help="Rows per table.")
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative', help="Order of the module table.")
+        parser.add_argument('--output', help="Also write the full report as JSON, e.g. to compare across commits.")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'test_task.settings'))
+        try:
+            elapsed, imports = profile_startup(settings.BASE_DIR, env=env)
+        except RuntimeError as e:
+            raise CommandError(f"Startup failed: {e}")
+
+        packages = by_package(imports)
+        modules = sorted(imports, key=lambda item: getattr(item, f"{options['sort']}_us"), reverse=True)
+        top = options['top']
+
+        self.stdout.write(f"Startup took {elapsed * 1000:.0f} ms; {len(imports)} imports reported {sum(item.self_us for item in imports) / 1000:.0f} ms")
+        self.stdout.write(f"\n{'package':<40}{'self ms':>10}")
+        for package, self_us in packages[:top]:
+            self.stdout.write(f"{package:<40}{self_us / 1000:>10.1f}")
+        self.stdout.write(f"\n{'module':<60}{'self ms':>10}{'cumul ms':>10}")
+        for item in modules[:top]:
+            self.stdout.write(f"{item.module:<60}{item.self_us / 1000:>10.1f}{item.cumulative_us / 1000:>10.1f}")
+
+        if options['output']:
+            payload = {
+                'meta': {
+                    'commit': _git_commit(),
+                    'timestamp': datetime.now(timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    'api_docs': settings.API_DOCS_ENABLED,
+                },
+                'wall_ms': round(elapsed * 1000, 1),
+                'packages': {package: self_us for package, self_us in packages},
+                'imports': [item._asdict() for item in imports],
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(payload, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
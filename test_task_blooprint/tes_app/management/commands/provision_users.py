@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tes_app.user_provisioning import FORMATS, guess_format, provision_users, read_rows
+
+
+class Command(BaseCommand):
+    help = "Create users in bulk from a CSV file or a JSON array, hashing passwords on every core."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Guessed from the file extension when omitted.")
+        parser.add_argument('--workers', type=int, help="Password hashing processes; one per core by default.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if fmt is None:
+            raise CommandError("Cannot tell the format from the file name, pass --format")
+        start = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as stream:
+                rows = read_rows(stream, fmt)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        report = provision_users(rows, workers=options['workers'], batch_size=options['batch_size'])
+        for error in report['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        self.stdout.write(
+            f"Created {report['created']} users in {time.perf_counter() - start:.1f}s; "
+            f"{report['existing']} already existed, {report['failed']} rows failed"
+        )
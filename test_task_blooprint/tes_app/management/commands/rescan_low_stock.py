@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tes_app.low_stock import rescan_low_stock
+
+
+class Command(BaseCommand):
+    help = "Reconcile the low-stock alerts with a full scan of stock, e.g. nightly from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Alerts written or deleted per query.")
+
+    def handle(self, *args, **options):
+        opened, closed = rescan_low_stock(batch_size=options['batch_size'])
+        self.stdout.write(f"Opened {opened} and closed {closed} low-stock alerts")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tes_app.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Expire the stock reservations past their TTL and give their units back, e.g. every minute from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Holds expired per transaction.")
+
+    def handle(self, *args, **options):
+        swept = sweep_expired(batch_size=options['batch_size'])
+        self.stdout.write(f"Expired {swept} reservations")
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tes_app.inventory_cache import RESOURCES, warm_resource
+
+
+class Command(BaseCommand):
+    help = "Warm the inventory list pages and the most requested detail entries, e.g. after a deploy or a cache flush."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resource', action='append', choices=list(RESOURCES), dest='resources',
+                            help="Resource to warm (repeatable); all of them by default.")
+        parser.add_argument('--pages', type=int, default=settings.CACHED_LIST_PAGES, help="List pages to warm per resource.")
+        parser.add_argument('--top', type=int, default=100, help="Detail entries to warm per resource, hottest first.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Detail batches loaded at the same time.")
+        parser.add_argument('--batch-size', type=int, default=100, help="Detail entries per set_many call.")
+        parser.add_argument('--base-url', default=settings.CACHE_WARM_BASE_URL,
+                            help="Scheme and host used for the pagination links in cached list pages.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total_pages = total_details = 0
+        for list_key in options['resources'] or RESOURCES:
+            pages, details = warm_resource(
+                list_key,
+                base_url=options['base_url'],
+                pages=options['pages'],
+                top=options['top'],
+                concurrency=options['concurrency'],
+                batch_size=options['batch_size'],
+                progress=self.stdout.write,
+            )
+            total_pages += pages
+            total_details += details
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {total_pages} list pages and {total_details} detail entries in {time.perf_counter() - start:.2f}s"
+        ))
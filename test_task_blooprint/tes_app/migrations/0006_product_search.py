@@ -0,0 +1,135 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:10
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE tes_app_product_search USING fts5(
+        name, category, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER tes_app_product_search_insert AFTER INSERT ON tes_app_product BEGIN
+        INSERT INTO tes_app_product_search (rowid, name, category, description)
+        VALUES (new.id, new.name, (SELECT name FROM tes_app_category WHERE id = new.category_id), new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER tes_app_product_search_update AFTER UPDATE ON tes_app_product
+    WHEN old.name IS NOT new.name OR old.description IS NOT new.description OR old.category_id IS NOT new.category_id
+    BEGIN
+        DELETE FROM tes_app_product_search WHERE rowid = old.id;
+        INSERT INTO tes_app_product_search (rowid, name, category, description)
+        VALUES (new.id, new.name, (SELECT name FROM tes_app_category WHERE id = new.category_id), new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER tes_app_product_search_delete AFTER DELETE ON tes_app_product BEGIN
+        DELETE FROM tes_app_product_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER tes_app_category_search_rename AFTER UPDATE OF name ON tes_app_category
+    WHEN old.name IS NOT new.name
+    BEGIN
+        UPDATE tes_app_product_search SET category = new.name
+        WHERE rowid IN (SELECT id FROM tes_app_product WHERE category_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO tes_app_product_search (rowid, name, category, description)
+    SELECT p.id, p.name, c.name, p.description FROM tes_app_product p JOIN tes_app_category c ON c.id = p.category_id
+    """,
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS tes_app_category_search_rename",
+    "DROP TRIGGER IF EXISTS tes_app_product_search_delete",
+    "DROP TRIGGER IF EXISTS tes_app_product_search_update",
+    "DROP TRIGGER IF EXISTS tes_app_product_search_insert",
+    "DROP TABLE IF EXISTS tes_app_product_search",
+]
+
+POSTGRES_FORWARD = [
+    """
+    CREATE TABLE tes_app_product_search (
+        product_id bigint PRIMARY KEY REFERENCES tes_app_product (id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX tes_app_product_search_document ON tes_app_product_search USING GIN (document)",
+    """
+    CREATE FUNCTION tes_app_product_document(name text, category text, description text) RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(category, '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(description, '')), 'D')
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE FUNCTION tes_app_product_search_sync() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO tes_app_product_search (product_id, document)
+        VALUES (NEW.id, tes_app_product_document(
+            NEW.name, (SELECT name FROM tes_app_category WHERE id = NEW.category_id), NEW.description
+        ))
+        ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tes_app_product_search_sync AFTER INSERT OR UPDATE OF name, category_id, description ON tes_app_product
+    FOR EACH ROW EXECUTE FUNCTION tes_app_product_search_sync()
+    """,
+    """
+    CREATE FUNCTION tes_app_category_search_rename() RETURNS trigger AS $$
+    BEGIN
+        UPDATE tes_app_product_search s
+        SET document = tes_app_product_document(p.name, NEW.name, p.description)
+        FROM tes_app_product p
+        WHERE p.id = s.product_id AND p.category_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tes_app_category_search_rename AFTER UPDATE OF name ON tes_app_category
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE FUNCTION tes_app_category_search_rename()
+    """,
+    """
+    INSERT INTO tes_app_product_search (product_id, document)
+    SELECT p.id, tes_app_product_document(p.name, c.name, p.description)
+    FROM tes_app_product p JOIN tes_app_category c ON c.id = p.category_id
+    """,
+]
+
+POSTGRES_REVERSE = [
+    "DROP TRIGGER IF EXISTS tes_app_category_search_rename ON tes_app_category",
+    "DROP TRIGGER IF EXISTS tes_app_product_search_sync ON tes_app_product",
+    "DROP FUNCTION IF EXISTS tes_app_category_search_rename()",
+    "DROP FUNCTION IF EXISTS tes_app_product_search_sync()",
+    "DROP TABLE IF EXISTS tes_app_product_search",
+    "DROP FUNCTION IF EXISTS tes_app_product_document(text, text, text)",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for statement in vendor_statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tes_app', '0005_change_feed'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:40
+
+from django.db import migrations
+
+# The change feed compares these columns with tokens read from the database
+# clock, so the database stamps them rather than the app server's auto_now.
+COLUMNS = [
+    ('tes_app_category', 'updated_at', 'INSERT OR UPDATE'),
+    ('tes_app_product', 'updated_at', 'INSERT OR UPDATE'),
+    ('tes_app_stock', 'last_updated', 'INSERT OR UPDATE'),
+    ('tes_app_tombstone', 'deleted_at', 'INSERT'),
+]
+
+# Django stores SQLite datetimes as 'YYYY-MM-DD HH:MM:SS.ffffff' text;
+# strftime only gives milliseconds, so pad to compare correctly as strings.
+# Recursive triggers are off by default, so the UPDATE does not re-fire.
+SQLITE_FORWARD = [
+    f"""
+    CREATE TRIGGER {table}_{column}_{event.lower()} AFTER {event} ON {table} BEGIN
+        UPDATE {table} SET {column} = strftime('%Y-%m-%d %H:%M:%f', 'now') || '000' WHERE id = new.id;
+    END
+    """
+    for table, column, events in COLUMNS
+    for event in events.split(' OR ')
+]
+
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {table}_{column}_{event.lower()}"
+    for table, column, events in COLUMNS
+    for event in events.split(' OR ')
+]
+
+POSTGRES_FORWARD = [
+    statement
+    for table, column, events in COLUMNS
+    for statement in (
+        f"""
+        CREATE FUNCTION {table}_{column}_stamp() RETURNS trigger AS $$
+        BEGIN
+            NEW.{column} := statement_timestamp();
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE TRIGGER {table}_{column}_stamp BEFORE {events} ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {table}_{column}_stamp()
+        """,
+    )
+]
+
+POSTGRES_REVERSE = [
+    statement
+    for table, column, events in COLUMNS
+    for statement in (
+        f"DROP TRIGGER IF EXISTS {table}_{column}_stamp ON {table}",
+        f"DROP FUNCTION IF EXISTS {table}_{column}_stamp()",
+    )
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for statement in vendor_statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tes_app', '0009_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
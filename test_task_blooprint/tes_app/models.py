@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, Group
+from django.db.models.functions import Lower
 from django.utils import timezone
 from datetime import timedelta
 
@@ -30,6 +31,15 @@ class User(AbstractUser):
     country = models.CharField(max_length=250)
     image = models.ImageField(upload_to='profile', blank=True, null=True)
 
+    class Meta(AbstractUser.Meta):
+        # Case-insensitive prefix search in the user directory (tes_app/filter_classes.py)
+        indexes = [
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(Lower('name'), name='user_name_lower_idx'),
+            models.Index(Lower('city'), name='user_city_lower_idx'),
+            models.Index(Lower('country'), name='user_country_lower_idx'),
+        ]
+
     def __str__(self):
         return self.first_name + ' ' + self.last_name
 
@@ -37,12 +47,12 @@ class User(AbstractUser):
         # Call the original save method to create the user
         super(User, self).save(*args, **kwargs)
         read_group, created = Group.objects.get_or_create(name='read')
-        if read_group not in self.groups.all():
-            self.groups.add(read_group)
+        self.groups.add(read_group)  # No-op when the user is already a member
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -52,6 +62,7 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -59,11 +70,115 @@ class Product(models.Model):
 class Stock(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
-    last_updated = models.DateTimeField(auto_now=True)
+    # Stock is low once quantity drops below this; 0 never alerts
+    reorder_point = models.PositiveIntegerField(default=0)
+    # Units held by active reservations (tes_app/reservations.py). Only ever
+    # changed by conditional UPDATEs, never by save().
+    reserved = models.PositiveIntegerField(default=0)
+    last_updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Whether the row was low when loaded or last saved, so saves only touch
+    # LowStockAlert when they cross the reorder point (tes_app/low_stock.py).
+    # None when quantity or reorder_point was deferred.
+    _saved_low = False
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
 
+    @property
+    def is_low(self):
+        return self.quantity < self.reorder_point
+
+    @property
+    def available(self):
+        return max(0, self.quantity - self.reserved)
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # A full save of an instance loaded before a reservation changed
+        # `reserved` would write the stale count back.
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'reserved' and field.attname not in deferred
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = instance.__dict__
+        instance._saved_low = instance.is_low if 'quantity' in loaded and 'reorder_point' in loaded else None
+        return instance
+
+class LowStockAlert(models.Model):
+    """
+    A stock row currently below its reorder point. Opened and closed as stock
+    saves cross the reorder point, so low-stock dashboards read this small
+    table instead of scanning all stock.
+    """
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, related_name='low_stock_alert')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Low stock {self.stock_id}"
+
+class Reservation(models.Model):
+    """
+    A temporary hold on `quantity` units of a stock row during checkout
+    (tes_app/reservations.py). Held units count against the stock's
+    available quantity until the hold is confirmed (the units are sold),
+    released, or expires.
+    """
+    HELD, CONFIRMED, RELEASED, EXPIRED = 'held', 'confirmed', 'released', 'expired'
+    STATUS_CHOICES = [(HELD, 'Held'), (CONFIRMED, 'Confirmed'), (RELEASED, 'Released'), (EXPIRED, 'Expired')]
+
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx')]
+
+    def __str__(self):
+        return f"{self.quantity} x stock {self.stock_id} ({self.status})"
+
+class Tombstone(models.Model):
+    """
+    Records a deleted category, product or stock row so the change feed
+    (tes_app/change_feed.py) can tell clients to drop it.
+    """
+    MODEL_CHOICES = [('category', 'Category'), ('product', 'Product'), ('stock', 'Stock')]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+class RequestProfile(models.Model):
+    """
+    Stack samples of one profiled request (see tes_app/profiling.py), stored as
+    collapsed stacks ready for flamegraph.pl or speedscope.
+    """
+    route = models.CharField(max_length=200, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField()
+    collapsed_stacks = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.route} ({self.duration_ms:.1f} ms)"
+
 # class FriendRequest(models.Model):
 #     STATUS_CHOICES = [
 #         ('Send', 'Send'),
@@ -107,4 +222,27 @@ class Stock(models.Model):
 #     action = models.CharField(max_length=50, choices=ACTION_CHOICES)
 #     friend_request = models.ForeignKey(FriendRequest, on_delete=models.CASCADE, related_name='logged_activities', null=True, blank=True)
 #     target_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='targeted_activities', null=True, blank=True)
-#     created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+#     created_at = models.DateTimeField(auto_now_add=True)
+
+class ImportJob(models.Model):
+    """
+    Progress of one catalogue import (tes_app/catalogue_import.py). rows_done is
+    committed together with each chunk of rows, so it is the point an
+    interrupted import resumes from.
+    """
+    STATUS_CHOICES = [('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')]
+    FORMAT_CHOICES = [('csv', 'CSV'), ('ndjson', 'NDJSON')]
+
+    source = models.CharField(max_length=255)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    rows_done = models.PositiveBigIntegerField(default=0)
+    rows_imported = models.PositiveBigIntegerField(default=0)
+    rows_failed = models.PositiveBigIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.status}, {self.rows_done} rows)"
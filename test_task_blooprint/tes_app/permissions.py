@@ -1,12 +1,25 @@
 # permissions.py
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+
+def user_group_names(user):
+    """
+    Names of the groups `user` belongs to, fetched with one query and cached on
+    the user object so several group checks in one request don't each hit the DB.
+    """
+    if not user or not user.is_authenticated:
+        return set()
+    if not hasattr(user, '_group_names'):
+        user._group_names = set(user.groups.values_list('name', flat=True))
+    return user._group_names
+
+
 class IsAdmin(BasePermission):
     """
     Full access for users in the 'admin' group.
     """
     def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='admin').exists()
+        return 'admin' in user_group_names(request.user)
 
 class IsWrite(BasePermission):
     """
@@ -15,11 +28,11 @@ class IsWrite(BasePermission):
     def has_permission(self, request, view):
         if request.method == 'DELETE':
             return False  # Write users should not be able to delete
-        return request.user and request.user.groups.filter(name='write').exists()
+        return 'write' in user_group_names(request.user)
 
 class IsRead(BasePermission):
     """
     Only allows read access for users in the 'read' group (GET).
     """
     def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='read').exists() and request.method in SAFE_METHODS
+        return 'read' in user_group_names(request.user) and request.method in SAFE_METHODS
@@ -0,0 +1,122 @@
+"""
+Opt-in sampling profiler for live requests.
+
+A request is profiled when an admin sends `X-Profile: 1`, or at random for
+PROFILE_SAMPLE_RATE of all requests. While the view runs, a background thread
+samples the request thread's stack every PROFILE_INTERVAL seconds; the samples
+are stored as collapsed stacks ("frame;frame;frame count" lines, the input
+format of flamegraph.pl and speedscope) in RequestProfile, keyed by route.
+
+Under ASGI the sampled thread is the one running the request's sync code
+(ORM, serializers) through sync_to_async; time the request spends awaiting
+on the event loop does not show up.
+"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from lib.middleware import SyncAndAsyncMiddleware
+
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+def _is_admin_request(request):
+    if request.headers.get('X-Profile') != '1':
+        return False
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return False
+    return result is not None and result[0].is_staff
+
+
+class ProfilingMiddleware(SyncAndAsyncMiddleware):
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not (random.random() < settings.PROFILE_SAMPLE_RATE or _is_admin_request(request)):
+            return self.get_response(request)
+
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        return self.store(request, response, sampler, (time.perf_counter() - start) * 1000)
+
+    async def __acall__(self, request):
+        if not (random.random() < settings.PROFILE_SAMPLE_RATE or await sync_to_async(_is_admin_request)(request)):
+            return await self.get_response(request)
+
+        # The thread every sync_to_async call of this request runs on.
+        sampler = StackSampler(await sync_to_async(threading.get_ident)(), settings.PROFILE_INTERVAL)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        return await sync_to_async(self.store)(request, response, sampler, (time.perf_counter() - start) * 1000)
+
+    def store(self, request, response, sampler, duration):
+        match = getattr(request, 'resolver_match', None)
+        try:
+            profile = RequestProfile.objects.create(
+                route=match.view_name if match else 'unmatched',
+                method=request.method,
+                path=request.get_full_path()[:500],
+                duration_ms=duration,
+                samples=sum(sampler.stacks.values()),
+                collapsed_stacks=sampler.collapsed(),
+            )
+            RequestProfile.objects.filter(pk__lte=profile.pk - settings.PROFILE_KEEP).delete()
+            response['X-Profile-Id'] = str(profile.pk)
+        except Exception as e:
+            logger.error(f"Error storing request profile: {str(e)}")
+        return response
@@ -0,0 +1,108 @@
+"""
+Server push of stock and product changes over server-sent events.
+
+Clients open `/api/v1/stream/?product=1,2&category=3` once and receive every
+saved stock row and product of those products and categories as an SSE
+`data:` line, instead of polling the lists. The stream view is async, so an
+idle connection is a suspended coroutine waiting on its queue rather than a
+worker thread; messages travel through lib.pubsub (Redis pub/sub across
+processes, or in memory with PUSH_BROKER = 'memory').
+
+Changes are published from post_save after the transaction commits, so
+queryset.update() and bulk_create() (the catalogue import) do not push;
+clients that missed anything resync through the change feed.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from lib.pubsub import get_broker
+from lib.query_budget import max_queries
+from .async_inventry import _authenticate, _json, _unauthorized
+from .models import Product, Stock
+from .serialization import ProductSerializer, StockSerializer
+
+logger = logging.getLogger(__name__)
+
+RETRY_MILLISECONDS = 5000
+
+
+def publish(channels, message):
+    data = json.dumps(message, cls=JSONEncoder)
+    broker = get_broker()
+    for channel in channels:
+        broker.publish(channel, data)
+
+
+def publish_product(product):
+    publish(
+        [f'product:{product.pk}', f'category:{product.category_id}'],
+        {'type': 'product', 'data': ProductSerializer(product).data},
+    )
+
+
+def publish_stock(stock):
+    if Stock.product.is_cached(stock):
+        category_id = stock.product.category_id
+    else:
+        category_id = Product.objects.filter(pk=stock.product_id).values_list('category_id', flat=True).first()
+    publish(
+        [f'product:{stock.product_id}', f'category:{category_id}'],
+        {'type': 'stock', 'data': StockSerializer(stock).data},
+    )
+
+
+def parse_channels(query):
+    """
+    Channel names for the `product` and `category` ids (comma separated,
+    repeatable) of a query string. Raises ValueError on a non-numeric id.
+    """
+    channels = []
+    for kind in ('product', 'category'):
+        for value in query.getlist(kind):
+            for pk in filter(None, value.split(',')):
+                channels.append(f'{kind}:{int(pk)}')
+    return list(dict.fromkeys(channels))
+
+
+async def _events(channels):
+    # Subscribing here rather than in the view ties the subscription's
+    # lifetime to the iteration, which the server closes on disconnect
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        while True:
+            message = await subscription.get(timeout=settings.PUSH_HEARTBEAT)
+            # Comments keep proxies from closing an idle stream and reveal dead clients
+            yield ': keepalive\n\n' if message is None else f'data: {message}\n\n'
+    finally:
+        subscription.close()
+
+
+@max_queries(1)
+async def stock_stream(request):
+    if request.method != 'GET':
+        return _json({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        # WSGI buffers an async stream until it ends, and this one never does
+        return _json({'error': 'Server-sent events need an ASGI server'}, status=501)
+    if await _authenticate(request) is None:
+        return _unauthorized()
+    try:
+        channels = parse_channels(request.GET)
+    except ValueError:
+        return _json({'error': 'product and category must be comma separated ids'}, status=400)
+    if not channels:
+        return _json({'error': 'Subscribe to at least one product or category'}, status=400)
+    if len(channels) > settings.PUSH_MAX_CHANNELS:
+        return _json({'error': f'At most {settings.PUSH_MAX_CHANNELS} products and categories per stream'}, status=400)
+
+    logger.debug(f"Streaming {', '.join(channels)}")
+    response = StreamingHttpResponse(_events(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
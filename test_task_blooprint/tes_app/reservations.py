@@ -0,0 +1,143 @@
+"""
+Stock reservations for checkout.
+
+A hold adds its units to Stock.reserved with one conditional UPDATE
+
+    UPDATE stock SET reserved = reserved + n WHERE id = ? AND quantity - reserved >= n
+
+so concurrent checkouts of the same product serialize on that row and can
+never hold more than is on hand: the database re-checks the condition
+against the latest row before each update. Available stock is quantity
+minus reserved. Confirming a hold takes its units off both quantity and
+reserved; releasing or expiring it gives them back. Every status change is
+itself a conditional UPDATE on the hold, so a hold is settled exactly once
+even when a client, a sweep and a confirmation race.
+
+Expired holds keep counting in `reserved` until they are swept: a
+reservation that does not fit sweeps its stock row and tries once more, and
+`manage.py sweep_reservations` (run from cron) sweeps everything. The
+availability endpoint leaves them out without writing (expired_holds).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .low_stock import track_low_stock
+from .models import Reservation, Stock
+from .push import publish_stock
+
+
+class ReservationError(Exception):
+    pass
+
+
+class InsufficientStock(ReservationError):
+    pass
+
+
+def _hold(stock_id, quantity):
+    return Stock.objects.filter(pk=stock_id, quantity__gte=F('reserved') + quantity).update(reserved=F('reserved') + quantity)
+
+
+def reserve(stock_id, quantity, ttl, user=None):
+    """
+    Holds `quantity` units of a stock row for `ttl` seconds. Raises
+    InsufficientStock when fewer are available, Stock.DoesNotExist for an
+    unknown row.
+    """
+    for attempt in range(2):
+        with transaction.atomic():
+            # Insert first: the stock row stays locked from the UPDATE to the
+            # commit, and that window is what concurrent checkouts queue on.
+            reservation = Reservation.objects.create(
+                stock_id=stock_id, user=user, quantity=quantity, expires_at=timezone.now() + timedelta(seconds=ttl),
+            )
+            if _hold(stock_id, quantity):
+                return reservation
+            transaction.set_rollback(True)
+        if attempt == 0 and not sweep_expired(stock_id=stock_id):
+            break
+    if not Stock.objects.filter(pk=stock_id).exists():
+        raise Stock.DoesNotExist(f"Stock {stock_id} does not exist")
+    raise InsufficientStock(f"Fewer than {quantity} units of stock {stock_id} are available")
+
+
+def _settle(reservation, status, **conditions):
+    """Moves a held reservation to `status`; False when it was no longer held."""
+    updated = Reservation.objects.filter(pk=reservation.pk, status=Reservation.HELD, **conditions).update(status=status)
+    if updated:
+        reservation.status = status
+    return bool(updated)
+
+
+def release(reservation):
+    """Gives the held units back. Raises ReservationError when not held."""
+    with transaction.atomic():
+        if not _settle(reservation, Reservation.RELEASED):
+            raise ReservationError(f"Reservation {reservation.pk} is {reservation.status}, not held")
+        Stock.objects.filter(pk=reservation.stock_id).update(reserved=F('reserved') - reservation.quantity)
+    return reservation
+
+
+def confirm(reservation):
+    """
+    Sells the held units: they come off the stock's quantity for good.
+    Raises ReservationError when the hold is no longer held or has expired,
+    InsufficientStock when the quantity was lowered below the hold since.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not _settle(reservation, Reservation.CONFIRMED, expires_at__gt=now):
+            raise ReservationError(f"Reservation {reservation.pk} is expired or {reservation.status}, not held")
+        if not Stock.objects.filter(pk=reservation.stock_id, quantity__gte=reservation.quantity).update(
+            quantity=F('quantity') - reservation.quantity, reserved=F('reserved') - reservation.quantity, last_updated=now,
+        ):
+            raise InsufficientStock(f"Stock {reservation.stock_id} no longer holds {reservation.quantity} units")
+
+        # The UPDATE skipped save(), so run what a stock save triggers.
+        stock = Stock.objects.get(pk=reservation.stock_id)
+        stock._saved_low = stock.quantity + reservation.quantity < stock.reorder_point
+        track_low_stock(stock)
+        transaction.on_commit(lambda: publish_stock(stock))
+    return reservation
+
+
+def expired_holds(stock_id):
+    """Units of a stock row still counted in `reserved` by expired holds."""
+    expired = Reservation.objects.filter(stock_id=stock_id, status=Reservation.HELD, expires_at__lte=timezone.now())
+    return expired.aggregate(units=Sum('quantity'))['units'] or 0
+
+
+def sweep_expired(stock_id=None, batch_size=1000):
+    """
+    Expires the holds past their expires_at (of one stock row, or all) and
+    gives their units back. Returns how many holds were expired.
+    """
+    swept = 0
+    while True:
+        with transaction.atomic():
+            # Locking the holds keeps a concurrent release, confirmation or
+            # sweep off them until their units are back; a hold locked by
+            # one of those is left for it (or the next sweep). SQLite has
+            # no row locks, but it refuses the write of a transaction whose
+            # snapshot another writer changed, which is as safe.
+            expired = Reservation.objects.select_for_update(skip_locked=True).filter(
+                status=Reservation.HELD, expires_at__lte=timezone.now(),
+            )
+            if stock_id is not None:
+                expired = expired.filter(stock_id=stock_id)
+            batch = list(expired.order_by('pk').values_list('pk', 'stock_id', 'quantity')[:batch_size])
+            if not batch:
+                break
+            Reservation.objects.filter(pk__in=[pk for pk, _, _ in batch], status=Reservation.HELD).update(status=Reservation.EXPIRED)
+            returned = {}
+            for _, stock, quantity in batch:
+                returned[stock] = returned.get(stock, 0) + quantity
+            for stock, quantity in sorted(returned.items()):
+                Stock.objects.filter(pk=stock).update(reserved=F('reserved') - quantity)
+        swept += len(batch)
+        if len(batch) < batch_size:
+            break
+    return swept
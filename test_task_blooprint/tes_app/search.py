@@ -0,0 +1,77 @@
+"""
+Full-text product search.
+
+Products are indexed by name, category name and description in
+`tes_app_product_search`: an FTS5 table on SQLite, a tsvector column with a
+GIN index on PostgreSQL (migration 0006). Database triggers keep it in sync on
+every product insert, update and delete and on category renames, including
+the bulk_create and queryset.update() paths that bypass model signals.
+
+Every word of the query must match, the last one as a prefix too, and results
+are ranked with name matches first (bm25 / ts_rank with per-column weights).
+"""
+import re
+
+from django.db import connection
+
+from .models import Product
+
+MAX_TERMS = 8
+
+_word = re.compile(r'\w+')
+
+_SQLITE_COUNT = "SELECT COUNT(*) FROM tes_app_product_search WHERE tes_app_product_search MATCH %s"
+_SQLITE_PAGE = """
+    SELECT p.* FROM tes_app_product_search s JOIN tes_app_product p ON p.id = s.rowid
+    WHERE tes_app_product_search MATCH %s
+    ORDER BY bm25(tes_app_product_search, 10.0, 4.0, 1.0), p.id
+    LIMIT %s OFFSET %s
+"""
+_POSTGRES_COUNT = "SELECT COUNT(*) FROM tes_app_product_search WHERE document @@ to_tsquery('simple', %s)"
+_POSTGRES_PAGE = """
+    SELECT p.* FROM tes_app_product_search s JOIN tes_app_product p ON p.id = s.product_id
+    WHERE s.document @@ to_tsquery('simple', %s)
+    ORDER BY ts_rank(s.document, to_tsquery('simple', %s)) DESC, p.id
+    LIMIT %s OFFSET %s
+"""
+
+
+def search_terms(text):
+    return _word.findall(text.lower())[:MAX_TERMS]
+
+
+def match_expression(terms, vendor):
+    """
+    The terms as an FTS5 MATCH (`"smart" "pho"*`) or tsquery (`smart & pho:*`)
+    expression: whole words, except the last one, which the user may still be
+    typing.
+    """
+    if vendor == 'postgresql':
+        return ' & '.join(terms[:-1] + [f'{term}:*' for term in terms[-1:]])
+    return ' '.join([f'"{term}"' for term in terms[:-1]] + [f'"{term}"*' for term in terms[-1:]])
+
+
+class SearchResults:
+    """
+    The ranked products matching `text`, sliced lazily like a queryset so
+    the standard paginators run one COUNT and one page query.
+    """
+
+    def __init__(self, text):
+        self.terms = search_terms(text)
+        self.expression = match_expression(self.terms, connection.vendor)
+
+    def count(self):
+        if not self.terms:
+            return 0
+        count_sql = _POSTGRES_COUNT if connection.vendor == 'postgresql' else _SQLITE_COUNT
+        with connection.cursor() as cursor:
+            cursor.execute(count_sql, [self.expression])
+            return cursor.fetchone()[0]
+
+    def __getitem__(self, page):
+        if not self.terms or page.stop <= page.start:
+            return []
+        if connection.vendor == 'postgresql':
+            return list(Product.objects.raw(_POSTGRES_PAGE, [self.expression, self.expression, page.stop - page.start, page.start]))
+        return list(Product.objects.raw(_SQLITE_PAGE, [self.expression, page.stop - page.start, page.start]))
@@ -1,6 +1,9 @@
+import re
 from rest_framework import serializers
 from tes_app.models import User
-from .models import Category, Product, Stock
+from .models import Category, Product, Stock, RequestProfile, ImportJob, LowStockAlert, Reservation
+from django.conf import settings
+from lib.metrics import TimedSerializerMixin
 
 class RegisterSerialization(serializers.Serializer):
     first_name = serializers.CharField(required=True)
@@ -22,11 +25,21 @@ class LogOutSerializer(serializers.Serializer):
 class UpdateProfileImageSerializer(serializers.Serializer):
     image = serializers.ImageField(required=False)
 
-class UserSerial(serializers.ModelSerializer):
+class UserSerial(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'first_name', 'last_name', 'username', 'email', 'name', 'address', 'pin_code', 'city', 'country', 'image']
 
+def password_check(passwd):
+    flag = 0
+    if not re.search("[A-Z]", passwd):
+        flag = 1
+    if not re.search("[0-9]", passwd):
+        flag = 2
+    if not re.search("[@$!%*#?&]", passwd):
+        flag = 3
+    return flag
+
 class CreateUserSerial(serializers.Serializer):
     first_name = serializers.CharField(required=True)
     last_name = serializers.CharField(required=True)
@@ -36,6 +49,24 @@ class CreateUserSerial(serializers.Serializer):
     city = serializers.CharField(required=True)
     country = serializers.CharField(required=True)
 
+class ProvisionUserSerial(CreateUserSerial):
+    # Users without a password get an unusable one and set it through the reset flow
+    password = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+
+    def validate_password(self, value):
+        checkpoint = password_check(value) if value else 0
+        if checkpoint == 1:
+            raise serializers.ValidationError('Password must contain atleast one capital alphbat')
+        if checkpoint == 2:
+            raise serializers.ValidationError('Password must contain atleast one digit')
+        if checkpoint == 3:
+            raise serializers.ValidationError('Password must contains one special character like @, $,#,&')
+        return value
+
+class ProvisionUsersSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'json'], required=False)
+
 class ChangePasswordSerial(serializers.Serializer):
     old_password = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True)
@@ -58,19 +89,68 @@ class AssignRoleSerialization(serializers.Serializer):
     email = serializers.CharField(max_length=50)
     name = serializers.CharField(max_length=50)
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
 
-class StockSerializer(serializers.ModelSerializer):
+class StockSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # product = ProductSerializer()
 
     class Meta:
         model = Stock
-        fields = '__all__'
\ No newline at end of file
+        # Reservations change `reserved` without invalidating the cached
+        # payloads; the live numbers are at /api/v1/stock/<id>/availability/.
+        exclude = ['reserved']
+
+class StockAvailabilitySerializer(serializers.ModelSerializer):
+    available = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Stock
+        fields = ['id', 'quantity', 'reserved', 'available']
+
+class ReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Reservation
+        fields = ['id', 'stock', 'quantity', 'status', 'created_at', 'expires_at']
+
+class CreateReservationSerializer(serializers.Serializer):
+    stock = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    ttl = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_ttl(self, value):
+        if value > settings.RESERVATION_MAX_TTL:
+            raise serializers.ValidationError(f'Holds last at most {settings.RESERVATION_MAX_TTL} seconds')
+        return value
+
+class LowStockAlertSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField(source='stock.product_id', read_only=True)
+    product_name = serializers.CharField(source='stock.product.name', read_only=True)
+    quantity = serializers.IntegerField(source='stock.quantity', read_only=True)
+    reorder_point = serializers.IntegerField(source='stock.reorder_point', read_only=True)
+
+    class Meta:
+        model = LowStockAlert
+        fields = ['id', 'stock', 'product', 'product_name', 'quantity', 'reorder_point', 'created_at']
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RequestProfile
+        exclude = ['collapsed_stacks']
+
+class CatalogueImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], required=False)
+    job = serializers.PrimaryKeyRelatedField(queryset=ImportJob.objects.all(), required=False)
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = '__all__'
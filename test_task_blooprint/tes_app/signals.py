@@ -0,0 +1,60 @@
+import logging
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .low_stock import low_stock, track_low_stock
+from .models import Category, Product, Stock, Tombstone
+from .push import publish_product, publish_stock
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    WAL lets readers run alongside a writer and synchronous=NORMAL skips the
+    fsync on every commit (still safe in WAL mode). Runs once per connection,
+    which CONN_MAX_AGE keeps open across requests.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL;')
+        cursor.execute('PRAGMA synchronous=NORMAL;')
+
+
+@receiver(post_delete, sender=Category, dispatch_uid='tombstone_category')
+@receiver(post_delete, sender=Product, dispatch_uid='tombstone_product')
+@receiver(post_delete, sender=Stock, dispatch_uid='tombstone_stock')
+def record_tombstone(sender, instance, **kwargs):
+    """
+    Cascades fire this for every row they remove too, so deleting a category
+    also leaves tombstones for its products and their stock.
+    """
+    Tombstone.objects.create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(post_save, sender=Product, dispatch_uid='push_product')
+def push_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: publish_product(instance))
+
+
+@receiver(post_save, sender=Stock, dispatch_uid='push_stock')
+def push_stock(sender, instance, **kwargs):
+    transaction.on_commit(lambda: publish_stock(instance))
+
+
+@receiver(post_save, sender=Stock, dispatch_uid='track_low_stock')
+def check_reorder_point(sender, instance, **kwargs):
+    track_low_stock(instance)
+
+
+@receiver(low_stock, dispatch_uid='log_low_stock')
+def log_low_stock(sender, stock, low, **kwargs):
+    if low:
+        logger.warning(f"Stock {stock.pk} of product {stock.product_id} fell below its reorder point ({stock.quantity} < {stock.reorder_point})")
+    else:
+        logger.info(f"Stock {stock.pk} of product {stock.product_id} is back at or above its reorder point")
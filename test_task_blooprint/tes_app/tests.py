@@ -1,11 +1,111 @@
+import asyncio
+import csv
+import gzip
+import json
+import logging.handlers
+import os
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, is_password_usable
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from fakeredis import FakeConnection
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.utils import timezone
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import Category, Product, Stock
-# from rest_framework_simplejwt.tokens import RefreshToken
-# from .models import User
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import inventory_cache, urls as tes_app_urls
+from .benchmarks import run_benchmarks
+from .filter_classes import UserFilterClass, next_prefix
+from .inventry import CategoryViewSet, ChangeFeedAPI, ProductViewSet, StockViewSet
+from . import catalogue_import
+from .catalogue_import import import_catalogue
+from .user_provisioning import provision_users
+from .low_stock import low_stock
+from .reservations import reserve
+from .models import Category, ImportJob, LowStockAlert, Product, Reservation, Stock, User, RequestProfile
+from .profiling import StackSampler
+from lib import compression, metrics, pubsub, rate_limit, redis_client, schema_cache
+from lib.cache_compressors import ThresholdCompressor
+from lib.db_router import ReplicaRouter, ReplicaRoutingMiddleware
+from lib.import_profile import by_package, parse_importtime, profile_startup
+from lib.password_hashing import hash_passwords
+from lib.logging_handlers import JsonLinesFormatter, QueueListenerHandler, SamplingFilter
+from lib.query_budget import QueryBudgetExceeded, QueryBudgetMiddleware, QueryBudgetTestMixin, max_queries
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+FAKEREDIS_CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://tests/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'lib.redis_client.InstrumentedClient',
+            'CONNECTION_POOL_KWARGS': {'connection_class': FakeConnection},
+        },
+    },
+}
+UNREACHABLE_REDIS_CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:1/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'lib.redis_client.InstrumentedClient',
+            'SOCKET_CONNECT_TIMEOUT': 0.1,
+            'SOCKET_TIMEOUT': 0.1,
+        },
+    },
+}
+
+def bearer(user):
+    return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+
+class AuthenticatedTestMixin:
+    """
+    Logs the seeded superuser in: self.user, and its JWT in self.headers
+    (test client) and self.async_headers (async client).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.get(email='superuser@gmail.com')
+        self.headers = {'HTTP_AUTHORIZATION': bearer(self.user)}
+        self.async_headers = {'Authorization': bearer(self.user)}
+
+
+# Rate-limit buckets outlive a test, so only RateLimitTestCase enforces them.
+# Most tests swap Redis for LOCMEM_CACHES, which the Redis push broker refuses.
+_module_settings = override_settings(RATE_LIMIT_ENABLED=False, PUSH_BROKER='memory')
+
+
+def setUpModule():
+    _module_settings.enable()
+
+
+def tearDownModule():
+    _module_settings.disable()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
 class CategoryAPITestCase(APITestCase):
     def setUp(self):
+        cache.clear()
         # self.user = User.objects.create_user(username='superuser@gmail.com', password='Admin@1234')
         self.token = self.get_jwt_token()
         self.category = Category.objects.create(name='Electronics', description='Electronic items')
@@ -13,17 +113,15 @@ class CategoryAPITestCase(APITestCase):
     def get_jwt_token(self):
         # Log in to obtain the JWT token
         login_data = {
-            'username': 'superuser@gmail.com',
+            'email': 'superuser@gmail.com',
             'password': "Admin@1234",
         }
-        response = self.client.post('v1/api/login', login_data)
-        print(response.content)
-        return response.data['access_token']
+        response = self.client.post('/v1/api/login', login_data)
+        return response.json()['data']['access_token']
 
     def get_auth_headers(self):
         return {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json',
+            'HTTP_AUTHORIZATION': f'Bearer {self.token}',
         }
 
     def test_get_categories(self):
@@ -48,31 +146,32 @@ class CategoryAPITestCase(APITestCase):
         response = self.client.delete(f'/api/v1/categories/{self.category.id}/', **self.get_auth_headers())
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+@override_settings(CACHES=LOCMEM_CACHES)
 class ProductAPITestCase(APITestCase):
 
     def setUp(self):
+        cache.clear()
+        self.token = self.get_jwt_token()
         category = Category.objects.create(name='Electronics', description='Electronic items')
         self.product = Product.objects.create(name='Smartphone', category=category, price=999.99, description='Latest smartphone')
 
     def get_jwt_token(self):
         # Log in to obtain the JWT token
         login_data = {
-            'username': 'superuser@gmail.com',
+            'email': 'superuser@gmail.com',
             'password': "Admin@1234",
         }
-        response = self.client.post('v1/api/login', login_data)
-        print(response)
-        return response.data['access_token']
+        response = self.client.post('/v1/api/login', login_data)
+        return response.json()['data']['access_token']
 
     def get_auth_headers(self):
         return {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json',
+            'HTTP_AUTHORIZATION': f'Bearer {self.token}',
         }
 
     def test_get_products(self):
-        response = self.client.get('/api/v1/item/')
-        self.assertEqual(response.status_code, status.HTTP_200_OK, **self.get_auth_headers())
+        response = self.client.get('/api/v1/item/', **self.get_auth_headers())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_get_product(self):
         response = self.client.get(f'/api/v1/item/{self.product.id}/', **self.get_auth_headers())
@@ -98,9 +197,11 @@ class ProductAPITestCase(APITestCase):
         response = self.client.delete(f'/api/v1/item/{self.product.id}/', **self.get_auth_headers())
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+@override_settings(CACHES=LOCMEM_CACHES)
 class StockAPITestCase(APITestCase):
 
     def setUp(self):
+        cache.clear()
         # self.user = User.objects.create_user(username='superuser@gmail.com', password='Admin@1234')
         self.token = self.get_jwt_token()
         category = Category.objects.create(name='Electronics', description='Electronic items')
@@ -110,19 +211,1142 @@ class StockAPITestCase(APITestCase):
     def get_jwt_token(self):
         # Log in to obtain the JWT token
         login_data = {
-            'username': 'superuser@gmail.com',
+            'email': 'superuser@gmail.com',
             'password': "Admin@1234",
         }
-        response = self.client.post('v1/api/login', login_data)
-        print(response)
-        return response.data['access_token']
+        response = self.client.post('/v1/api/login', login_data)
+        return response.json()['data']['access_token']
 
     def get_auth_headers(self):
         return {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json',
+            'HTTP_AUTHORIZATION': f'Bearer {self.token}',
         }
 
     def test_get_stock(self):
         response = self.client.get('/api/v1/stock/', **self.get_auth_headers())
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class QueueLoggingTestCase(SimpleTestCase):
+
+    def test_queue_handler_writes_from_listener_thread(self):
+        target = logging.handlers.BufferingHandler(capacity=10)
+        handler = QueueListenerHandler([target])
+        record = logging.LogRecord('tes_app', logging.INFO, __file__, 1, 'stock %s', (4,), None)
+        handler.handle(record)
+        handler.close()
+        self.assertEqual([r.getMessage() for r in target.buffer], ['stock 4'])
+
+    def test_queue_handler_keeps_tracebacks_apart(self):
+        target = logging.handlers.BufferingHandler(capacity=10)
+        handler = QueueListenerHandler([target])
+        try:
+            raise ValueError('bad row')
+        except ValueError:
+            handler.handle(logging.LogRecord('tes_app', logging.ERROR, __file__, 1, 'import failed', None, sys.exc_info()))
+        handler.close()
+        line = json.loads(JsonLinesFormatter().format(target.buffer[0]))
+        self.assertEqual(line['message'], 'import failed')
+        self.assertIn('ValueError: bad row', line['exc_info'])
+        self.assertIn('ValueError: bad row', logging.Formatter().format(target.buffer[0]))  # Plain formatters too
+
+    def test_queue_handler_resolves_targets_on_first_record(self):
+        targets = []  # Stands in for dictConfig's ConvertingList, filled later
+        handler = QueueListenerHandler(targets)
+        targets.append(logging.handlers.BufferingHandler(capacity=10))
+        handler.handle(logging.LogRecord('tes_app', logging.INFO, __file__, 1, 'routed', None, None))
+        handler.close()
+        self.assertEqual([r.getMessage() for r in targets[0].buffer], ['routed'])
+
+    def test_sampling_filter_only_drops_low_levels(self):
+        sampler = SamplingFilter(rate=0, max_level='DEBUG')
+        debug = logging.LogRecord('tes_app', logging.DEBUG, __file__, 1, 'hit', None, None)
+        error = logging.LogRecord('tes_app', logging.ERROR, __file__, 1, 'boom', None, None)
+        self.assertFalse(sampler.filter(debug))
+        self.assertTrue(sampler.filter(error))
+
+    def test_json_lines_formatter(self):
+        record = logging.LogRecord('tes_app', logging.INFO, __file__, 1, 'cached %s', ('stock',), None)
+        line = json.loads(JsonLinesFormatter().format(record))
+        self.assertEqual(line['message'], 'cached stock')
+        self.assertEqual(line['level'], 'INFO')
+
+
+class OpenAPISchemaCacheTestCase(APITestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        schema_cache._schema = None
+        self.addCleanup(setattr, schema_cache, '_schema', None)
+
+    def test_schema_served_with_etag(self):
+        with self.settings(OPENAPI_SCHEMA_CACHE_DIR=self.cache_dir.name):
+            with self.assertNoLogs('drf_yasg', 'WARNING'):  # No view fails under swagger_fake_view
+                response = self.client.get('/swagger?format=openapi')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            paths = json.loads(response.content)['paths']
+            self.assertIn('/api/v1/stock/', paths)
+            # The annotations recorded by lib.api_docs were applied
+            self.assertEqual(paths['/api/v1/item/search/']['get']['tags'], ['Inventry Item'])
+            self.assertIn('q', [parameter['name'] for parameter in paths['/api/v1/item/search/']['get']['parameters']])
+            self.assertEqual(os.listdir(self.cache_dir.name), [schema_cache.schema_file().name])  # No temporary file left behind
+
+            etag = response['ETag']
+            response = self.client.get('/swagger?format=openapi', HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            # A tag that merely contains ours is another tag
+            response = self.client.get('/swagger?format=openapi', HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x"')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_only_the_command_removes_older_schemas(self):
+        with self.settings(OPENAPI_SCHEMA_CACHE_DIR=self.cache_dir.name):
+            older = Path(self.cache_dir.name) / 'openapi-0000000000000000.json'
+            older.write_bytes(b'{}')
+            os.utime(older, (0, 0))
+            self.client.get('/swagger?format=openapi')
+            self.assertTrue(older.exists())  # Maybe still served by a worker of the previous deploy
+            call_command('generate_openapi_schema', stdout=StringIO())
+            self.assertEqual(os.listdir(self.cache_dir.name), [schema_cache.schema_file().name])
+
+
+class StartupImportTestCase(SimpleTestCase):
+
+    def test_parse_importtime(self):
+        imports = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     django.utils.http\n"
+            "import time:       300 |        420 |   django.http\n"
+            "import time:        80 |        500 | tes_app.push\n"
+        )
+        self.assertEqual([(item.module, item.depth) for item in imports], [('django.utils.http', 2), ('django.http', 1), ('tes_app.push', 0)])
+        self.assertEqual(imports[1].cumulative_us, 420)
+        self.assertEqual(by_package(imports), [('django', 420), ('tes_app', 80)])
+
+    def test_swagger_stack_not_imported_at_startup(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='test_task.settings', API_DOCS_ENABLED='1')
+        _, imports = profile_startup(settings.BASE_DIR, env=env)
+        modules = {item.module for item in imports}
+        self.assertIn('tes_app.views', modules)
+        for module in ('drf_yasg.views', 'drf_yasg.generators', 'drf_yasg.openapi', 'drf_yasg.utils'):
+            self.assertNotIn(module, modules)
+
+        env['API_DOCS_ENABLED'] = '0'
+        _, imports = profile_startup(settings.BASE_DIR, env=env)
+        self.assertFalse([item.module for item in imports if item.module.startswith('drf_yasg')])
+
+
+class StaticAssetsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        source, root = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        files = {
+            'css/site.css': '/*! Site theme */\n' + ''.join(
+                f'.item-{index} {{\n    margin: {index}px;\n    background: url("../img/logo.png");\n}}\n\n/* item {index} */\n'
+                for index in range(50)
+            ),
+            'js/site.js': ''.join(f'function item{index}(first, second) {{\n    // item {index}\n    return first + second;\n}}\n' for index in range(50)),
+            'img/logo.png': 'not really a png',
+        }
+        for name, content in files.items():
+            os.makedirs(os.path.join(source.name, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(source.name, name), 'w') as f:
+                f.write(content)
+        override = self.settings(
+            STATIC_ROOT=root.name, STATICFILES_DIRS=[source.name],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_assets_minified_hashed_and_precompressed(self):
+        name = staticfiles_storage.stored_name('css/site.css')
+        self.assertRegex(name, r'^css/site\.[0-9a-f]{12}\.css$')
+        with staticfiles_storage.open(name) as f:
+            content = f.read().decode()
+        self.assertIn('/*! Site theme */', content)
+        self.assertNotIn('/* item 1 */', content)
+        self.assertNotIn('\n    ', content)
+        self.assertIn(staticfiles_storage.stored_name('img/logo.png').rpartition('/')[2], content)
+        self.assertTrue(staticfiles_storage.exists(name + '.gz'))
+
+    def test_hashed_assets_served_immutable(self):
+        response = self.client.get(staticfiles_storage.url('js/site.js'), HTTP_ACCEPT_ENCODING='gzip')
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'return first+second', gzip.decompress(b''.join(response.streaming_content)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncInventoryTestCase(AuthenticatedTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(name='Electronics', description='Electronic items')
+        self.product = Product.objects.create(name='Smartphone', category=category, price=999.99, description='Latest smartphone')
+
+    async def test_requires_token(self):
+        response = await self.async_client.get('/api/v1/async/item/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_list_is_paginated_and_cached(self):
+        response = await self.async_client.get('/api/v1/async/item/', headers=self.async_headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(response.json()['results'][0]['price'], '999.99')
+        self.assertEqual((await cache.aget('products'))['count'], 1)
+
+    async def test_retrieve(self):
+        response = await self.async_client.get(f'/api/v1/async/item/{self.product.id}/', headers=self.async_headers)
+        self.assertEqual(response.json()['name'], 'Smartphone')
+        response = await self.async_client.get('/api/v1/async/item/999999/', headers=self.async_headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_asgi_handler_adapts_no_middleware(self):
+        # An adapted middleware would run every async view through async_to_sync.
+        with self.assertNoLogs('django.request', level='DEBUG'):
+            ASGIHandler()
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    async def test_middleware_sees_async_view_queries(self):
+        response = await self.async_client.get('/api/v1/async/item/', headers=self.async_headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('desc="3 queries"', response['Server-Timing'])  # Token user, count, page
+
+
+class DatabaseProfileTestCase(TestCase):
+
+    def test_sqlite_connection_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous;')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, request, view):
+        seen = []
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen.append(self.router.db_for_read(Product))
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+        middleware = ReplicaRoutingMiddleware(get_response)
+        middleware(request)
+        return seen[0]
+
+    def test_safe_reads_use_replica(self):
+        view = CategoryViewSet.as_view({'get': 'list'})
+        self.assertEqual(self.route(self.factory.get('/api/v1/categories/'), view), 'replica_1')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_client_pinned_to_primary_after_write(self):
+        view = CategoryViewSet.as_view({'get': 'list', 'post': 'create'})
+        self.assertEqual(self.route(self.factory.post('/api/v1/categories/'), view), 'default')
+        self.assertEqual(self.route(self.factory.get('/api/v1/categories/'), view), 'default')
+        self.assertEqual(self.route(self.factory.get('/api/v1/categories/', REMOTE_ADDR='10.0.0.2'), view), 'replica_1')
+
+    def test_view_opt_out(self):
+        class PrimaryOnlyViewSet(CategoryViewSet):
+            use_read_replica = False
+        view = PrimaryOnlyViewSet.as_view({'get': 'list'})
+        self.assertEqual(self.route(self.factory.get('/api/v1/categories/'), view), 'default')
+
+    def test_action_and_change_feed_opt_out(self):
+        self.assertEqual(self.route(self.factory.get('/api/v1/stock/1/availability/'), StockViewSet.as_view({'get': 'availability'})), 'default')
+        self.assertEqual(self.route(self.factory.get('/api/v1/stock/1/'), StockViewSet.as_view({'get': 'retrieve'})), 'replica_1')
+        self.assertEqual(self.route(self.factory.get('/api/v1/changes/'), ChangeFeedAPI.as_view()), 'default')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BenchmarkSuiteTestCase(TestCase):
+
+    def test_run_benchmarks_reports_every_scenario(self):
+        results = run_benchmarks(categories=2, products=5, iterations=2, login_iterations=1)
+        self.assertEqual(len(results), 14)
+        self.assertEqual(results['stock_list_warm']['queries'], 1)  # JWT user lookup only
+        self.assertLessEqual(results['login']['p50_ms'], results['login']['p99_ms'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, QUERY_BUDGET_MODE='raise')
+class QueryBudgetTestCase(AuthenticatedTestMixin, QueryBudgetTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(name='Electronics', description='Electronic items')
+        product = Product.objects.create(name='Smartphone', category=category, price=999.99, description='Latest smartphone')
+        stock = Stock.objects.create(product=product, quantity=10)
+        reservation = reserve(stock.id, 1, ttl=60, user=self.user)
+        profile = RequestProfile.objects.create(route='stock-list', method='GET', path='/api/v1/stock/', duration_ms=1, samples=1, collapsed_stacks='a;b 1')
+        self.url_kwargs = {
+            'category-detail': {'pk': category.id},
+            'product-detail': {'pk': product.id},
+            'stock-detail': {'pk': stock.id},
+            'stock-availability': {'pk': stock.id},
+            'reservation-detail': {'pk': reservation.id},
+            'async-category-detail': {'pk': category.id},
+            'async-product-detail': {'pk': product.id},
+            'async-stock-detail': {'pk': stock.id},
+            'profile-detail': {'pk': profile.id},
+            'profile-collapsed': {'pk': profile.id},
+        }
+
+    def test_every_get_route_declares_a_budget(self):
+        self.assertEqual(self.unbudgeted_routes(tes_app_urls.urlpatterns, exclude=('api-root',)), [])
+
+    def test_routes_within_budget(self):
+        # push-stream needs subscriptions and never ends; PushTestCase covers it
+        self.assertRouteBudgets(tes_app_urls.urlpatterns, self.url_kwargs, exclude=('api-root', 'push-stream'), **self.headers)
+
+    def test_middleware_reports_duplicated_queries(self):
+        @max_queries(1)
+        def chatty_view(request):
+            for category in Category.objects.all():
+                list(Product.objects.filter(category=category))
+            list(Product.objects.filter(category_id=0))
+            return HttpResponse()
+
+        request = RequestFactory().get('/chatty')
+        middleware = QueryBudgetMiddleware(lambda request: middleware.process_view(request, chatty_view, (), {}) or chatty_view(request))
+        with self.assertRaisesMessage(QueryBudgetExceeded, '2x SELECT'):
+            middleware(request)
+
+
+@override_settings(CACHES=FAKEREDIS_CACHES, METRICS_ENABLED=True)
+class RequestMetricsTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        metrics.registry.clear()
+        Category.objects.create(name='Electronics', description='Electronic items')
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/v1/categories/', **self.headers)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('3 queries', response['Server-Timing'])
+        self.assertIn('0 hits, 1 misses', response['Server-Timing'])
+        response = self.client.get('/api/v1/categories/', **self.headers)
+        self.assertIn('1 hits, 0 misses', response['Server-Timing'])
+
+    @override_settings(METRICS_TOKEN='scraper-secret')
+    def test_prometheus_endpoint(self):
+        self.client.get('/api/v1/categories/', **self.headers)
+        self.client.get('/api/v1/categories/', **self.headers)
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scraper-secret').content.decode()
+        labels = f'pid="{os.getpid()}",route="category-list",method="GET"'
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'http_request_cache_hits_total{{{labels}}} 1', body)
+        self.assertIn(f'http_requests_total{{{labels},status="200"}} 2', body)
+
+    def test_prometheus_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics', **self.headers).status_code, status.HTTP_403_FORBIDDEN)
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_200_OK)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PROFILE_SAMPLE_RATE=0, PROFILE_INTERVAL=0.001)
+class RequestProfilingTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        user = User.objects.create_user(username='reader@example.com', email='reader@example.com', password='Reader@1234')
+        self.user_headers = {'HTTP_AUTHORIZATION': bearer(user)}
+
+    def test_admin_header_profiles_request(self):
+        response = self.client.get('/api/v1/categories/', HTTP_X_PROFILE='1', **self.headers)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.route, 'category-list')
+
+        response = self.client.get('/api/v1/profiles/', **self.headers)
+        self.assertEqual(response.data['results'][0]['route'], 'category-list')
+        response = self.client.get(f'/api/v1/profiles/{profile.pk}/collapsed/', **self.headers)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+
+    async def test_async_view_profiled(self):
+        headers = {**self.async_headers, 'X-Profile': '1'}
+        response = await self.async_client.get('/api/v1/async/categories/', headers=headers)
+        profile = await RequestProfile.objects.aget(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.route, 'async-category-list')
+
+    def test_header_ignored_for_non_admins(self):
+        response = self.client.get('/api/v1/categories/', HTTP_X_PROFILE='1', **self.user_headers)
+        self.assertNotIn('X-Profile-Id', response)
+        response = self.client.get('/api/v1/profiles/', **self.user_headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stack_sampler_collapses_stacks(self):
+        sampler = StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        sampler.stop()
+        self.assertIn('tests.py:test_stack_sampler_collapses_stacks', sampler.collapsed())
+
+
+@override_settings(CACHES=FAKEREDIS_CACHES, CACHED_LIST_PAGES=2, ALLOWED_HOSTS=['testserver', 'localhost'])
+class CacheWarmingTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        inventory_cache.hits.flush()
+        cache.clear()
+        self.categories = [Category.objects.create(name=f'Category {i}', description='Synthetic') for i in range(12)]
+
+    def test_list_pages_cached_separately(self):
+        response = self.client.get('/api/v1/categories/', {'offset': 10}, **self.headers)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(len(cache.get('categories_offset_10')['results']), 2)
+        self.assertIsNone(cache.get('categories'))
+
+        response = self.client.get('/api/v1/categories/', {'limit': 5}, **self.headers)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(cache.get('categories'))
+
+        self.client.post('/api/v1/categories/', {'name': 'New', 'description': 'New category'}, **self.headers)
+        self.assertIsNone(cache.get('categories_offset_10'))
+
+    def test_warm_command_prefers_hottest_entries(self):
+        hottest = self.categories[-1]
+        for _ in range(3):
+            self.client.get(f'/api/v1/categories/{hottest.id}/', **self.headers)
+        cache.delete(f'category_{hottest.id}')
+
+        out = StringIO()
+        call_command('warm_inventory_cache', resources=['categories'], top=1, concurrency=1, stdout=out)
+        self.assertIn('Warmed 2 list pages and 1 detail entries', out.getvalue())
+        self.assertEqual(cache.get(f'category_{hottest.id}')['name'], hottest.name)
+        self.assertIsNone(cache.get(f'category_{self.categories[0].id}'))
+        self.assertEqual(cache.get('categories')['count'], 12)
+        self.assertEqual(cache.get('categories')['next'], 'http://localhost:8000/api/v1/categories/?limit=10&offset=10')
+
+    def test_warmed_pages_match_live_pages(self):
+        call_command('warm_inventory_cache', resources=['categories'], top=0, concurrency=1, stdout=StringIO())
+        warmed = cache.get('categories_offset_10')
+        cache.clear()
+        live = self.client.get('/api/v1/categories/', {'offset': 10}, **self.headers).data
+        self.assertEqual(warmed['results'], live['results'])
+        # Unordered, the database may page in any order (PostgreSQL, or SQLite after a VACUUM)
+        for viewset in (CategoryViewSet, ProductViewSet, StockViewSet):
+            self.assertEqual(viewset.queryset.query.order_by, ('pk',))
+
+
+class RedisCircuitBreakerTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        redis_client._breakers.clear()
+        Category.objects.create(name='Electronics', description='Electronic items')
+
+    @override_settings(CACHES=UNREACHABLE_REDIS_CACHES)
+    def test_serves_from_database_when_redis_is_down(self):
+        for _ in range(4):
+            response = self.client.get('/api/v1/categories/', **self.headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 1)
+        self.assertTrue(cache.client.breaker.is_open)
+
+    def test_probe_closes_breaker(self):
+        breaker = redis_client.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure(OSError())
+        breaker.record_failure(OSError())
+        self.assertFalse(breaker.allow(lambda: True))
+        breaker.opened_at -= 60
+        self.assertFalse(breaker.allow(lambda: False))
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow(lambda: True))
+        self.assertFalse(breaker.is_open)
+
+    @override_settings(CACHES=FAKEREDIS_CACHES)
+    def test_deletes_replayed_after_recovery(self):
+        cache.set('categories', {'stale': True})
+        breaker = cache.client.breaker
+        breaker.opened_at = time.monotonic()
+        cache.delete('categories')
+        breaker.opened_at -= breaker.reset_timeout
+        self.assertIsNone(cache.get('categories'))  # Replayed by the probe, before the read
+        self.assertFalse(breaker.is_open or breaker.has_pending)
+
+    @override_settings(CACHES=FAKEREDIS_CACHES)
+    def test_flushes_after_too_many_failed_deletes(self):
+        cache.set('categories', {'stale': True})
+        breaker = cache.client.breaker
+        breaker.opened_at = time.monotonic()
+        with mock.patch.object(redis_client.CircuitBreaker, 'MAX_PENDING_DELETES', 1):
+            with self.assertLogs('lib.redis_client', 'ERROR'):
+                cache.delete_many(['product_1', 'product_2'])
+        self.assertEqual((breaker.pending_deletes, breaker.flush_pending), (set(), True))
+        breaker.opened_at -= breaker.reset_timeout
+        self.assertIsNone(cache.get('categories'))
+
+
+class CompressionTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        compression.body_cache.clear()
+        Category.objects.bulk_create(Category(name=f'Category {i}', description='Synthetic category ' * 10) for i in range(10))
+
+    def test_threshold_compressor(self):
+        compressor = ThresholdCompressor({'COMPRESS_MIN_LENGTH': 100})
+        self.assertEqual(compressor.compress(b'short'), b'short')
+        value = b'x' * 1000
+        self.assertLess(len(compressor.compress(value)), len(value))
+        self.assertEqual(compressor.decompress(compressor.compress(value)), value)
+
+    @override_settings(CACHES={'default': {**FAKEREDIS_CACHES['default'], 'OPTIONS': {
+        **FAKEREDIS_CACHES['default']['OPTIONS'], 'COMPRESSOR': 'lib.cache_compressors.ThresholdCompressor'}}})
+    def test_cached_values_round_trip(self):
+        cache.set('small', {'a': 1})
+        cache.set('large', {'rows': ['row'] * 1000})
+        self.assertEqual(cache.get('small'), {'a': 1})
+        self.assertEqual(cache.get('large'), {'rows': ['row'] * 1000})
+
+    def test_negotiate(self):
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+        self.assertIsNone(compression.negotiate('gzip;q=0, identity'))
+        self.assertIsNone(compression.negotiate(''))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_list_response_compressed_once(self):
+        cache.clear()
+        for _ in range(2):
+            response = self.client.get('/api/v1/categories/', HTTP_ACCEPT_ENCODING='gzip', **self.headers)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(json.loads(gzip.decompress(response.content))['count'], 10)
+        self.assertEqual(len(compression.body_cache._entries), 1)
+
+        response = self.client.get('/api/v1/categories/', **self.headers)
+        self.assertNotIn('Content-Encoding', response)
+
+
+CATALOGUE_CSV = b"""name,category,price,description,quantity
+Smartphone,Electronics,999.99,Latest smartphone,5
+Laptop,Computers,1499.00,Thin laptop,
+Broken,Electronics,not-a-price,Bad row,1
+Tablet,Electronics,499.50,10 inch tablet,7
+"""
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogueImportTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(name='Electronics', description='Electronic items')
+
+    def test_command_imports_csv(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            f.write(CATALOGUE_CSV)
+            f.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_catalogue', f.name, batch_size=2, stdout=out, stderr=err)
+        self.assertIn('Imported 3 of 4 rows (1 rejected)', out.getvalue())
+        self.assertIn('line 4: price:', err.getvalue())
+        self.assertEqual(Category.objects.filter(name='Electronics').count(), 1)
+        self.assertEqual(Product.objects.get(name='Laptop').category.name, 'Computers')
+        self.assertEqual(Product.objects.get(name='Tablet').price, Decimal('499.50'))
+        self.assertEqual(Stock.objects.count(), 2)
+        self.assertEqual(Stock.objects.get(product__name='Smartphone').quantity, 5)
+
+    def test_row_checks(self):
+        def error(**row):
+            row = {'name': 'Mouse', 'category': 'Electronics', 'price': '19.99', 'description': 'Wireless', **row}
+            with self.assertRaises(catalogue_import.RowError) as raised:
+                catalogue_import.clean_row(json.dumps(row))
+            return str(raised.exception)
+
+        self.assertEqual(catalogue_import.clean_row('{"name": "Mouse", "category": "Electronics", "price": 19.5, "description": "Wireless", "quantity": 3}'),
+                         catalogue_import.CatalogueRow('Electronics', 'Mouse', Decimal('19.5'), 'Wireless', 3))
+        self.assertTrue(error(name='').startswith('name: '))
+        self.assertTrue(error(name='x' * 101).startswith('name: Ensure this value has at most 100 characters'))
+        self.assertTrue(error(price='1.999').startswith('price: '))
+        self.assertTrue(error(price='123456789.00').startswith('price: '))
+        self.assertTrue(error(price='NaN').startswith('price: '))
+        self.assertTrue(error(quantity=-1).startswith('quantity: '))
+        self.assertTrue(error(quantity='2.5').startswith('quantity: '))
+        self.assertTrue(error(quantity=True).startswith('quantity: '))
+        self.assertFalse(Stock.objects.filter(product__name='Laptop').exists())
+
+    def test_resume_after_failed_chunk(self):
+        insert = catalogue_import.insert_returning_ids
+        calls = []
+
+        def fail_second_chunk(model, columns, rows):
+            if model is Stock:
+                calls.append(rows)
+                if len(calls) > 1:
+                    raise RuntimeError('disk full')
+            return insert(model, columns, rows)
+
+        with mock.patch.object(catalogue_import, 'insert_returning_ids', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                import_catalogue(BytesIO(CATALOGUE_CSV), 'csv', 'catalogue.csv', batch_size=2)
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.rows_done, Product.objects.count()), ('failed', 2, 2))
+
+        job = import_catalogue(BytesIO(CATALOGUE_CSV), 'csv', 'catalogue.csv', job=job, batch_size=2)
+        self.assertEqual((job.status, job.rows_done, job.rows_imported, job.rows_failed), ('done', 4, 3, 1))
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_upload_endpoint(self):
+        headers = {'HTTP_AUTHORIZATION': bearer(User.objects.get(email='superuser@gmail.com'))}
+        cache.set('products', {'stale': True})
+        upload = SimpleUploadedFile('catalogue.ndjson', b'{"name": "Mouse", "category": "Electronics", "price": "19.99", "description": "Wireless", "quantity": 3}\nnot json\n')
+        response = self.client.post('/api/v1/catalogue/import/', {'file': upload}, format='multipart', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['rows_imported'], response.data['rows_failed']), (1, 1))
+        self.assertEqual(Stock.objects.get(product__name='Mouse').quantity, 3)
+        self.assertIsNone(cache.get('products'))
+
+        user = User.objects.create_user(username='reader@example.com', email='reader@example.com', password='Reader@1234')
+        response = self.client.post('/api/v1/catalogue/import/', {'file': SimpleUploadedFile('c.csv', CATALOGUE_CSV)}, format='multipart',
+                                    HTTP_AUTHORIZATION=bearer(user))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class InventoryExportTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Electronics', description='Electronic items')
+        for i in range(3):
+            product = Product.objects.create(name=f'Phone {i}', category=category, price='100.50', description='Phone')
+            Stock.objects.create(product=product, quantity=i)
+
+    def test_csv_export(self):
+        response = self.client.get('/api/v1/catalogue/export/', **self.headers)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'stock_id,quantity,last_updated,product_id,product_name,price,product_description,category_id,category_name')
+        self.assertEqual(len(lines), 4)
+        self.assertIn(',Phone 0,100.50,Phone,', lines[1])
+
+    def test_incremental_columnar_export(self):
+        since = self.client.get('/api/v1/catalogue/export/', **self.headers)['X-Export-Started-At']
+        Stock.objects.filter(product__name='Phone 2').update(quantity=9, last_updated=timezone.now())
+        response = self.client.get('/api/v1/catalogue/export/', {'output': 'columnar', 'since': since}, **self.headers)
+        chunks = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0]['columns']['product_name'], ['Phone 2'])
+        self.assertEqual(chunks[0]['columns']['quantity'], [9])
+
+        response = self.client.get('/api/v1/catalogue/export/', {'since': 'yesterday'}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_streams_under_asgi(self):
+        response = await self.async_client.get('/api/v1/catalogue/export/', {'output': 'ndjson'}, headers=self.async_headers)
+        self.assertTrue(response.is_async)  # A sync iterator would be buffered whole
+        rows = [json.loads(line) async for chunk in response.streaming_content for line in chunk.splitlines()]
+        self.assertEqual([row['quantity'] for row in rows], [0, 1, 2])
+
+    def test_command_writes_ndjson(self):
+        out = StringIO()
+        call_command('export_inventory', format='ndjson', chunk_size=2, stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['quantity'] for row in rows], [0, 1, 2])
+        self.assertEqual(rows[0]['price'], '100.50')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHANGE_FEED_OVERLAP=0)
+class ChangeFeedTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.category = Category.objects.create(name='Electronics', description='Electronic items')
+        self.phone = Product.objects.create(name='Smartphone', category=self.category, price='999.99', description='Phone')
+        self.laptop = Product.objects.create(name='Laptop', category=self.category, price='1499.00', description='Laptop')
+        self.stock = Stock.objects.create(product=self.laptop, quantity=3)
+
+    def test_returns_only_changes_since_token(self):
+        token = self.client.get('/api/v1/changes/', **self.headers).data['next_token']
+        self.client.put(f'/api/v1/item/{self.phone.id}/', {'name': 'Smartphone 2', 'category': self.category.id, 'price': '899.99', 'description': 'Phone'}, **self.headers)
+        self.client.delete(f'/api/v1/item/{self.laptop.id}/', **self.headers)
+
+        response = self.client.get('/api/v1/changes/', {'since': token}, **self.headers)
+        self.assertEqual([product['name'] for product in response.data['products']], ['Smartphone 2'])
+        self.assertEqual(response.data['categories'], [])
+        self.assertEqual(response.data['deleted'], {'categories': [], 'products': [self.laptop.id], 'stock': [self.stock.id]})
+
+        response = self.client.get('/api/v1/changes/', {'since': response.data['next_token']}, **self.headers)
+        self.assertEqual((response.data['products'], response.data['deleted']['products']), ([], []))
+
+    @override_settings(CHANGE_FEED_LIMIT=2)
+    def test_pages_through_rows_sharing_a_timestamp(self):
+        token = self.client.get('/api/v1/changes/', **self.headers).data['next_token']
+        Product.objects.update(updated_at=timezone.now())  # Same timestamp on both
+        Product.objects.create(name='Mouse', category=self.category, price='9.99', description='Mouse')
+        Stock.objects.filter(pk=self.stock.pk).delete()
+
+        pages = []
+        while not pages or pages[-1]['has_more']:
+            pages.append(self.client.get('/api/v1/changes/', {'since': token}, **self.headers).data)
+            token = pages[-1]['next_token']
+            if len(pages) == 1:
+                Category.objects.filter(pk=self.category.pk).update(updated_at=timezone.now())  # While paging
+        self.assertEqual(len(pages), 2)
+        self.assertEqual([p['name'] for page in pages for p in page['products']], ['Smartphone', 'Laptop', 'Mouse'])
+        self.assertEqual(pages[1]['deleted']['stock'], [self.stock.id])
+        self.assertNotIn('.', token)
+
+        response = self.client.get('/api/v1/changes/', {'since': token}, **self.headers)
+        self.assertEqual([c['name'] for c in response.data['categories']], ['Electronics'])
+
+    def test_timestamps_come_from_database_clock(self):
+        token = self.client.get('/api/v1/changes/', **self.headers).data['next_token']
+        behind = timezone.now() - timezone.timedelta(hours=1)
+        with mock.patch('django.utils.timezone.now', return_value=behind):  # An app server with a slow clock
+            Product.objects.filter(pk=self.phone.pk).update(name='Smartphone 2', updated_at=behind)
+            Stock.objects.filter(pk=self.stock.pk).delete()
+
+        response = self.client.get('/api/v1/changes/', {'since': token}, **self.headers)
+        self.assertEqual([p['name'] for p in response.data['products']], ['Smartphone 2'])
+        self.assertEqual(response.data['deleted']['stock'], [self.stock.id])
+
+    def test_invalid_and_expired_tokens(self):
+        response = self.client.get('/api/v1/changes/', {'since': 'abc'}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/v1/changes/', {'since': '0'}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PUSH_BROKER='memory', PUSH_HEARTBEAT=0.05)
+class PushTestCase(AuthenticatedTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        pubsub._brokers.clear()
+        self.category = Category.objects.create(name='Electronics', description='Electronic items')
+        self.product = Product.objects.create(name='Smartphone', category=self.category, price='999.99', description='Phone')
+
+    def save_stock(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(product=self.product, quantity=quantity)
+
+    async def test_validates_subscriptions(self):
+        response = await self.async_client.get('/api/v1/stream/', {'product': self.product.id})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get('/api/v1/stream/', headers=self.async_headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.async_client.get('/api/v1/stream/', {'product': '1,x'}, headers=self.async_headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refuses_to_stream_under_wsgi(self):
+        response = self.client.get('/api/v1/stream/', {'product': self.product.id}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertFalse(response.streaming)
+
+    async def test_streams_stock_changes_of_subscribed_category(self):
+        response = await self.async_client.get('/api/v1/stream/', {'category': self.category.id}, headers=self.async_headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'retry: 5000\n\n')
+
+        await sync_to_async(self.save_stock)(7)
+        event = (await anext(events)).decode()
+        self.assertTrue(event.startswith('data: '))
+        message = json.loads(event[len('data: '):])
+        self.assertEqual((message['type'], message['data']['quantity']), ('stock', 7))
+
+        self.assertEqual(await anext(events), b': keepalive\n\n')
+
+        # Servers cancel the response when the client disconnects
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(dict(pubsub.get_broker()._subscriptions), {})
+
+    @override_settings(PUSH_BROKER='redis')
+    def test_redis_broker_needs_redis_cache(self):
+        self.assertEqual([error.id for error in pubsub.check_push_broker(None)], ['pubsub.E001'])
+        with self.assertRaises(ImproperlyConfigured):
+            pubsub.get_broker()
+        with override_settings(CACHES=FAKEREDIS_CACHES):
+            self.assertEqual(pubsub.check_push_broker(None), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductSearchTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.phones = Category.objects.create(name='Phones', description='')
+        self.phone = Product.objects.create(name='Smartphone X', category=self.phones, price='999.99', description='OLED screen')
+        self.case = Product.objects.create(name='Leather case', category=self.phones, price='19.99', description='Fits the smartphone X')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/v1/item/search/', {'q': q, **params}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_ranks_name_matches_first_and_matches_prefixes(self):
+        data = self.search('smartph')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([product['id'] for product in data['results']], [self.phone.id, self.case.id])
+        self.assertEqual([product['name'] for product in self.search('phones leather')['results']], ['Leather case'])
+        self.assertEqual(self.search('')['count'], 0)
+        self.assertEqual(self.search('tablet')['count'], 0)
+        self.assertEqual(len(self.search('smartph', limit=1)['results']), 1)
+
+    def test_only_last_word_is_a_prefix(self):
+        self.assertEqual([product['name'] for product in self.search('leather cas')['results']], ['Leather case'])
+        self.assertEqual(self.search('leath case')['count'], 0)
+
+    def test_index_follows_writes(self):
+        self.client.put(f'/api/v1/item/{self.phone.id}/', {'name': 'Tablet', 'category': self.phones.id, 'price': '899.99', 'description': 'Big screen'}, **self.headers)
+        Product.objects.bulk_create([Product(name='Tablet stand', category=self.phones, price='9.99', description='')])
+        self.assertEqual(sorted(product['name'] for product in self.search('tablet')['results']), ['Tablet', 'Tablet stand'])
+
+        Category.objects.filter(pk=self.phones.pk).update(name='Mobiles')
+        self.assertEqual(self.search('mobiles')['count'], 3)
+        self.case.delete()
+        self.assertEqual(self.search('leather')['count'], 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LowStockTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Electronics', description='Electronic items')
+        self.product = Product.objects.create(name='Smartphone', category=category, price='999.99', description='Phone')
+        self.stock = Stock.objects.create(product=self.product, quantity=10, reorder_point=5)
+        self.events = []
+        low_stock.connect(self.record, dispatch_uid='test_low_stock')
+        self.addCleanup(low_stock.disconnect, dispatch_uid='test_low_stock')
+
+    def record(self, sender, stock, low, **kwargs):
+        self.events.append((stock.pk, low))
+
+    def update(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/v1/stock/{self.stock.id}/', {'product': self.product.id, 'quantity': quantity, 'reorder_point': 5}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_only_crossings_touch_alerts(self):
+        self.update(4)
+        with self.assertNumQueries(4):  # Token user, stock, product, update: no alert write
+            self.update(3)
+        response = self.client.get('/api/v1/stock/low/', **self.headers)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual((response.data['results'][0]['stock'], response.data['results'][0]['quantity']), (self.stock.id, 3))
+
+        self.update(8)
+        self.assertFalse(LowStockAlert.objects.exists())
+        self.assertEqual(self.events, [(self.stock.id, True), (self.stock.id, False)])
+
+    def test_rescan_reconciles_bulk_updates(self):
+        Stock.objects.filter(pk=self.stock.pk).update(quantity=1)
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rescan_low_stock', stdout=out)
+        self.assertIn('Opened 1 and closed 0', out.getvalue())
+        self.assertEqual(self.events, [(self.stock.id, True)])
+
+        Stock.objects.filter(pk=self.stock.pk).update(quantity=9)
+        call_command('rescan_low_stock', stdout=out)
+        self.assertFalse(LowStockAlert.objects.exists())
+
+
+def provisioning_row(index, **fields):
+    return {'first_name': 'Staff', 'last_name': str(index), 'email': f'staff{index}@example.com', 'address': 'Street 1',
+            'pin_code': '110001', 'city': 'Delhi', 'country': 'India', 'password': f'Secret@{index}', **fields}
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserProvisioningTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+
+    def test_upload_creates_new_users_and_reports_the_rest(self):
+        rows = [
+            provisioning_row(1),
+            provisioning_row(2, password=''),
+            provisioning_row(3, email='not-an-email'),
+            provisioning_row(4, password='weak'),
+            provisioning_row(5, email='superuser@gmail.com'),
+            provisioning_row(6, email='staff1@example.com'),
+        ]
+        upload = SimpleUploadedFile('staff.json', json.dumps(rows).encode(), content_type='application/json')
+        with mock.patch('lib.password_hashing.ProcessPoolExecutor') as pool:
+            response = self.client.post('/api/v1/user_action/provision/', {'file': upload}, format='multipart', **self.headers)
+        pool.assert_not_called()  # Hashed in the web worker's own process
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['existing'], response.data['failed']), (2, 1, 3))
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4, 6])
+
+        staff = User.objects.get(email='staff1@example.com')
+        self.assertTrue(staff.check_password('Secret@1'))
+        self.assertEqual(list(staff.groups.values_list('name', flat=True)), ['read'])
+        self.assertFalse(User.objects.get(email='staff2@example.com').has_usable_password())
+
+    @override_settings(USER_PROVISIONING_MAX_PASSWORDS=1)
+    def test_upload_limits_passwords_to_hash(self):
+        rows = [provisioning_row(1), provisioning_row(2, password=''), provisioning_row(3)]
+        upload = SimpleUploadedFile('staff.json', json.dumps(rows).encode(), content_type='application/json')
+        response = self.client.post('/api/v1/user_action/provision/', {'file': upload}, format='multipart', **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(email__startswith='staff').exists())
+
+        upload = SimpleUploadedFile('staff.json', json.dumps(rows[:2]).encode(), content_type='application/json')
+        response = self.client.post('/api/v1/user_action/provision/', {'file': upload}, format='multipart', **self.headers)
+        self.assertEqual(response.data['created'], 2)
+
+    def test_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            provision_users(enumerate([provisioning_row(index) for index in range(3)]))
+        with CaptureQueriesContext(connection) as many:
+            provision_users(enumerate([provisioning_row(index) for index in range(100, 160)]))
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(User.objects.filter(groups__name='read', email__startswith='staff').count(), 63)
+
+    def test_hashes_on_a_process_pool(self):
+        hashed = hash_passwords(['Secret@1', '', 'Secret@3'], workers=2)
+        self.assertTrue(check_password('Secret@3', hashed[2]))
+        self.assertFalse(is_password_usable(hashed[1]))
+
+    def test_command_reads_csv(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(provisioning_row(1)))
+            writer.writeheader()
+            writer.writerows([provisioning_row(1), provisioning_row(2)])
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('provision_users', handle.name, '--workers', '1', stdout=out)
+        self.assertIn('Created 2 users', out.getvalue())
+
+
+class UserDirectoryTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        User.objects.bulk_create([
+            User(username='asha', email='Asha.Rao@example.com', name='Asha Rao', city='Mumbai', country='India', password='!'),
+            User(username='ben', email='ben@example.org', name='Ben Muller', city='Munich', country='Germany', password='!'),
+            User(username='chen', email='chen@example.com', name='Chen Li', city='Delhi', country='India', password='!'),
+        ])
+
+    def emails(self, **params):
+        response = self.client.get('/api/v1/user_action/', params, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(user['email'] for user in response.data['results'])
+
+    def test_case_insensitive_prefix_filters(self):
+        self.assertEqual(self.emails(email='asha.'), ['Asha.Rao@example.com'])
+        self.assertEqual(self.emails(name='BEN'), ['ben@example.org'])
+        self.assertEqual(self.emails(city='mu'), ['Asha.Rao@example.com', 'ben@example.org'])
+        self.assertEqual(self.emails(country='india', city='del'), ['chen@example.com'])
+        self.assertEqual(self.emails(search='mun'), ['ben@example.org'])
+        self.assertEqual(self.emails(search='ch'), ['chen@example.com'])
+
+    def test_non_ascii_prefixes(self):
+        User.objects.bulk_create([User(username='emre', email='emre@example.com', name='Émile Öz', city='Zürich', country='Switzerland', password='!')])
+        self.assertEqual(self.emails(city='zü'), ['emre@example.com'])
+        self.assertEqual(self.emails(name='Émile'), ['emre@example.com'])
+        self.assertEqual(self.emails(name='ben' + chr(sys.maxunicode)), [])
+        self.assertEqual(next_prefix('a' + chr(sys.maxunicode)), 'b')
+        self.assertEqual(next_prefix('\ud7ff'), '\ue000')
+
+    def test_results_are_paginated(self):
+        response = self.client.get('/api/v1/user_action/', {'items_per_page': 2}, **self.headers)
+        users = User.objects.count()
+        self.assertEqual((response.data['count'], response.data['total_pages'], len(response.data['results'])), (users, -(-users // 2), 2))
+
+    def test_prefix_filter_seeks_the_lower_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite query plan')
+        queryset = UserFilterClass({'city': 'mu'}, queryset=User.objects.all()).qs
+        self.assertIn('USING INDEX user_city_lower_idx', queryset.explain())
+
+
+@override_settings(CACHES=FAKEREDIS_CACHES)
+class BatchRetrieveTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(name='Electronics', description='Electronic items')
+        self.products = [Product.objects.create(name=f'Product {i}', category=category, price='9.99', description='') for i in range(3)]
+        self.stock = Stock.objects.create(product=self.products[0], quantity=4)
+
+    def test_returns_products_in_request_order_with_one_query_for_misses(self):
+        first, second, third = self.products
+        self.client.get(f'/api/v1/item/{second.id}/', **self.headers)
+        ids = f'{third.id},{first.id},999999,{second.id},{third.id}'
+
+        with self.assertNumQueries(2):  # Token user, then only the two misses
+            response = self.client.get('/api/v1/item/', {'ids': ids}, **self.headers)
+        self.assertEqual([product['id'] for product in response.data['results']], [third.id, first.id, second.id])
+        self.assertEqual(response.data['missing'], [999999])
+        self.assertEqual(cache.get(f'product_{first.id}')['name'], 'Product 0')
+
+        with self.assertNumQueries(1):  # All cached; unknown ids would still be looked up
+            response = self.client.get('/api/v1/item/', {'ids': f'{first.id},{second.id},{third.id}'}, **self.headers)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_stock_and_invalid_ids(self):
+        response = self.client.get('/api/v1/stock/', {'ids': str(self.stock.id)}, **self.headers)
+        self.assertEqual(response.data['results'][0]['quantity'], 4)
+        response = self.client.get('/api/v1/stock/', {'ids': '1,x'}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(INVENTORY_BATCH_MAX_IDS=2):
+            response = self.client.get('/api/v1/item/', {'ids': '1,2,3'}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+TEST_RATE_LIMITS = {
+    'auth': {'routes': ['login'], 'methods': ['POST'], 'key': 'ip', 'rate': '2/m'},
+    'api': {'key': 'user_or_ip', 'rate': '60/m', 'burst': 3},
+}
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS=TEST_RATE_LIMITS)
+class RateLimitTestCase(APITestCase):
+
+    def setUp(self):
+        rate_limit.memory_buckets.clear()
+        self.addCleanup(rate_limit.memory_buckets.clear)
+        self.login = {'email': 'superuser@gmail.com', 'password': 'wrong'}
+
+    def test_login_limited_per_ip_in_redis(self):
+        with self.settings(CACHES=FAKEREDIS_CACHES):
+            cache.clear()
+            for remaining in ('1', '0'):
+                response = self.client.post('/v1/api/login', self.login)
+                self.assertNotEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+                self.assertEqual(response['X-RateLimit-Limit'], '2')
+                self.assertEqual(response['X-RateLimit-Remaining'], remaining)
+
+            response = self.client.post('/v1/api/login', self.login)
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response['Retry-After'], '30')
+            self.assertTrue(cache.client.get_client().exists(cache.make_key('ratelimit:auth:ip:127.0.0.1')))
+
+            response = self.client.post('/v1/api/login', self.login, REMOTE_ADDR='10.0.0.2')
+            self.assertNotEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_api_limited_per_user_in_memory(self):
+        users = [User.objects.get(email='superuser@gmail.com'), User.objects.create_user(username='other', email='other@example.com')]
+        first, second = [{'HTTP_AUTHORIZATION': bearer(user)} for user in users]
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/v1/categories/', **first).status_code, status.HTTP_200_OK)
+
+        response = self.client.get('/api/v1/categories/', **first)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['X-RateLimit-Limit'], '3')
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.client.get('/api/v1/categories/', **second).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(CACHES=LOCMEM_CACHES, TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_forwarded_for_only_from_trusted_proxies(self):
+        def limited(remote_addr, forwarded_for):
+            response = self.client.post('/v1/api/login', self.login, REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for)
+            return response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+        # Behind the proxy, each forwarded client has its own bucket; a
+        # spoofed entry left of the real one changes nothing.
+        self.assertEqual([limited('10.0.0.1', f'{spoofed}, 203.0.113.7, 10.0.0.9') for spoofed in ('1.1.1.1', '2.2.2.2', '3.3.3.3')], [False, False, True])
+        self.assertFalse(limited('10.0.0.1', '203.0.113.8'))
+        # Anyone else's header is ignored.
+        self.assertEqual([limited('198.51.100.1', f'203.0.113.{host}') for host in (9, 10, 11)], [False, False, True])
+
+
+
+class ReservationTestCase(AuthenticatedTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Electronics', description='Electronic items')
+        product = Product.objects.create(name='Smartphone', category=category, price='999.99', description='Phone')
+        self.stock = Stock.objects.create(product=product, quantity=5, reorder_point=2)
+
+    def reserve(self, quantity, **data):
+        return self.client.post('/api/v1/reservations/', {'stock': self.stock.id, 'quantity': quantity, **data}, **self.headers)
+
+    def availability(self):
+        return self.client.get(f'/api/v1/stock/{self.stock.id}/availability/', **self.headers).data
+
+    def test_holds_never_exceed_quantity(self):
+        response = self.reserve(3)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], Reservation.HELD)
+        self.assertEqual(self.reserve(3).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.reserve(2).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.availability(), {'id': self.stock.id, 'quantity': 5, 'reserved': 5, 'available': 0})
+        self.assertEqual(Reservation.objects.count(), 2)  # The refused hold was rolled back
+
+        self.assertEqual(self.reserve(1, ttl=settings.RESERVATION_MAX_TTL + 1).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post('/api/v1/reservations/', {'stock': 0, 'quantity': 1}, **self.headers).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('reserved', self.client.get(f'/api/v1/stock/{self.stock.id}/', **self.headers).data)
+
+    def test_release_and_confirm_settle_once(self):
+        held = self.reserve(2).data['id']
+        self.assertEqual(self.client.post(f'/api/v1/reservations/{held}/release/', **self.headers).data['status'], Reservation.RELEASED)
+        self.assertEqual(self.client.post(f'/api/v1/reservations/{held}/release/', **self.headers).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.availability()['reserved'], 0)
+
+        held = self.reserve(4).data['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/v1/reservations/{held}/confirm/', **self.headers)
+        self.assertEqual(response.data['status'], Reservation.CONFIRMED)
+        self.assertEqual(self.client.post(f'/api/v1/reservations/{held}/confirm/', **self.headers).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.availability(), {'id': self.stock.id, 'quantity': 1, 'reserved': 0, 'available': 1})
+        self.assertTrue(LowStockAlert.objects.filter(stock=self.stock).exists())
+
+    def test_expired_holds_are_swept(self):
+        first, second = reserve(self.stock.id, 3, ttl=60), reserve(self.stock.id, 2, ttl=60)
+        Reservation.objects.filter(pk__in=[first.pk, second.pk]).update(expires_at=timezone.now())
+        self.assertEqual(self.availability()['available'], 5)
+        self.assertEqual(self.client.post(f'/api/v1/reservations/{first.pk}/confirm/', **self.headers).status_code, status.HTTP_409_CONFLICT)
+
+        self.assertEqual(self.reserve(4).status_code, status.HTTP_201_CREATED)  # Fits once the expired holds are swept
+        self.assertEqual(set(Reservation.objects.filter(status=Reservation.EXPIRED).values_list('pk', flat=True)), {first.pk, second.pk})
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 4)
+
+        Reservation.objects.update(expires_at=timezone.now())
+        out = StringIO()
+        call_command('sweep_reservations', stdout=out)
+        self.assertIn('Expired 1 reservations', out.getvalue())
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.reserved, 0)
+
+    def test_stock_saves_keep_reserved(self):
+        stale = Stock.objects.get(pk=self.stock.pk)
+        reserve(self.stock.id, 2, ttl=60)
+        stale.quantity = 6
+        stale.save()
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.quantity, self.stock.reserved), (6, 2))
+
+    def test_holds_are_private(self):
+        held = self.reserve(1).data['id']
+        other = User.objects.create_user(username='other', email='other@example.com')
+        headers = {'HTTP_AUTHORIZATION': bearer(other)}
+        self.assertEqual(self.client.get(f'/api/v1/reservations/{held}/', **headers).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.post(f'/api/v1/reservations/{held}/release/', **headers).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/api/v1/reservations/{held}/', **self.headers).data['quantity'], 1)
@@ -1,7 +1,8 @@
 from .views import *
 from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .inventry import CategoryViewSet, ProductViewSet, StockViewSet
+from .inventry import CategoryViewSet, ProductViewSet, StockViewSet, ReservationViewSet, CatalogueImportAPI, CatalogueExportAPI, ChangeFeedAPI
+from . import async_inventry, push
 
 
 user_action_router = DefaultRouter()
@@ -10,10 +11,14 @@ user_action_router.register(r'user_action', UserOperations, basename='user_actio
 assign_role_router = DefaultRouter()
 assign_role_router.register(r'assign_role', AssignRoleToUSer, basename='assign_role')
 
+profile_router = DefaultRouter()
+profile_router.register(r'profiles', RequestProfileViewSet, basename='profile')
+
 inventry = DefaultRouter()
 inventry.register(r'categories', CategoryViewSet)
 inventry.register(r'item', ProductViewSet)
 inventry.register(r'stock', StockViewSet)
+inventry.register(r'reservations', ReservationViewSet)
 
 urlpatterns = [
     path('', index, name='welcome'),
@@ -25,4 +30,15 @@ urlpatterns = [
     re_path(r'^api/v1/', include(user_action_router.urls)),
     re_path(r'^api/v1/', include(assign_role_router.urls)),
     re_path(r'^api/v1/', include(inventry.urls)),
+    re_path(r'^api/v1/', include(profile_router.urls)),
+    path('api/v1/catalogue/import/', CatalogueImportAPI.as_view(), name='catalogue-import'),
+    path('api/v1/catalogue/export/', CatalogueExportAPI.as_view(), name='catalogue-export'),
+    path('api/v1/changes/', ChangeFeedAPI.as_view(), name='change-feed'),
+    path('api/v1/stream/', push.stock_stream, name='push-stream'),
+    path('api/v1/async/categories/', async_inventry.category_list, name='async-category-list'),
+    path('api/v1/async/categories/<int:pk>/', async_inventry.category_detail, name='async-category-detail'),
+    path('api/v1/async/item/', async_inventry.product_list, name='async-product-list'),
+    path('api/v1/async/item/<int:pk>/', async_inventry.product_detail, name='async-product-detail'),
+    path('api/v1/async/stock/', async_inventry.stock_list, name='async-stock-list'),
+    path('api/v1/async/stock/<int:pk>/', async_inventry.stock_detail, name='async-stock-detail'),
 ]
\ No newline at end of file
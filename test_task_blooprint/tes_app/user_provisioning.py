@@ -0,0 +1,112 @@
+"""
+Bulk user provisioning from CSV or JSON.
+
+Each row has the fields of a single user create (first_name, last_name,
+email, address, pin_code, city, country) and an optional password; users
+without one get an unusable password and set theirs through the reset flow.
+
+Creating users one at a time costs a duplicate-email query, a password hash
+and the group queries of User.save per user. Here existing emails are looked
+up in one query per IN batch, passwords are hashed on a process pool
+(lib/password_hashing.py; in-process for the API endpoint), users are inserted with bulk_create and the
+default 'read' group is assigned with one bulk insert into the groups
+through table, all in one transaction.
+"""
+import csv
+import io
+import json
+
+from django.contrib.auth.models import Group
+from django.db import connection, transaction
+from django.db.models import Q
+
+from lib.password_hashing import hash_passwords
+from .models import User
+from .serialization import ProvisionUserSerial
+
+FORMATS = ('csv', 'json')
+MAX_STORED_ERRORS = 100
+DEFAULT_GROUP = 'read'
+
+
+def guess_format(filename):
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename.lower().endswith('.json'):
+        return 'json'
+    return None
+
+
+def read_rows(stream, fmt):
+    """(line or index, raw row) pairs from a binary CSV stream or JSON array."""
+    if fmt == 'csv':
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        return [(reader.line_num, row) for row in reader]
+    try:
+        rows = json.load(io.TextIOWrapper(stream, encoding='utf-8-sig'))
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of users")
+    return list(enumerate(rows, 1))
+
+
+def provision_users(rows, workers=None, batch_size=1000):
+    """
+    Creates the valid rows whose email is not taken yet. `rows` are
+    (line, raw row) pairs; returns a report of what was created and skipped.
+    """
+    valid, errors, seen = [], [], set()
+    for line, raw in rows:
+        serializer = ProvisionUserSerial(data=raw if isinstance(raw, dict) else {})
+        if not serializer.is_valid():
+            errors.append({'line': line, 'error': {field: [str(e) for e in messages] for field, messages in serializer.errors.items()}})
+            continue
+        email = serializer.validated_data['email']
+        if email in seen:
+            errors.append({'line': line, 'error': {'email': [f'{email} appears more than once']}})
+            continue
+        seen.add(email)
+        valid.append((line, serializer.validated_data))
+
+    # Usernames are the emails too, and both are unique. Batches stay under
+    # SQLite's bound-parameter limit.
+    emails = [data['email'] for _, data in valid]
+    existing = set()
+    for start in range(0, len(emails), 450):
+        batch = emails[start:start + 450]
+        for email, username in User.objects.filter(Q(email__in=batch) | Q(username__in=batch)).values_list('email', 'username'):
+            existing.update({email, username})
+    existing.intersection_update(emails)
+    new = [(line, data) for line, data in valid if data['email'] not in existing]
+
+    passwords = hash_passwords([data.get('password', '') for _, data in new], workers=workers)
+    users = [
+        User(
+            username=data['email'], email=data['email'], password=password,
+            name=data['first_name'] + ' ' + data['last_name'], first_name=data['first_name'], last_name=data['last_name'],
+            address=data['address'], pin_code=data['pin_code'], city=data['city'], country=data['country'],
+        )
+        for (_, data), password in zip(new, passwords)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        if connection.features.can_return_rows_from_bulk_insert:
+            user_ids = [user.pk for user in users]
+        else:
+            new_emails = [user.email for user in users]
+            ids = {}
+            for start in range(0, len(new_emails), 900):
+                ids.update(User.objects.filter(email__in=new_emails[start:start + 900]).values_list('email', 'pk'))
+            user_ids = [ids[email] for email in new_emails]
+        group, _ = Group.objects.get_or_create(name=DEFAULT_GROUP)
+        Membership = User.groups.through
+        Membership.objects.bulk_create([Membership(user_id=pk, group_id=group.pk) for pk in user_ids], batch_size=batch_size)
+
+    return {
+        'created': len(users),
+        'existing': len(existing),
+        'existing_emails': sorted(existing)[:MAX_STORED_ERRORS],
+        'failed': len(errors),
+        'errors': errors[:MAX_STORED_ERRORS],
+    }
@@ -2,41 +2,33 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.generics import GenericAPIView
 from rest_framework import permissions
-from .models import User
+from .models import User, RequestProfile
 from django.http import JsonResponse
-from drf_yasg.utils import swagger_auto_schema
+from lib.api_docs import openapi, swagger_auto_schema
 from .serialization import *
 from rest_framework import viewsets
 from rest_framework.parsers import MultiPartParser
 from tes_app.filter_classes import UserFilterClass
 from lib.pagination import CustomPageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_yasg import openapi
 from django.core.mail import send_mail
-from test_task import settings
-from django.shortcuts import render
+from django.conf import settings
+from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse
+from rest_framework.decorators import action
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
-# from django_ratelimit.decorators import ratelimit
 # from django.utils.decorators import method_decorator
-from .permissions import IsAdmin, IsWrite, IsRead
+from .permissions import IsAdmin, IsWrite, IsRead, user_group_names
+from lib.query_budget import max_queries
 from lib.custom_permissions import IsAdminOrReadOnlyParmission
 from django.contrib.auth.models import Group
+from .user_provisioning import guess_format, provision_users, read_rows
 
+@max_queries(0)
 def index(request):
     return render(request, 'index.html')
 
-def password_check(passwd):
-    flag = 0
-    import re
-    if not re.search("[A-Z]", passwd):
-        flag = 1
-    if not re.search("[0-9]", passwd):
-        flag = 2
-    if not re.search("[@$!%*#?&]", passwd):
-        flag = 3
-    return flag
-
 def send_email(email, link, jwt_token):
     """
     Function to send email to employee.
@@ -52,6 +44,7 @@ class RegisterAPI(GenericAPIView):
     serializer_class = RegisterSerialization
 
     @swagger_auto_schema(tags=['Authentication'])
+    @max_queries(6)
     def post(self, request, *args, **kwargs):
         first_name = request.data.get('first_name')
         last_name = request.data.get('last_name')
@@ -81,6 +74,7 @@ class LoginAPI(GenericAPIView):
     serializer_class = LoginSerialization
 
     @swagger_auto_schema(tags=['Authentication'])
+    @max_queries(2)
     def post(self, request, *args, **kwargs):
         email = request.data.get('email')
         password = request.data.get('password')
@@ -100,10 +94,6 @@ class LoginAPI(GenericAPIView):
         else:
             return Response({"message": "Invalid Password!"}, status=status.HTTP_400_BAD_REQUEST)
 
-    # @ratelimit(key='ip', rate='2/m', method=['POST'], block=True)
-    # def dispatch(self, *args, **kwargs):
-    #     return super().dispatch(*args, **kwargs)
-
 class LogOutAPI(GenericAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     authentication_classes = (JWTAuthentication,)
@@ -190,41 +180,51 @@ class UserOperations(viewsets.ViewSet):
     authentication_classes = (JWTAuthentication,)
     serializer_class = UserSerial
     filter_class = UserFilterClass
-    filterset_fields = ["id", 'email', 'name']
+    filterset_fields = ["id", 'email', 'name', 'city', 'country']
     pagination_class = CustomPageNumberPagination
     filter_backends = [DjangoFilterBackend]
     swagger_ui = [
         openapi.Parameter('id', openapi.IN_QUERY, description="User ID", type=openapi.TYPE_INTEGER),
-        openapi.Parameter('email', openapi.IN_QUERY, description="Email", type=openapi.TYPE_STRING),
-        openapi.Parameter('name', openapi.IN_QUERY, description="name", type=openapi.TYPE_STRING),
+        openapi.Parameter('email', openapi.IN_QUERY, description="Email prefix, case-insensitive", type=openapi.TYPE_STRING),
+        openapi.Parameter('name', openapi.IN_QUERY, description="Name prefix, case-insensitive", type=openapi.TYPE_STRING),
+        openapi.Parameter('city', openapi.IN_QUERY, description="City prefix, case-insensitive", type=openapi.TYPE_STRING),
+        openapi.Parameter('country', openapi.IN_QUERY, description="Country prefix, case-insensitive", type=openapi.TYPE_STRING),
+        openapi.Parameter('search', openapi.IN_QUERY, description="Prefix of the email, name, city or country", type=openapi.TYPE_STRING),
+        openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('items_per_page', openapi.IN_QUERY, description="Users per page", type=openapi.TYPE_INTEGER),
     ]
 
     def get_permissions(self):
         """
         Custom method to return the appropriate permissions based on the user's group.
         """
+        group_names = user_group_names(self.request.user)  # One query, reused by the permission classes
+
         # Check if the user belongs to the 'admin' group
-        if self.request.user.groups.filter(name='admin').exists():
+        if 'admin' in group_names:
             return [IsAdmin()]  # Full access for admin group
 
         # Check if the user belongs to the 'write' group
-        elif self.request.user.groups.filter(name='write').exists():
+        elif 'write' in group_names:
             return [IsWrite()]  # Allow write and read operations for write group
 
         # Check if the user belongs to the 'read' group
-        elif self.request.user.groups.filter(name='read').exists():
+        elif 'read' in group_names:
             return [IsRead()]  # Read-only access for read group
 
         return super().get_permissions()  # Default permission if no group matches
 
     @swagger_auto_schema(tags=['User Search'], manual_parameters=swagger_ui)
+    @max_queries(4)
     def list(self, request):
-        queryset = User.objects.all().order_by()
+        queryset = User.objects.all().order_by('id')
         if self.filter_class:
             queryset = self.filter_class(request.GET, queryset=queryset).qs
 
-        serializer = UserSerial(queryset, many=True)
-        return Response(serializer.data)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = UserSerial(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(tags=['User Search'], request_body=CreateUserSerial)
     def create(self, request):
@@ -250,6 +250,38 @@ class UserOperations(viewsets.ViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @swagger_auto_schema(tags=['User Search'], request_body=ProvisionUsersSerializer)
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def provision(self, request):
+        """
+        Create many users from a CSV or JSON upload (see tes_app/user_provisioning.py).
+        Uploads over USER_PROVISIONING_MAX_ROWS rows, or setting more than
+        USER_PROVISIONING_MAX_PASSWORDS passwords, go through
+        `manage.py provision_users` instead.
+        """
+        if not request.user.is_superuser:
+            return Response({'message': 'Only super user perform this action!'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        serializer = ProvisionUsersSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        upload = serializer.validated_data['file']
+        fmt = serializer.validated_data.get('format') or guess_format(upload.name)
+        if fmt is None:
+            return Response({'format': ['Cannot tell the format from the file name.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rows = read_rows(upload.file, fmt)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > settings.USER_PROVISIONING_MAX_ROWS:
+            return Response({'error': f'At most {settings.USER_PROVISIONING_MAX_ROWS} users per upload, use manage.py provision_users for more'}, status=status.HTTP_400_BAD_REQUEST)
+        if sum(1 for _, raw in rows if isinstance(raw, dict) and raw.get('password')) > settings.USER_PROVISIONING_MAX_PASSWORDS:
+            return Response({'error': f'At most {settings.USER_PROVISIONING_MAX_PASSWORDS} users with a password per upload, use manage.py provision_users for more'}, status=status.HTTP_400_BAD_REQUEST)
+        # Hash in this process: a process pool per request would multiply
+        # across web workers. The management command uses every core.
+        report = provision_users(rows, workers=1)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+
     @swagger_auto_schema(tags=['User Search'])
     def destroy(self, request, pk=None):
         if not request.user.is_superuser:
@@ -285,4 +317,33 @@ class AssignRoleToUSer(viewsets.ViewSet):
             user.save()
             return Response({"message": "Role assigned to User Successfully."}, status=status.HTTP_201_CREATED)
         else:
-            return Response({"message": "Invalid Data!"}, serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"message": "Invalid Data!"}, serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RequestProfileViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Recent request profiles. `collapsed` returns the stacks of one profile as
+    text/plain, ready for flamegraph.pl or speedscope.
+    """
+    queryset = RequestProfile.objects.all()
+    serializer_class = RequestProfileSerializer
+    permission_classes = (permissions.IsAdminUser,)
+    authentication_classes = (JWTAuthentication,)
+    filterset_fields = ['route', 'method']
+
+    @swagger_auto_schema(tags=['Profiling'])
+    @max_queries(3)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @swagger_auto_schema(tags=['Profiling'])
+    @max_queries(2)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @swagger_auto_schema(tags=['Profiling'])
+    @action(detail=True, methods=['get'])
+    @max_queries(2)
+    def collapsed(self, request, pk=None):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        return HttpResponse(profile.collapsed_stacks, content_type='text/plain; charset=utf-8')
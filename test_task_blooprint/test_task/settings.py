@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import django
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,7 +43,6 @@ INSTALLED_APPS = [
     'tes_app',
     'django_filters',
     'rest_framework_simplejwt.token_blacklist',
-    'django_ratelimit',
 ]
 
 REST_FRAMEWORK = {
@@ -77,20 +77,49 @@ SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,  # Disable session authentication (optional)
 }
 
+# /swagger and the drf_yasg app. Production workers can turn them off
+# (API_DOCS_ENABLED=0) and skip loading drf_yasg altogether.
+API_DOCS_ENABLED = os.environ.get('API_DOCS_ENABLED', '1') == '1'
+if not API_DOCS_ENABLED:
+    INSTALLED_APPS.remove('drf_yasg')
+
+# The OpenAPI document is generated once per code version (see
+# `manage.py generate_openapi_schema`) and served as static bytes.
+OPENAPI_SCHEMA_SOURCES = ['tes_app', 'lib', 'test_task']
+OPENAPI_SCHEMA_CACHE_DIR = os.path.join(BASE_DIR, '.schema_cache')
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': 'redis://:@127.0.0.1:6379/1',  # This points to the Redis server running on localhost
         'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'CLIENT_CLASS': 'lib.redis_client.InstrumentedClient',  # DefaultClient + request metrics + circuit breaker
+            # Fail fast when Redis is slow or down; after CIRCUIT_FAILURE_THRESHOLD
+            # consecutive errors the cache is skipped and requests are served from
+            # the database, with a PING every CIRCUIT_RESET_TIMEOUT seconds.
+            'SOCKET_CONNECT_TIMEOUT': float(os.environ.get('REDIS_CONNECT_TIMEOUT', '0.1')),
+            'SOCKET_TIMEOUT': float(os.environ.get('REDIS_SOCKET_TIMEOUT', '0.2')),
+            'CIRCUIT_FAILURE_THRESHOLD': 3,
+            'CIRCUIT_RESET_TIMEOUT': 5,
+            # Values of COMPRESS_MIN_LENGTH bytes or more (the list pages) are stored
+            # compressed with CACHE_COMPRESSOR ('zlib' or 'lz4', which needs the lz4 package).
+            'COMPRESSOR': 'lib.cache_compressors.ThresholdCompressor',
+            'COMPRESS_ALGORITHM': os.environ.get('CACHE_COMPRESSOR', 'zlib'),
+            'COMPRESS_MIN_LENGTH': 1024,
         }
     },
 }
 
-# Set RATELIMIT to use the default cache
-RATELIMIT_USE_CACHE = 'default'
 FRIENDS_LIST_CACHE_TIMEOUT = 60 * 10  # 10 minutes
 
+# Logging goes through a QueueHandler so request threads only enqueue records;
+# a background QueueListener thread does the file/console writes.
+# LOG_FORMAT=json switches the file output to JSON lines.
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'verbose')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# Fraction of DEBUG records (per-request cache hit/miss lines) that get written.
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -103,39 +132,147 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'lib.logging_handlers.JsonLinesFormatter',
+        },
+    },
+    'filters': {
+        'sample_debug': {
+            '()': 'lib.logging_handlers.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+            'max_level': 'DEBUG',
+        },
     },
     'handlers': {
         'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'level': LOG_LEVEL,
+            'class': 'logging.handlers.RotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'error.log'),  # Ensure BASE_DIR is defined
-            'formatter': 'verbose',
+            'maxBytes': 10 * 1024 * 1024,  # Rotate at 10 MB
+            'backupCount': 5,
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'verbose',
         },
         'console': {
-            'level': 'INFO',  # Adjust level as necessary
+            'level': LOG_LEVEL,  # Adjust level as necessary
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
+        'queue': {
+            '()': 'lib.logging_handlers.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
+            'filters': ['sample_debug'],
+        },
     },
     'loggers': {
         'django': {
-            'handlers': ['file', 'console'],  # Use both file and console handlers
+            'handlers': ['queue'],  # Both file and console, written off the request thread
             'level': 'INFO',
             'propagate': True,
         },
         'tes_app': {  # Replace with your app's name
-            'handlers': ['file', 'console'],
-            'level': 'INFO',
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },
 }
+# Per-view query budgets declared with lib.query_budget.max_queries:
+# 'warn' logs requests over budget with their duplicated SQL, 'raise' fails them.
+# Tests run with 'raise' (TEST_RUNNER).
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn' if DEBUG else 'off')
+TEST_RUNNER = 'lib.query_budget.QueryBudgetTestRunner'
+
+# Per-route latency/DB/cache/serializer histograms, exposed at /metrics in the
+# Prometheus text format and as Server-Timing response headers.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Who may scrape /metrics: these client IPs, or `Authorization: Bearer
+# <METRICS_TOKEN>`. Nobody by default.
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# On-demand profiling (tes_app/profiling.py): admins send `X-Profile: 1`, and
+# PROFILE_SAMPLE_RATE of all requests are profiled at random.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_KEEP = 500  # Most recent profiles kept
+
+# Inventory list caching (tes_app/inventory_cache.py): the first CACHED_LIST_PAGES
+# pages of each list are cached. WARM_CACHE_ON_STARTUP warms them plus the
+# hottest detail entries when a WSGI/ASGI worker starts.
+CACHED_LIST_PAGES = 5
+WARM_CACHE_ON_STARTUP = os.environ.get('WARM_CACHE_ON_STARTUP', '0') == '1'
+CACHE_WARM_BASE_URL = os.environ.get('CACHE_WARM_BASE_URL', 'http://localhost:8000')
+INVENTORY_BATCH_MAX_IDS = 100  # Per ?ids= request on the product and stock lists
+
+# gzip/brotli response compression (lib/compression.py); compressed bodies are
+# kept in an in-process LRU so repeated responses are compressed once.
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+RESPONSE_COMPRESSION_CACHE_SIZE = 256
+
+# Inventory change feed (tes_app/change_feed.py): each call re-reads
+# CHANGE_FEED_OVERLAP seconds before its token to catch late commits, and
+# tombstones of deleted rows are kept for CHANGE_FEED_RETENTION_DAYS. A call
+# returns at most CHANGE_FEED_LIMIT rows, the rest on the following pages.
+# Rows are stamped by the database clock, so app server clock skew does not
+# matter, but the overlap must outlast the longest write transaction (an
+# import chunk, several statements of up to DB_STATEMENT_TIMEOUT_MS each).
+CHANGE_FEED_OVERLAP = 30
+CHANGE_FEED_RETENTION_DAYS = 30
+CHANGE_FEED_LIMIT = 1000
+
+# Stock reservations (tes_app/reservations.py): holds last RESERVATION_TTL
+# seconds unless the client asks for another TTL, up to RESERVATION_MAX_TTL.
+RESERVATION_TTL = int(os.environ.get('RESERVATION_TTL', 900))
+RESERVATION_MAX_TTL = 3600
+
+# Server push (tes_app/push.py): PUSH_BROKER is 'redis' (pub/sub, shared by
+# every process) or 'memory' (this process only). Idle streams get a comment
+# every PUSH_HEARTBEAT seconds.
+PUSH_BROKER = os.environ.get('PUSH_BROKER', 'redis')
+PUSH_HEARTBEAT = 15
+PUSH_MAX_CHANNELS = 50
+
+# Bulk user provisioning (tes_app/user_provisioning.py): the API endpoint
+# hashes passwords within the request, in the request's own process. With
+# the default PBKDF2 hasher a password takes about 0.35 s, so an upload may
+# set at most USER_PROVISIONING_MAX_PASSWORDS (about 18 s, inside a 30 s
+# worker timeout); rows without a password cost no hashing. Larger files go
+# through the provision_users management command, which hashes on a process
+# pool.
+USER_PROVISIONING_MAX_ROWS = 1000
+USER_PROVISIONING_MAX_PASSWORDS = 50
+
+# Reverse proxies (addresses or CIDR networks) whose X-Forwarded-For is
+# believed when working out the client IP (lib/client_ip.py), for rate limits
+# and METRICS_ALLOWED_IPS. Empty: REMOTE_ADDR is the client.
+TRUSTED_PROXIES = [proxy for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy]
+
+# Token-bucket rate limits (lib/rate_limit.py), kept in Redis and checked
+# with one round trip per request. A rule applies to the URL names matching
+# `routes` (fnmatch patterns; every route when omitted) and to `methods`
+# (every method when omitted), with one bucket per 'user' (JWT user; skipped
+# for anonymous requests), 'ip' or 'user_or_ip'. `rate` is the sustained rate
+# and `burst` the bucket size, the rate's count by default.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMITS = {
+    'auth': {'routes': ['login', 'register', 'change_password'], 'methods': ['POST'], 'key': 'ip', 'rate': '10/m', 'burst': 20},
+    'bulk': {'routes': ['catalogue-import', 'user_action-provision'], 'methods': ['POST'], 'key': 'user', 'rate': '10/h', 'burst': 5},
+    'api': {'key': 'user_or_ip', 'rate': '1200/m', 'burst': 200},
+}
+
 MIDDLEWARE = [
+    'tes_app.profiling.ProfilingMiddleware',
+    'lib.metrics.MetricsMiddleware',
+    'lib.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'lib.static_assets.StaticFilesMiddleware',
+    'lib.rate_limit.RateLimitMiddleware',
+    'lib.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'lib.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -164,19 +301,61 @@ WSGI_APPLICATION = 'test_task.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-
-        # 'ENGINE': 'django.db.backends.postgresql',
-        # 'NAME': 'defaultdb',
-        # 'USER': 'avnadmin',
-        # 'PASSWORD': 'AVNS_3q7WTGGG4VOv0P27nz7',
-        # 'HOST': 'pg-2c441a13-juli81740-abc0.h.aivencloud.com',
-        # 'PORT': '12723',
+# The profile is picked from the environment: DB_ENGINE=postgres for
+# production, SQLite (the default) for local development.
+# Connections are persistent (CONN_MAX_AGE) so connection setup happens once
+# per worker thread instead of once per request.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '5000'))
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'defaultdb'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,  # Drop dead persistent connections before reuse
+            'OPTIONS': {
+                'connect_timeout': 5,
+                'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}',
+                'sslmode': os.environ.get('DB_SSLMODE', 'prefer'),
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds a writer waits on a locked database before raising
+                # "database is locked". WAL and synchronous=NORMAL are set per
+                # connection in tes_app/signals.py.
+                'timeout': 20,
+            },
+        }
+    }
+    if django.VERSION >= (5, 1):
+        # Take the write lock up front so read->write upgrades cannot deadlock.
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+# Read replicas: DB_REPLICA_HOSTS is a comma-separated list of hosts that share
+# the primary's credentials. Safe-method requests read from them (see
+# lib/db_router.py) unless the client wrote within REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = []
+if DB_ENGINE == 'postgres':
+    for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+        DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+        DATABASE_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['lib.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
 
 
 # Password validation
@@ -215,7 +394,15 @@ AUTH_USER_MODEL = "tes_app.User"
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = '/static/'
-STATICFILES_DIRS=[BASE_DIR,'static']
+STATICFILES_DIRS=[BASE_DIR / 'static']
+# `manage.py collectstatic` minifies, hashes and precompresses into
+# STATIC_ROOT (see lib/static_assets.py); WhiteNoise serves it with immutable
+# cache headers when no CDN is in front.
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'lib.static_assets.MinifiedStaticFilesStorage'},
+}
 
 MEDIA_ROOT =  os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
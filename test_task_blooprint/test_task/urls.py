@@ -1,21 +1,36 @@
 from django.contrib import admin
 from django.urls import path,include
 from django.conf.urls.static import static
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework import permissions
 from django.conf import settings
+from lib.api_docs import apply_annotations
+from lib.metrics import metrics_view
+from lib.schema_cache import cached_schema_view
 
-schema_view = get_schema_view(
-    openapi.Info(
+
+def build_schema_view():
+    """drf_yasg's schema view and API info; imported on first use."""
+    from drf_yasg.views import get_schema_view
+    from drf_yasg import openapi
+
+    apply_annotations()
+    api_info = openapi.Info(
         title="Test Task for Blueprint.",
-        default_version='v1',),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+        default_version='v1',)
+
+    schema_view = get_schema_view(
+        api_info,
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+    return schema_view, api_info
+
 
 urlpatterns = [
     path("", include("tes_app.urls")),
-    path('swagger', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if settings.API_DOCS_ENABLED:
+    urlpatterns.append(path('swagger', cached_schema_view(build_schema_view), name='schema-swagger-ui'))